@@ -0,0 +1,626 @@
+"""
+ASGI 服务模式
+与 server.py 相同的路由跑在事件循环上：MySQL 走 aiomysql 异步连接池，bcrypt 交给进程池并以 await 等待，
+等待数据库往返时不占用线程，单个进程即可同时处理数百个刷新 / 查询请求。
+高频 API 路由在这里原生实现，其余路由（/verify、/reset-password-page 等网页）转交给 Flask 应用在线程池中处理。
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+
+import jwt
+import pymysql
+import aiomysql
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import ids
+import server
+import metrics
+from server import (
+    app as flask_app, ANONYMOUS_PASSWORD_HASH, DEFAULT_LIMITS, INSERT_REFRESH_TOKEN, PROFILE_LOOKUP, ROTATION_LOOKUP,
+    build_tokens, decode_access_token, email_outbox, hash_refresh_token, invalidate_profile, key_ring, login_guard,
+    metrics_exporter, password_hasher, profile_cache, refresh_grace_cache, replicas, request_profiler, revocations,
+    schedule_rehash, token_sweeper, verified_tokens, write_buffer,
+)
+from db_pool import PoolTimeout
+from hashing import HashQueueFull
+from ids import new_id, to_db, from_db
+from outbox import ENQUEUE_EMAIL, email_row
+from replicas import ReplicaUnavailable
+from revocation import REVOKE
+
+config = flask_app.config
+
+db_pool = None
+
+# ==================== 数据库 ====================
+
+class TimedDictCursor(aiomysql.DictCursor):
+    """与同步连接池的 metrics.timed_cursor 相同，记录每条语句的耗时"""
+
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            metrics.DB_QUERY.observe(
+                time.perf_counter() - started, target='primary', statement=metrics.statement_type(query)
+            )
+
+@asynccontextmanager
+async def connection():
+    try:
+        conn = await asyncio.wait_for(db_pool.acquire(), config['MYSQL_POOL_TIMEOUT'])
+    except asyncio.TimeoutError:
+        raise PoolTimeout()
+    try:
+        yield conn
+    finally:
+        # aiomysql 会直接关闭仍处于事务中的连接，归还前先回滚
+        if not conn.closed and conn.get_transaction_status():
+            await conn.rollback()
+        db_pool.release(conn)
+
+def _replica_read(sql, params, fresh_keys, retry_on_miss):
+    # 在线程池中执行（副本是同步连接池）：返回 (True, row) 表示以副本结果为准，(False, None) 表示改走主库
+    if replicas.recently_written(*fresh_keys):
+        return False, None
+    try:
+        row = replicas.fetch_one(sql, params)
+    except ReplicaUnavailable:
+        return False, None
+    if row is None and retry_on_miss:
+        return False, None
+    return True, row
+
+async def read_one(sql, params, fresh_keys=(), retry_on_miss=False):
+    # 与 server.read_one 相同的路由规则，主库走异步连接池
+    if replicas:
+        answered, row = await run_in_threadpool(_replica_read, sql, params, fresh_keys, retry_on_miss)
+        if answered:
+            return row
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, params)
+            row = await cursor.fetchone()
+        await conn.rollback()
+    return row
+
+# ==================== 限流 ====================
+
+# 与 Flask-Limiter 相同的限额：显式声明的路由限额，否则每个路由各自适用默认限额
+rate_limiter = STRATEGIES[config['RATELIMIT_STRATEGY']](storage_from_string(config['RATELIMIT_STORAGE_URI']))
+DEFAULT_LIMIT_ITEMS = [parse(limit) for limit in DEFAULT_LIMITS]
+
+def _over_limit(items, key, name):
+    # 返回第一个超出的限额及其重置时间，都未超出时返回 None；Redis / 共享内存存储的读写在线程池中执行
+    for item in items:
+        if not rate_limiter.hit(item, key, name):
+            return item, rate_limiter.get_window_stats(item, key, name).reset_time
+    return None
+
+def rate_limit(*limits):
+    items = [parse(limit) for limit in limits] or DEFAULT_LIMIT_ITEMS
+
+    def decorator(handler):
+        async def wrapped(request):
+            if config['RATELIMIT_ENABLED']:
+                key = request.client.host if request.client else '127.0.0.1'
+                exceeded = await run_in_threadpool(_over_limit, items, key, handler.__name__)
+                if exceeded:
+                    item, reset_at = exceeded
+                    metrics.REJECTIONS.inc(reason='ratelimit')
+                    return JSONResponse(
+                        {'error': f'Too many requests: {item}'}, 429,
+                        headers={'Retry-After': str(max(1, int(reset_at - time.time())))}
+                    )
+            return await handler(request)
+        wrapped.__name__ = handler.__name__
+        return wrapped
+    return decorator
+
+# ==================== 辅助函数 ====================
+
+def error(message, status):
+    return JSONResponse({'error': message}, status)
+
+async def json_body(request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+async def id_format():
+    # to_db 需要检测 users.id 的存储格式时（启动时没能检测，或迁移前定期重查）把检测放到线程池，不阻塞事件循环
+    if ids.stale():
+        await run_in_threadpool(ids.ensure)
+
+async def signing_key():
+    # 签名密钥到了重新加载的时间时，把读磁盘放到线程池
+    if config['JWT_ALGORITHM'] == 'EdDSA' and key_ring.stale():
+        await run_in_threadpool(key_ring.refresh)
+
+async def insert_refresh_token(user_id: str, email: str) -> dict:
+    await id_format()
+    await signing_key()
+    tokens, row = build_tokens(user_id, email)
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(INSERT_REFRESH_TOKEN, row)
+        await conn.commit()
+    return tokens
+
+def after_write(user_id: str, *keys):
+    # 写入提交后（在线程池中执行）：与 Flask 路由相同，该用户随后的读回到主库，并清除资料缓存
+    replicas.mark_written(user_id, *keys)
+    invalidate_profile(user_id)
+
+async def authenticate(request):
+    # 返回 (payload, None) 或 (None, 错误响应)
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, error('Missing or invalid authorization header', 401)
+    token = auth_header[7:]
+    try:
+        # 与 verify_access_token 相同，但缓存未命中时的验签（以及遇到新 kid 时重新加载密钥）放到线程池
+        payload = verified_tokens.get(token)
+        if payload is None:
+            payload = await run_in_threadpool(decode_access_token, token)
+            verified_tokens.put(token, payload)
+    except jwt.ExpiredSignatureError:
+        return None, error('Token expired', 401)
+    except jwt.InvalidTokenError:
+        return None, error('Invalid token', 401)
+    jti = payload.get('jti')
+    # 布隆过滤器未命中时不做任何 I/O；命中后的查库放到线程池
+    if not revocations.filter_miss(jti, payload['user_id']) and await run_in_threadpool(
+        revocations.is_revoked, jti, payload['user_id'], payload.get('iat', 0)
+    ):
+        return None, error('Token revoked', 401)
+    return payload, None
+
+def require_auth(handler):
+    async def wrapped(request):
+        payload, failure = await authenticate(request)
+        if failure is not None:
+            return failure
+        request.state.token = payload
+        request.state.user_id = payload['user_id']
+        return await handler(request)
+    wrapped.__name__ = handler.__name__
+    return wrapped
+
+def user_body(user_id, record):
+    return {
+        'uid': user_id, 'email': record['email'], 'displayName': record['display_name'],
+        'emailVerified': bool(record['email_verified']), 'isAnonymous': bool(record['is_anonymous'])
+    }
+
+# ==================== API 路由 ====================
+
+async def health_check(request):
+    # 缓存过期时的数据库 ping 会阻塞，放到线程池
+    status = await run_in_threadpool(server.health_status)
+    return JSONResponse(status, 200 if status['ready'] else 503)
+
+async def health_check_details(request):
+    if not server.metrics_authorized(request.headers.get('Authorization'), required=True):
+        return JSONResponse({'error': 'Unauthorized'}, 401)
+    status = await run_in_threadpool(server.health_details)
+    status['async_db_pool'] = {
+        'size': db_pool.size, 'free': db_pool.freesize, 'max': db_pool.maxsize,
+    } if db_pool else None
+    return JSONResponse(status, 200 if status['status'] == 'ok' else 503)
+
+async def jwks(request):
+    await signing_key()
+    body = json.dumps(key_ring.jwks()).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {'Cache-Control': f"public, max-age={config['JWKS_MAX_AGE']}", 'ETag': etag}
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+@rate_limit('10 per hour')
+async def register(request):
+    data = await json_body(request)
+    email = data.get('email', '').strip().lower()
+    password = data.get('password', '')
+    display_name = data.get('displayName', '')
+
+    if not email or not password:
+        return error('Email and password are required', 400)
+    if len(password) < 6:
+        return error('Password must be at least 6 characters', 400)
+    if '@' not in email:
+        return error('Invalid email format', 400)
+
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
+            if await cursor.fetchone():
+                return error('Email already registered', 409)
+        await conn.rollback()
+
+    # 哈希期间不占用数据库连接
+    user_id = new_id()
+    password_hash = await password_hasher.hash_async(password)
+    verification_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    link = f"{config['FRONTEND_URL']}/verify?token={verification_token}"
+    await id_format()
+    await signing_key()
+    tokens, token_row = build_tokens(user_id, email)
+
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(
+                    '''INSERT INTO users (id, email, password_hash, display_name, verification_token, created_at, updated_at)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)''',
+                    (to_db(user_id), email, password_hash, display_name, verification_token, now, now)
+                )
+            except pymysql.err.IntegrityError:  # 哈希期间同一邮箱已被并发注册
+                return error('Email already registered', 409)
+            # 验证邮件与用户记录、refresh token 一起提交
+            await cursor.execute(
+                ENQUEUE_EMAIL,
+                email_row(email, "Verify your email for DoNow", server.verify_email_template.render(link=link))
+            )
+            await cursor.execute(INSERT_REFRESH_TOKEN, token_row)
+        await conn.commit()
+    await run_in_threadpool(replicas.mark_written, email, user_id)
+    email_outbox.notify()
+
+    return JSONResponse({
+        'user': {
+            'uid': user_id, 'email': email, 'displayName': display_name,
+            'emailVerified': False, 'isAnonymous': False
+        },
+        'tokens': tokens
+    }, 201)
+
+@rate_limit('20 per hour')
+async def login(request):
+    data = await json_body(request)
+    email = data.get('email', '').strip().lower()
+    password = data.get('password', '')
+
+    if not email or not password:
+        return error('Email and password are required', 400)
+
+    retry_after = await run_in_threadpool(login_guard.retry_after, email)
+    if retry_after:
+        metrics.REJECTIONS.inc(reason='login_lockout')
+        return JSONResponse(
+            {'error': 'Too many failed login attempts, please try again later'}, 429,
+            headers={'Retry-After': str(retry_after)}
+        )
+
+    # 与同步版相同：副本上查不到即视为不存在，刚写入的邮箱已由 mark_written 标记走主库
+    user = await read_one('SELECT * FROM users WHERE email = %s', (email,), fresh_keys=(email,))
+
+    if not user or user['password_hash'] == ANONYMOUS_PASSWORD_HASH \
+            or not await password_hasher.check_async(password, user['password_hash']):
+        await run_in_threadpool(login_guard.record_failure, email)
+        return error('Invalid email or password', 401)
+    await run_in_threadpool(login_guard.record_success, email)
+    schedule_rehash(user['id'], user['password_hash'], password)
+
+    user_id = from_db(user['id'])
+    tokens = await insert_refresh_token(user_id, user['email'])
+    return JSONResponse({'user': user_body(user_id, user), 'tokens': tokens})
+
+@rate_limit('20 per hour')
+async def anonymous_login(request):
+    user_id = new_id()
+    email = f"anonymous_{user_id[-12:]}@donow.local"
+    now = datetime.utcnow()
+
+    # 与并发的匿名登录合并成一批提交，等待落库放到线程池，不阻塞事件循环
+    await id_format()
+    await signing_key()
+    tokens, token_row = build_tokens(user_id, email)
+    await run_in_threadpool(write_buffer.write, [
+        ('users', (to_db(user_id), email, ANONYMOUS_PASSWORD_HASH, 1, 1, now, now)),
+        ('refresh_tokens', token_row),
+    ])
+    return JSONResponse({
+        'user': {
+            'uid': user_id, 'email': email, 'displayName': None,
+            'emailVerified': True, 'isAnonymous': True
+        },
+        'tokens': tokens
+    })
+
+async def _grace_lookup(token_hash: bytes, wait: bool = False):
+    if not config['REFRESH_GRACE_SECONDS']:
+        return None
+    for _ in range(5 if wait else 1):
+        cached = await run_in_threadpool(refresh_grace_cache.get, token_hash.hex())
+        if cached is not None:
+            return json.loads(cached)
+        if wait:
+            await asyncio.sleep(0.02)
+    return None
+
+@rate_limit()
+async def refresh_token(request):
+    data = await json_body(request)
+    refresh_token = data.get('refreshToken')
+    if not refresh_token:
+        return error('Refresh token is required', 400)
+
+    token_hash = hash_refresh_token(refresh_token)
+    await id_format()
+    await signing_key()
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(ROTATION_LOOKUP, (token_hash,))
+            record = await cursor.fetchone()
+            if not record:
+                coalesced = await _grace_lookup(token_hash)
+                if coalesced:
+                    return JSONResponse(coalesced)
+
+            if not record:
+                return error('Invalid refresh token', 401)
+
+            await cursor.execute('DELETE FROM refresh_tokens WHERE id = %s', (record['token_id'],))
+            if cursor.rowcount == 0:
+                await conn.rollback()
+                coalesced = await _grace_lookup(token_hash, wait=True)
+                if coalesced:
+                    return JSONResponse(coalesced)
+                return error('Invalid refresh token', 401)
+
+            if datetime.utcnow() > record['expires_at']:
+                await conn.commit()
+                return error('Refresh token expired', 401)
+
+            if not record['id']:
+                await conn.commit()
+                return error('User not found', 404)
+
+            user_id = from_db(record['id'])
+            tokens, row = build_tokens(user_id, record['email'])
+            await cursor.execute(INSERT_REFRESH_TOKEN, row)
+
+        # 与同步版相同：先写宽限缓存再提交，提交失败撤回
+        body = {'user': user_body(user_id, record), 'tokens': tokens}
+        await run_in_threadpool(server._grace_store, token_hash, body)
+        try:
+            await conn.commit()
+        except Exception:
+            if config['REFRESH_GRACE_SECONDS']:
+                await run_in_threadpool(refresh_grace_cache.delete, token_hash.hex())
+            raise
+    return JSONResponse(body)
+
+@rate_limit('5 per hour')
+async def forgot_password(request):
+    data = await json_body(request)
+    email = data.get('email', '').strip().lower()
+
+    if not email:
+        return error('Email is required', 400)
+
+    user = await read_one('SELECT id FROM users WHERE email = %s', (email,), fresh_keys=(email,))
+
+    if user:
+        reset_token = secrets.token_urlsafe(32)
+        reset_expiry = datetime.utcnow() + timedelta(hours=1)
+        async with connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    'UPDATE users SET reset_token = %s, reset_token_expiry = %s, updated_at = %s WHERE id = %s',
+                    (reset_token, reset_expiry, datetime.utcnow(), user['id'])
+                )
+                link = f"{config['FRONTEND_URL']}/reset-password-page?token={reset_token}"
+                await cursor.execute(
+                    ENQUEUE_EMAIL,
+                    email_row(email, "Reset your DoNow password", server.reset_password_template.render(link=link))
+                )
+            await conn.commit()
+        await run_in_threadpool(invalidate_profile, from_db(user['id']))
+        email_outbox.notify()
+    return JSONResponse({'message': 'If the email exists, a reset link will be sent'})
+
+@rate_limit()
+@require_auth
+async def get_current_user(request):
+    user_id = request.state.user_id
+    if config['PROFILE_CACHE_TTL']:
+        cached = await run_in_threadpool(profile_cache.get, user_id)
+        if cached is not None:
+            return JSONResponse({'user': json.loads(cached)})
+
+    await id_format()
+    key = to_db(user_id)
+    user = await read_one(PROFILE_LOOKUP, (key,), fresh_keys=(user_id,), retry_on_miss=True)
+    if not user and (await run_in_threadpool(ids.recheck) or to_db(user_id) != key):
+        # id 列刚切换为 BINARY(16)，按新格式重查
+        user = await read_one(PROFILE_LOOKUP, (to_db(user_id),), fresh_keys=(user_id,), retry_on_miss=True)
+    if not user:
+        return error('User not found', 404)
+    profile = user_body(user_id, user)
+    profile['createdAt'] = user['created_at'].isoformat() if user['created_at'] else None
+    if config['PROFILE_CACHE_TTL']:
+        await run_in_threadpool(profile_cache.set, user_id, json.dumps(profile), config['PROFILE_CACHE_TTL'])
+    return JSONResponse({'user': profile})
+
+@rate_limit()
+@require_auth
+async def logout(request):
+    data = await json_body(request)
+    refresh_token = data.get('refreshToken')
+    token = request.state.token
+    jti = token.get('jti')
+    await id_format()
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            if refresh_token:
+                await cursor.execute(
+                    'DELETE FROM refresh_tokens WHERE token_hash = %s AND user_id = %s',
+                    (hash_refresh_token(refresh_token), to_db(request.state.user_id))
+                )
+            if jti:
+                await cursor.execute(REVOKE, ('jti', jti, datetime.utcnow(), datetime.utcfromtimestamp(token['exp'])))
+        await conn.commit()
+    if jti:
+        revocations.add('jti', jti)
+    return JSONResponse({'message': 'Logged out successfully'})
+
+@rate_limit()
+@require_auth
+async def delete_account(request):
+    user_id = request.state.user_id
+    await id_format()
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            for _ in range(2):
+                key = to_db(user_id)
+                await cursor.execute('DELETE FROM refresh_tokens WHERE user_id = %s', (key,))
+                await cursor.execute('DELETE FROM users WHERE id = %s', (key,))
+                # 一行都没删到且 id 列刚切换为 BINARY(16) 时按新格式再删一次
+                if cursor.rowcount or not (await run_in_threadpool(ids.recheck) or to_db(user_id) != key):
+                    break
+            now = datetime.utcnow()
+            await cursor.execute(REVOKE, ('user', user_id, now, now + timedelta(hours=config['JWT_EXPIRATION_HOURS'])))
+        await conn.commit()
+    revocations.add('user', user_id)
+    await run_in_threadpool(after_write, user_id, request.state.token.get('email'))
+    return JSONResponse({'message': 'Account deleted successfully'})
+
+# ==================== 应用 ====================
+
+async def handle_hash_queue_full(request, exc):
+    return JSONResponse(
+        {'error': 'Server busy, please retry'}, 503,
+        headers={'Retry-After': str(config['HASH_RETRY_AFTER'])}
+    )
+
+async def handle_pool_timeout(request, exc):
+    metrics.REJECTIONS.inc(reason='db_pool_timeout')
+    return error('Database busy, please retry', 503)
+
+async def handle_data_error(request, exc):
+    # 与 Flask 的 handle_data_error 相同：字符串 id 写进了刚切换成 BINARY(16) 的列
+    if exc.args[0] == 1406 and (await run_in_threadpool(ids.recheck) or ids.switched()):
+        return JSONResponse({'error': 'Server busy, please retry'}, 503, headers={'Retry-After': '1'})
+    raise exc
+
+ROUTE_TEMPLATES = {}  # 原生路由处理函数 -> 路由模板，应用创建后填充
+
+class RequestMetrics:
+    """记录原生路由的延迟与状态码；转交给 Flask 的请求由 Flask 自己的钩子记录"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        profiler = request_profiler.begin()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 路由匹配时把 endpoint 写进了同一个 scope
+            route = ROUTE_TEMPLATES.get(scope.get('endpoint'))
+            if route is None:
+                request_profiler.discard(profiler)
+            else:
+                elapsed = time.perf_counter() - started
+                metrics.HTTP_LATENCY.observe(elapsed, method=scope['method'], route=route)
+                metrics.HTTP_REQUESTS.inc(method=scope['method'], route=route, status=status)
+                request_profiler.end(profiler, scope['method'], route, elapsed)
+
+def collect_async_pool_metrics():
+    if db_pool is not None:
+        metrics.DB_CONNECTIONS.set(db_pool.size - db_pool.freesize, pool='async', state='in_use')
+        metrics.DB_CONNECTIONS.set(db_pool.freesize, pool='async', state='idle')
+
+metrics_exporter.add_collector(collect_async_pool_metrics)
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool
+    db_pool = await aiomysql.create_pool(
+        host=config['MYSQL_HOST'],
+        port=config['MYSQL_PORT'],
+        user=config['MYSQL_USER'],
+        password=config['MYSQL_PASSWORD'],
+        db=config['MYSQL_DATABASE'],
+        charset='utf8mb4',
+        cursorclass=TimedDictCursor,
+        autocommit=False,
+        minsize=1,
+        maxsize=config['ASYNC_MYSQL_POOL_SIZE'],
+        pool_recycle=config['MYSQL_POOL_MAX_AGE'],
+    )
+    email_outbox.start()
+    revocations.start()
+    metrics_exporter.start()
+    if config['SWEEPER_ENABLED']:
+        token_sweeper.start()
+    try:
+        yield
+    finally:
+        db_pool.close()
+        await db_pool.wait_closed()
+        await run_in_threadpool(write_buffer.flush)
+
+app = Starlette(
+    routes=[
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/health/details', health_check_details, methods=['GET']),
+        Route('/.well-known/jwks.json', jwks, methods=['GET']),
+        Route('/api/auth/register', register, methods=['POST']),
+        Route('/api/auth/login', login, methods=['POST']),
+        Route('/api/auth/anonymous', anonymous_login, methods=['POST']),
+        Route('/api/auth/refresh', refresh_token, methods=['POST']),
+        Route('/api/auth/forgot-password', forgot_password, methods=['POST']),
+        Route('/api/auth/me', get_current_user, methods=['GET']),
+        Route('/api/auth/logout', logout, methods=['POST']),
+        Route('/api/auth/delete-account', delete_account, methods=['DELETE']),
+        # 网页路由和其余低频路由仍由 Flask 处理
+        Mount('/', WSGIMiddleware(flask_app)),
+    ],
+    middleware=[
+        Middleware(RequestMetrics),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    exception_handlers={
+        HashQueueFull: handle_hash_queue_full,
+        PoolTimeout: handle_pool_timeout,
+        pymysql.err.DataError: handle_data_error,
+    },
+    lifespan=lifespan,
+)
+
+ROUTE_TEMPLATES.update({route.endpoint: route.path for route in app.routes if isinstance(route, Route)})
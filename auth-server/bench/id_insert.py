@@ -0,0 +1,98 @@
+"""
+主键格式批量插入基准
+在两张与 users 结构相同的临时表中分别以随机 UUIDv4 字符串（VARCHAR(36)）和按时间排序的 UUIDv7（BINARY(16)）为主键
+批量插入，对比吞吐、表与索引大小以及 InnoDB 页分裂次数。需要可连接的 MySQL（读取 .env 中的 MYSQL_* 配置）：
+    python bench/id_insert.py -n 200000
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import db_pool  # noqa: E402
+from ids import new_id  # noqa: E402
+
+TABLE_DDL = '''
+    CREATE TABLE {name} (
+        id {id_type} PRIMARY KEY,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        INDEX idx_created_at (created_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+VARIANTS = [
+    ('uuid4', 'VARCHAR(36)', lambda: str(uuid.uuid4())),
+    ('uuid7', 'BINARY(16)', lambda: uuid.UUID(new_id()).bytes),
+]
+
+
+def page_splits(cursor):
+    # 需要 innodb_monitor_enable 权限；没有时返回 None
+    try:
+        cursor.execute("SET GLOBAL innodb_monitor_enable = 'index_page_splits'")
+        cursor.execute("SELECT count FROM information_schema.innodb_metrics WHERE name = 'index_page_splits'")
+        return cursor.fetchone()['count']
+    except Exception:
+        return None
+
+
+def run(conn, name, id_type, make_id, n, batch_size):
+    table = f'bench_ids_{name}'
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(TABLE_DDL.format(name=table, id_type=id_type))
+        splits_before = page_splits(cursor)
+    conn.commit()
+
+    sql = f'INSERT INTO {table} (id, email, password_hash, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)'
+    started = time.perf_counter()
+    tail_started = None
+    for offset in range(0, n, batch_size):
+        if tail_started is None and offset >= n * 3 // 4:
+            tail_started = time.perf_counter()
+        now = datetime.utcnow()
+        rows = [(make_id(), f'bench_{offset + i}@donow.local', '!', now, now) for i in range(min(batch_size, n - offset))]
+        with conn.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    tail_elapsed = time.perf_counter() - (tail_started or started)
+
+    with conn.cursor() as cursor:
+        splits_after = page_splits(cursor)
+        cursor.execute(f'ANALYZE TABLE {table}')
+        cursor.fetchall()
+        cursor.execute(
+            'SELECT data_length, index_length FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            (table,)
+        )
+        sizes = cursor.fetchone()
+        cursor.execute(f'DROP TABLE {table}')
+    conn.commit()
+
+    splits = splits_after - splits_before if splits_before is not None and splits_after is not None else 'n/a'
+    print(f"{name:<6} {id_type:<12} {n / elapsed:9.0f} rows/s  last quarter {n - n * 3 // 4} rows {(n - n * 3 // 4) / tail_elapsed:9.0f} rows/s  "
+          f"data={sizes['data_length'] / 2**20:7.1f}MiB index={sizes['index_length'] / 2**20:7.1f}MiB page_splits={splits}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk inserts with random vs time-ordered primary keys')
+    parser.add_argument('-n', type=int, default=200000, help='rows per variant')
+    parser.add_argument('--batch-size', type=int, default=500, help='rows per multi-row INSERT (same as WRITE_BEHIND_BATCH_SIZE)')
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        for name, id_type, make_id in VARIANTS:
+            run(conn, name, id_type, make_id, args.n, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+限流存储开销基准
+测量每次请求在限流检查上的耗时（Flask-Limiter 对每个请求会检查路由限额和默认的两条限额）：
+    python bench/limiter_overhead.py -n 20000
+    python bench/limiter_overhead.py --redis redis://localhost:6379/0   # 额外测量 Redis 协议存储
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shm_limiter  # noqa: E402,F401
+
+
+def measure(uri, strategy, n, keys=100):
+    limiter = STRATEGIES[strategy](storage_from_string(uri))
+    # 与 login 路由相同的限额组合：路由限额 + 默认的每日/每小时限额
+    items = [parse('20 per hour'), parse('200 per day'), parse('50 per hour')]
+    started = time.perf_counter()
+    for i in range(n):
+        key = f'10.0.{i % keys}.1'
+        for item in items:
+            limiter.hit(item, key)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rate limiter storage overhead')
+    parser.add_argument('-n', type=int, default=20000, help='simulated requests per mode')
+    parser.add_argument('--strategy', default='sliding-window-counter')
+    parser.add_argument('--redis', help='Redis-protocol storage URI, e.g. redis://localhost:6379/0')
+    args = parser.parse_args()
+
+    shm_path = os.path.join(tempfile.mkdtemp(), 'bench_ratelimit.bin')
+    modes = [('memory', 'memory://'), ('shm', f'shm://{shm_path}')]
+    if args.redis:
+        modes.append(('redis', args.redis))
+
+    for name, uri in modes:
+        print(f"{name:<8} {measure(uri, args.strategy, args.n):8.2f} us/request")
+    os.remove(shm_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+端到端压测套件
+启动本地 SMTP 收件端（aiosmtpd）和被测服务（默认 gunicorn，连接 .env 中的 MySQL，但使用独立的 donow_bench 库），
+依次运行匿名注册突发、登录风暴、刷新风暴、/me 轮询以及混合负载，按接口输出吞吐与 p50/p95/p99 延迟，
+并把结果写入 bench/results/ 下的 JSON 文件，便于比较不同改动：
+    python bench/loadtest.py                                     # 全部场景
+    python bench/loadtest.py --scenario refresh -c 100 -d 30 --label pool-change
+    python bench/loadtest.py --server-cmd "uvicorn asgi:app --port {port}" --label asgi
+    python bench/loadtest.py --url http://127.0.0.1:5000         # 压测已启动的服务（需 RATELIMIT_ENABLED=false）
+    python bench/loadtest.py --compare bench/results/a.json bench/results/b.json
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from collections import defaultdict
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+sys.path.insert(0, BENCH_DIR)
+
+from serving_modes import Client, percentile  # noqa: E402
+
+SCENARIOS = ['signup', 'login', 'refresh', 'me', 'mixed']
+# 混合负载中各操作的权重
+MIXED_WEIGHTS = {'me': 70, 'refresh': 15, 'signup': 10, 'login': 5}
+PASSWORD = 'bench-password'
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, status, seconds):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+
+    def summary(self, elapsed):
+        result = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            ms = [s * 1000 for s in samples]
+            statuses = dict(self.statuses[endpoint])
+            result[endpoint] = {
+                'requests': len(ms),
+                'errors': sum(count for status, count in statuses.items() if not status.startswith('2')),
+                'rps': round(len(ms) / elapsed, 1),
+                'mean_ms': round(statistics.mean(ms), 2),
+                'p50_ms': round(percentile(ms, 50), 2),
+                'p95_ms': round(percentile(ms, 95), 2),
+                'p99_ms': round(percentile(ms, 99), 2),
+                'max_ms': round(max(ms), 2),
+                'statuses': statuses,
+            }
+        return result
+
+
+# ==================== 操作 ====================
+
+async def call(client, recorder, endpoint, method, path, body=None, token=None):
+    started = time.perf_counter()
+    try:
+        status, data = await client.request(method, path, body, token)
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        client.close()
+        status, data = 0, None
+    recorder.add(endpoint, status, time.perf_counter() - started)
+    return status, data
+
+
+async def op_signup(client, recorder, session, accounts):
+    await call(client, recorder, 'POST /api/auth/anonymous', 'POST', '/api/auth/anonymous', {})
+
+
+async def op_login(client, recorder, session, accounts):
+    await call(client, recorder, 'POST /api/auth/login', 'POST', '/api/auth/login',
+               {'email': random.choice(accounts), 'password': PASSWORD})
+
+
+async def op_refresh(client, recorder, session, accounts):
+    status, data = await call(client, recorder, 'POST /api/auth/refresh', 'POST', '/api/auth/refresh',
+                              {'refreshToken': session['refresh_token']})
+    if status == 200:
+        session.update(data['tokens'])
+
+
+async def op_me(client, recorder, session, accounts):
+    await call(client, recorder, 'GET /api/auth/me', 'GET', '/api/auth/me', token=session['access_token'])
+
+
+OPERATIONS = {'signup': op_signup, 'login': op_login, 'refresh': op_refresh, 'me': op_me}
+
+
+# ==================== 准备数据 ====================
+
+async def gather_in_batches(factories, batch=50):
+    results = []
+    for offset in range(0, len(factories), batch):
+        results += await asyncio.gather(*(factory() for factory in factories[offset:offset + batch]))
+    return results
+
+
+async def create_sessions(base_url, count):
+    async def one():
+        client = Client(base_url)
+        try:
+            status, body = await client.request('POST', '/api/auth/anonymous', {})
+        finally:
+            client.close()
+        if status != 200:
+            raise SystemExit(f"❌ anonymous login failed with {status}: {body} (is RATELIMIT_ENABLED=false?)")
+        return dict(body['tokens'])
+    return await gather_in_batches([one] * count)
+
+
+async def create_accounts(base_url, count, run_id):
+    async def one(i):
+        email = f'bench_{run_id}_{i}@donow.local'
+        client = Client(base_url)
+        try:
+            status, body = await client.request(
+                'POST', '/api/auth/register', {'email': email, 'password': PASSWORD, 'displayName': 'bench'}
+            )
+        finally:
+            client.close()
+        if status not in (201, 409):
+            raise SystemExit(f"❌ register failed with {status}: {body}")
+        return email
+    return await gather_in_batches([lambda i=i: one(i) for i in range(count)], batch=10)
+
+
+# ==================== 场景 ====================
+
+async def run_scenario(base_url, scenario, concurrency, duration, accounts):
+    sessions = await create_sessions(base_url, concurrency) if scenario in ('refresh', 'me', 'mixed') else [{}] * concurrency
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    names = list(MIXED_WEIGHTS)
+    weights = list(MIXED_WEIGHTS.values())
+
+    async def worker(session):
+        client = Client(base_url)
+        try:
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0] if scenario == 'mixed' else scenario
+                await OPERATIONS[name](client, recorder, session, accounts)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(dict(session)) for session in sessions))
+    elapsed = time.perf_counter() - started
+    return {'scenario': scenario, 'concurrency': concurrency, 'seconds': round(elapsed, 2),
+            'endpoints': recorder.summary(elapsed)}
+
+
+def print_scenario(result):
+    print(f"\n▶ {result['scenario']} (c={result['concurrency']}, {result['seconds']}s)")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"  {endpoint:<28} {stats['rps']:8.1f} req/s  p50={stats['p50_ms']:7.2f}ms "
+              f"p95={stats['p95_ms']:7.2f}ms p99={stats['p99_ms']:7.2f}ms errors={stats['errors']}")
+
+
+# ==================== 启动被测环境 ====================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def reset_database(database):
+    import pymysql
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(SERVER_DIR, '.env'))
+    conn = pymysql.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'), port=int(os.getenv('MYSQL_PORT', 3306)),
+        user=os.getenv('MYSQL_USER', 'root'), password=os.getenv('MYSQL_PASSWORD', '')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS `{database}`')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def start_environment(args, workdir):
+    smtp_port = free_port()
+    env = dict(
+        os.environ,
+        MYSQL_DATABASE=args.database,
+        RATELIMIT_ENABLED='false',
+        RATELIMIT_STORAGE_URI=f'shm://{workdir}/ratelimit.bin',
+        REFRESH_GRACE_CACHE_PATH=os.path.join(workdir, 'refresh_grace.sqlite'),
+        PROFILE_CACHE_PATH=os.path.join(workdir, 'profile.sqlite'),
+        JWT_KEYS_DIR=os.path.join(workdir, 'keys'),
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=str(smtp_port), MAIL_USE_SSL='false', MAIL_USE_TLS='false',
+        MAIL_USERNAME='', MAIL_PASSWORD='',
+    )
+    smtp = subprocess.Popen(
+        [sys.executable, '-m', 'aiosmtpd', '-n', '-l', f'127.0.0.1:{smtp_port}'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    server = subprocess.Popen(
+        shlex.split(args.server_cmd.format(port=args.port)), cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return [server, smtp], log.name
+
+
+async def wait_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = Client(base_url)
+        try:
+            status, _ = await client.request('GET', '/api/health')
+            if status == 200:
+                return
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            client.close()
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"❌ {base_url} did not become ready within {timeout}s")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# ==================== 比较 ====================
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path) as f:
+        baseline = {s['scenario']: s for s in json.load(f)['scenarios']}
+    with open(candidate_path) as f:
+        candidate = json.load(f)['scenarios']
+
+    def delta(old, new):
+        return f'{(new - old) / old * 100:+6.1f}%' if old else '   n/a'
+
+    for result in candidate:
+        before = baseline.get(result['scenario'])
+        if not before:
+            continue
+        print(f"\n▶ {result['scenario']}")
+        for endpoint, stats in result['endpoints'].items():
+            old = before['endpoints'].get(endpoint)
+            if not old:
+                continue
+            print(f"  {endpoint:<28} rps {old['rps']:8.1f} → {stats['rps']:8.1f} ({delta(old['rps'], stats['rps'])})  "
+                  f"p95 {old['p95_ms']:7.2f} → {stats['p95_ms']:7.2f}ms ({delta(old['p95_ms'], stats['p95_ms'])})  "
+                  f"p99 {old['p99_ms']:7.2f} → {stats['p99_ms']:7.2f}ms ({delta(old['p99_ms'], stats['p99_ms'])})")
+
+
+# ==================== 入口 ====================
+
+async def run(args):
+    processes, log_path = [], None
+    workdir = tempfile.mkdtemp(prefix='donow_bench_')
+    base_url = args.url
+    try:
+        if not base_url:
+            if args.reset:
+                reset_database(args.database)
+            processes, log_path = start_environment(args, workdir)
+            base_url = f'http://127.0.0.1:{args.port}'
+        await wait_ready(base_url)
+
+        run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        accounts = []
+        scenarios = args.scenario or SCENARIOS
+        if 'login' in scenarios or 'mixed' in scenarios:
+            print(f"🔄 Registering {args.users} accounts ...")
+            accounts = await create_accounts(base_url, args.users, run_id)
+
+        results = []
+        for scenario in scenarios:
+            result = await run_scenario(base_url, scenario, args.concurrency, args.duration, accounts)
+            print_scenario(result)
+            results.append(result)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{run_id}{'-' + args.label if args.label else ''}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'meta': {
+                'label': args.label, 'started_at': run_id, 'git_revision': git_revision(),
+                'target': args.url or args.server_cmd, 'concurrency': args.concurrency, 'duration': args.duration,
+                'host': platform.node(), 'cpu_count': os.cpu_count(), 'python': platform.python_version(),
+            },
+            'scenarios': results,
+        }, f, indent=2)
+    print(f"\n✅ Results written to {path}")
+    if log_path:
+        print(f"   server log: {log_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test for the auth server')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='default: all scenarios in order')
+    parser.add_argument('-c', '--concurrency', type=int, default=50, help='concurrent clients per scenario')
+    parser.add_argument('-d', '--duration', type=float, default=15, help='seconds per scenario')
+    parser.add_argument('--users', type=int, default=20, help='registered accounts used by the login storm')
+    parser.add_argument('--label', help='suffix for the results file name')
+    parser.add_argument('--url', help='benchmark an already running server instead of starting one')
+    parser.add_argument('--server-cmd', default='gunicorn -w 4 -k gthread --threads 8 -b 127.0.0.1:{port} server:app')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--database', default='donow_bench', help='dedicated database, created and migrated when the server starts')
+    parser.add_argument('--reset', action='store_true', help='drop the benchmark database before starting')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help='compare two results files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
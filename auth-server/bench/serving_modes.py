@@ -0,0 +1,136 @@
+"""
+同步 / 异步部署对比基准
+对一个或多个已启动的服务并发调用 /api/auth/me 与 /api/auth/refresh，输出吞吐与延迟分位数。
+被测服务需以 RATELIMIT_ENABLED=false 启动，并连接同一个 MySQL：
+    RATELIMIT_ENABLED=false gunicorn -w 4 -k gthread --threads 8 -b 127.0.0.1:5000 server:app
+    RATELIMIT_ENABLED=false uvicorn asgi:app --workers 1 --host 127.0.0.1 --port 5001
+    python bench/serving_modes.py --url sync=http://127.0.0.1:5000 --url async=http://127.0.0.1:5001 -c 200 -d 20
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from urllib.parse import urlsplit
+
+
+class Client:
+    """最小的 HTTP/1.1 keep-alive 客户端，避免压测端自身成为瓶颈"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, token=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(payload)}']
+        if body is not None:
+            headers.append('Content-Type: application/json')
+        if token:
+            headers.append(f'Authorization: Bearer {token}')
+        self.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + payload)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        close = False
+        while True:
+            line = (await self.reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+            elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                close = True
+        data = await self.reader.readexactly(length) if length else b''
+        if close:
+            self.close()
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run_scenario(base_url, scenario, sessions, duration):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(session):
+        nonlocal errors
+        client = Client(base_url)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if scenario == 'me':
+                        status, _ = await client.request('GET', '/api/auth/me', token=session['access_token'])
+                    else:
+                        status, body = await client.request(
+                            'POST', '/api/auth/refresh', {'refreshToken': session['refresh_token']}
+                        )
+                        if status == 200:
+                            session.update(body['tokens'])
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    client.close()
+                    status = 0
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(session) for session in sessions))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+async def create_sessions(base_url, count):
+    sessions = []
+    for offset in range(0, count, 50):
+        clients = [Client(base_url) for _ in range(min(50, count - offset))]
+        results = await asyncio.gather(*(client.request('POST', '/api/auth/anonymous', {}) for client in clients))
+        for client, (status, body) in zip(clients, results):
+            client.close()
+            if status != 200:
+                raise SystemExit(f"❌ anonymous login failed with {status}: {body} (is RATELIMIT_ENABLED=false?)")
+            sessions.append(dict(body['tokens']))
+    return sessions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare sync and async deployments under concurrent load')
+    parser.add_argument('--url', action='append', required=True, help='name=http://host:port, may be repeated')
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help='concurrent sessions')
+    parser.add_argument('-d', '--duration', type=float, default=20, help='seconds per scenario')
+    parser.add_argument('--scenario', choices=['me', 'refresh'], action='append', help='default: both')
+    args = parser.parse_args()
+
+    for target in args.url:
+        name, _, base_url = target.partition('=')
+        sessions = await create_sessions(base_url, args.concurrency)
+        for scenario in args.scenario or ['me', 'refresh']:
+            latencies, errors, elapsed = await run_scenario(base_url, scenario, sessions, args.duration)
+            ms = [s * 1000 for s in latencies]
+            print(f"{name:<8} {scenario:<8} c={args.concurrency:<4} {len(ms) / elapsed:8.0f} req/s  "
+                  f"mean={statistics.mean(ms):7.2f}ms p50={percentile(ms, 50):7.2f}ms "
+                  f"p95={percentile(ms, 95):7.2f}ms p99={percentile(ms, 99):7.2f}ms errors={errors}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
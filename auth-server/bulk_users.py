@@ -0,0 +1,316 @@
+"""
+用户批量导入 / 导出
+用法：
+    python bulk_users.py export -o users.ndjson                       # 流式导出（服务端游标，内存占用与用户数无关）
+    python bulk_users.py export --include-anonymous --no-password-hashes > users.ndjson
+    python bulk_users.py import users.ndjson                          # 本服务导出的格式
+    python bulk_users.py import firebase.ndjson --firebase-rounds 8 --firebase-mem-cost 14 --id-map ids.csv
+    python bulk_users.py import users.ndjson --dry-run --rejects rejects.ndjson
+每行一个 JSON 对象：带 localId 的行按 Firebase Auth 导出格式解析（passwordHash + salt 为 Firebase scrypt），
+其余按本服务的导出格式（passwordHash 为 bcrypt）。导入按块校验、查重，以多行 INSERT 写入并每块提交一次；
+不做哈希计算、不发送验证邮件，也不经过注册接口的限流。
+导入 server 以复用其配置和连接池：只做一次表结构版本检查，不执行迁移、不启动后台线程；库尚未建好或版本落后时先运行 python migrate.py
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import uuid
+import base64
+import argparse
+import binascii
+from datetime import datetime
+
+import pymysql
+
+# 本工具从不执行迁移，与 migrate.py 相同，导入 server 前关闭启动时迁移
+os.environ['SCHEMA_MIGRATE_ON_START'] = 'false'
+
+from server import app, db_pool, ANONYMOUS_PASSWORD_HASH  # noqa: E402
+from hashing import FIREBASE_PREFIX, firebase_hash  # noqa: E402
+from ids import new_id, to_db, from_db  # noqa: E402
+
+CHUNK_SIZE = 1000
+
+BCRYPT_PATTERN = re.compile(r'^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$')
+
+INSERT_USERS = '''
+    INSERT INTO users (id, email, password_hash, display_name, email_verified, is_anonymous, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+'''
+
+EXPORT_USERS = '''
+    SELECT id, email, password_hash, display_name, email_verified, is_anonymous, created_at, updated_at
+    FROM users
+'''
+
+
+# ==================== 导出 ====================
+
+def export_users(conn, include_hashes=True, include_anonymous=False):
+    # 生成器：SSDictCursor 不把结果集读进客户端内存，逐行从服务端取回，整个导出是同一个一致性快照
+    with conn.cursor() as cursor:
+        # 消费方较慢（如通过管道写到别的程序）时，避免服务端在发送结果途中断开
+        cursor.execute('SET SESSION net_write_timeout = 3600')
+    sql = EXPORT_USERS if include_anonymous else EXPORT_USERS + ' WHERE is_anonymous = 0'
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(sql)
+        for row in cursor:
+            user = {
+                'uid': from_db(row['id']),
+                'email': row['email'],
+                'displayName': row['display_name'],
+                'emailVerified': bool(row['email_verified']),
+                'isAnonymous': bool(row['is_anonymous']),
+                'createdAt': row['created_at'].isoformat(),
+                'updatedAt': row['updated_at'].isoformat(),
+            }
+            if include_hashes and row['password_hash'] != ANONYMOUS_PASSWORD_HASH:
+                user['passwordHash'] = row['password_hash']
+            yield user
+    conn.commit()
+
+
+# ==================== 导入 ====================
+
+def _base64(value, field):
+    try:
+        base64.b64decode(value, validate=True)
+    except (binascii.Error, TypeError):
+        raise ValueError(f'{field} is not valid base64')
+    return value
+
+
+def parse_user(record: dict, firebase_params=None):
+    """校验一行记录，返回 (来源 id, users 行)；不合法时抛出 ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError('not a JSON object')
+    now = datetime.utcnow()
+
+    if 'localId' in record:
+        # Firebase Auth 导出：uid 不是 UUID，重新分配，对应关系写入 --id-map
+        source_id = record['localId']
+        uid = new_id()
+        if record.get('passwordHash'):
+            if not record.get('salt'):
+                raise ValueError('passwordHash without salt')
+            if firebase_params is None:
+                raise ValueError('Firebase password hash needs --firebase-rounds and --firebase-mem-cost')
+            password_hash = firebase_hash(
+                _base64(record['passwordHash'], 'passwordHash'), _base64(record['salt'], 'salt'), *firebase_params
+            )
+        else:
+            password_hash = ANONYMOUS_PASSWORD_HASH  # 只用第三方登录的账户，可通过忘记密码设置密码
+        created_at = datetime.utcfromtimestamp(int(record['createdAt']) / 1000) if record.get('createdAt') else now
+        updated_at = created_at
+        is_anonymous = False
+    else:
+        source_id = record.get('uid')
+        try:
+            uid = str(uuid.UUID(source_id)) if source_id else new_id()
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError('uid is not a UUID')
+        password_hash = record.get('passwordHash') or ANONYMOUS_PASSWORD_HASH
+        if password_hash != ANONYMOUS_PASSWORD_HASH and not BCRYPT_PATTERN.match(password_hash) \
+                and not password_hash.startswith(FIREBASE_PREFIX):
+            raise ValueError('passwordHash is neither bcrypt nor Firebase scrypt')
+        created_at = datetime.fromisoformat(record['createdAt']) if record.get('createdAt') else now
+        updated_at = datetime.fromisoformat(record['updatedAt']) if record.get('updatedAt') else created_at
+        is_anonymous = bool(record.get('isAnonymous'))
+
+    email = (record.get('email') or '').strip().lower()
+    if '@' not in email or len(email) > 255:
+        raise ValueError('missing or invalid email')
+    display_name = record.get('displayName')
+    if display_name is not None and (not isinstance(display_name, str) or len(display_name) > 255):
+        raise ValueError('displayName must be a string of at most 255 characters')
+    if len(password_hash) > 255:
+        raise ValueError('passwordHash too long')
+
+    row = (to_db(uid), email, password_hash, display_name, int(bool(record.get('emailVerified'))),
+           int(is_anonymous), created_at, updated_at)
+    return source_id, row
+
+
+def _existing(cursor, column, values):
+    if not values:
+        return set()
+    placeholders = ', '.join(['%s'] * len(values))
+    cursor.execute(f'SELECT {column} FROM users WHERE {column} IN ({placeholders})', list(values))
+    # 邮箱列按不区分大小写的排序规则比较，返回值统一转小写
+    return {row[column].lower() if isinstance(row[column], str) else row[column] for row in cursor.fetchall()}
+
+
+class Importer:
+    def __init__(self, conn, firebase_params=None, chunk_size=CHUNK_SIZE, dry_run=False, on_reject=None, on_imported=None):
+        self.conn = conn
+        self.firebase_params = firebase_params
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.on_reject = on_reject or (lambda line_no, line, reason: None)
+        self.on_imported = on_imported or (lambda source_id, uid: None)
+
+        self.imported = 0
+        self.rejected = 0
+
+    def _reject(self, line_no, line, reason):
+        self.rejected += 1
+        self.on_reject(line_no, line, reason)
+
+    def run(self, lines) -> dict:
+        chunk = []
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append((line_no, line))
+            if len(chunk) >= self.chunk_size:
+                self._load(chunk)
+                chunk = []
+        if chunk:
+            self._load(chunk)
+        return {'imported': self.imported, 'rejected': self.rejected}
+
+    def _load(self, chunk):
+        # 1. 解析并校验，块内按邮箱 / id 去重
+        parsed = []
+        emails, ids = set(), set()
+        for line_no, line in chunk:
+            try:
+                source_id, row = parse_user(json.loads(line), self.firebase_params)
+            except (ValueError, KeyError, TypeError, OverflowError) as e:
+                self._reject(line_no, line, str(e))
+                continue
+            if row[1] in emails or row[0] in ids:
+                self._reject(line_no, line, 'duplicate within input')
+                continue
+            emails.add(row[1])
+            ids.add(row[0])
+            parsed.append((line_no, line, source_id, row))
+
+        # 2. 一次查询找出库中已存在的邮箱和 id
+        with self.conn.cursor() as cursor:
+            taken_emails = _existing(cursor, 'email', emails)
+            taken_ids = _existing(cursor, 'id', ids)
+        rows = []
+        for line_no, line, source_id, row in parsed:
+            if row[1] in taken_emails:
+                self._reject(line_no, line, 'email already exists')
+            elif row[0] in taken_ids:
+                self._reject(line_no, line, 'uid already exists')
+            else:
+                rows.append((line_no, line, source_id, row))
+
+        if self.dry_run:
+            self.conn.rollback()
+            self.imported += len(rows)
+            return
+
+        # 3. 多行 INSERT，一块一次提交；与并发注册冲突时整块回滚，逐行重试并跳过冲突行
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.executemany(INSERT_USERS, [row for _, _, _, row in rows])
+            self.conn.commit()
+            written = rows
+        except pymysql.err.IntegrityError:
+            self.conn.rollback()
+            written = []
+            with self.conn.cursor() as cursor:
+                for item in rows:
+                    try:
+                        cursor.execute(INSERT_USERS, item[3])
+                        written.append(item)
+                    except pymysql.err.IntegrityError as e:
+                        self._reject(item[0], item[1], f'conflict: {e.args[-1]}')
+            self.conn.commit()
+
+        self.imported += len(written)
+        for _, _, source_id, row in written:
+            self.on_imported(source_id, from_db(row[0]))
+
+
+# ==================== 命令行 ====================
+
+def cmd_export(args):
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = 0
+    try:
+        with db_pool.connection() as conn:
+            for user in export_users(conn, include_hashes=not args.no_password_hashes,
+                                     include_anonymous=args.include_anonymous):
+                out.write(json.dumps(user, ensure_ascii=False) + '\n')
+                count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ Exported {count} users", file=sys.stderr)
+
+
+def cmd_import(args):
+    firebase_params = None
+    if args.firebase_rounds is not None or args.firebase_mem_cost is not None:
+        if args.firebase_rounds is None or args.firebase_mem_cost is None:
+            raise SystemExit('❌ --firebase-rounds and --firebase-mem-cost must be given together')
+        firebase_params = (args.firebase_rounds, args.firebase_mem_cost)
+        if not app.config['FIREBASE_SCRYPT_SIGNER_KEY']:
+            print("⚠️ FIREBASE_SCRYPT_SIGNER_KEY is not set; imported Firebase users cannot log in until it is",
+                  file=sys.stderr)
+
+    rejects = open(args.rejects, 'w', encoding='utf-8') if args.rejects else None
+    id_map = open(args.id_map, 'w', newline='', encoding='utf-8') if args.id_map else None
+    id_writer = csv.writer(id_map) if id_map else None
+    if id_writer:
+        id_writer.writerow(['source_id', 'uid'])
+
+    def on_reject(line_no, line, reason):
+        if rejects:
+            rejects.write(json.dumps({'line': line_no, 'reason': reason, 'record': line}, ensure_ascii=False) + '\n')
+        else:
+            print(f"⚠️ line {line_no}: {reason}", file=sys.stderr)
+
+    def on_imported(source_id, uid):
+        if id_writer and source_id:
+            id_writer.writerow([source_id, uid])
+
+    source = open(args.file, encoding='utf-8') if args.file != '-' else sys.stdin
+    try:
+        with db_pool.connection() as conn:
+            importer = Importer(conn, firebase_params, chunk_size=args.chunk_size, dry_run=args.dry_run,
+                                on_reject=on_reject, on_imported=on_imported)
+            stats = importer.run(source)
+    finally:
+        for f in (source, rejects, id_map):
+            if f and f is not sys.stdin:
+                f.close()
+    verb = 'Validated' if args.dry_run else 'Imported'
+    print(f"✅ {verb} {stats['imported']} users, rejected {stats['rejected']}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import and export users')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='stream users as NDJSON')
+    export.add_argument('-o', '--output', help='default: stdout')
+    export.add_argument('--include-anonymous', action='store_true')
+    export.add_argument('--no-password-hashes', action='store_true')
+    export.set_defaults(func=cmd_export)
+
+    load = sub.add_parser('import', help='load users from NDJSON (- for stdin)')
+    load.add_argument('file')
+    load.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows validated and inserted per transaction')
+    load.add_argument('--firebase-rounds', type=int, help='Firebase hash config: rounds')
+    load.add_argument('--firebase-mem-cost', type=int, help='Firebase hash config: mem_cost')
+    load.add_argument('--id-map', help='CSV of source id -> new uid (Firebase localIds are not UUIDs)')
+    load.add_argument('--rejects', help='write rejected lines here as NDJSON instead of stderr')
+    load.add_argument('--dry-run', action='store_true', help='validate and check duplicates without inserting')
+    load.set_defaults(func=cmd_import)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+MySQL 连接池
+每个 gunicorn worker 持有一个有界连接池，请求借出/归还连接，避免每次请求都重新握手认证
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时（连接池已满）"""
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=10, max_age=3600, timeout=10.0, ping_after=5.0):
+        # connect: 无参工厂函数，返回一个新的 pymysql 连接
+        self._connect = connect
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._born = {}       # id(conn) -> created_at，仅包含借出中的连接
+        self._pid = os.getpid()
+
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+
+    # ---------- 内部 ----------
+
+    def _check_fork(self):
+        # fork 之后不能复用父进程的 socket，直接丢弃（不 close，避免向服务端发送 QUIT）
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._born.clear()
+            self._in_use = 0
+            self._waiting = 0
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if self.max_age and now - created_at > self.max_age:
+            return False
+        if now - last_used >= self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    # ---------- 借出 / 归还 ----------
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        item = None
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    item = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.size:
+                    # 先占位，在锁外建立连接
+                    self._in_use += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f'No database connection available within {self.timeout}s')
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if item is not None:
+            conn, created_at, last_used = item
+            if self._healthy(conn, created_at, last_used):
+                with self._cond:
+                    self._born[id(conn)] = created_at
+                return conn
+            # 失效连接直接替换，沿用已占的名额
+            with self._cond:
+                self._recycled += 1
+            self._close_quietly(conn)
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._created += 1
+            self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def release(self, conn, broken=False):
+        if self._pid != os.getpid():
+            return
+        if not broken:
+            try:
+                # 结束残留事务，避免下一个请求读到旧快照
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception:
+                broken = True
+
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+            if created_at is None:
+                return
+            self._in_use -= 1
+            if broken:
+                self._recycled += 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+        if broken:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+            }
+
+
+class ReadinessCheck:
+    """缓存的数据库连通性检查：ttl 秒内重复调用直接返回上次结果，同一时刻只有一个线程真正去 ping"""
+
+    def __init__(self, pool, ttl=2.0):
+        self.pool = pool
+        self.ttl = ttl
+        self._refreshing = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def _ping(self) -> dict:
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+        except Exception as e:
+            return {'ok': False, 'error': str(e) or type(e).__name__}
+        return {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    def status(self) -> dict:
+        if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+            # 还没有结果时必须等；已有结果时其他线程正在刷新就先用旧结果
+            if self._refreshing.acquire(blocking=self._result is None):
+                try:
+                    if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                        self._result = self._ping()
+                        self._checked_at = time.monotonic()
+                finally:
+                    self._refreshing.release()
+        return {**self._result, 'age_s': round(time.monotonic() - self._checked_at, 2)}
+
+
+def is_connection_error(exc) -> bool:
+    # 网络/协议层错误意味着连接已不可用，需要回收而不是放回池中
+    return isinstance(exc, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
@@ -0,0 +1,33 @@
+"""
+Gunicorn 配置（gunicorn 默认读取当前目录下的 gunicorn.conf.py）
+    gunicorn -c gunicorn.conf.py server:app
+preload_app 开启时应用只在主进程导入一次：bcrypt cost 校准、签名密钥加载、表结构检查 / 迁移都只做一次，
+worker fork 后共享这些内存页并立即开始服务。连接池、后台线程、bcrypt 进程池都按 pid 在 worker 内惰性创建，
+主进程不持有任何数据库连接
+"""
+
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()  # 与 server.py 读同一个 .env，worker 数与应用里平分 bcrypt 进程用的 WEB_CONCURRENCY 一致
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', 4))  # 应用按它平分 bcrypt 进程，两边保持一致
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_reload(arbiter):
+    # preload 下 HUP 不会重新导入应用代码，只用主进程里已加载的应用重建 worker；
+    # 这里重新检查一次表结构，HUP 出来的 worker 继承最新的就绪状态和 id 列类型
+    server = sys.modules.get('server')
+    if not preload_app or server is None:
+        return
+    try:
+        server.prepare_schema(apply=server.app.config['SCHEMA_MIGRATE_ON_START'])
+    except Exception as e:
+        server.schema_status.update(ready=False, error=str(e))
+        arbiter.log.warning("Database schema check failed on reload: %s", e)
@@ -0,0 +1,331 @@
+"""
+密码哈希工作池
+bcrypt 计算放到独立的进程池中执行，排队数量有上限，满了直接拒绝（503），避免请求线程被 CPU 工作拖住。
+cost 在启动时按目标耗时校准（同机进程共用一次校准结果），以其他 cost 保存的密码在登录成功后后台重新哈希。
+从 Firebase 导入的 scrypt 哈希同样可以校验，登录成功后重新哈希为 bcrypt
+"""
+
+import os
+import hmac
+import json
+import math
+import time
+import fcntl
+import base64
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+import metrics
+
+
+class HashQueueFull(Exception):
+    """哈希队列已满，调用方应稍后重试"""
+
+
+class HashUnavailable(HashQueueFull):
+    """等待哈希结果超时，或子进程崩溃且重建进程池后仍失败；与队列已满一样返回 503 让调用方稍后重试"""
+
+
+# ---------- 在子进程中执行 ----------
+
+def _hashpw(password: bytes, cost: int):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=cost))
+    return hashed, started, time.time() - started
+
+def _checkpw(password: bytes, hashed: bytes):
+    started = time.time()
+    ok = bcrypt.checkpw(password, hashed)
+    return ok, started, time.time() - started
+
+def _check_firebase(password: bytes, stored: str, signer_key: bytes, salt_separator: bytes):
+    # Firebase 修改版 scrypt：以 scrypt(password, salt + separator) 的前 32 字节为密钥，AES-256-CTR 加密项目的 signer key
+    started = time.time()
+    rounds, mem_cost, salt, expected = stored[len(FIREBASE_PREFIX):].split('$')
+    n, r = 2 ** int(mem_cost), int(rounds)
+    derived = hashlib.scrypt(
+        password, salt=base64.b64decode(salt) + salt_separator, n=n, r=r, p=1, dklen=64, maxmem=256 * n * r
+    )
+    encryptor = Cipher(algorithms.AES(derived[:32]), modes.CTR(b'\0' * 16)).encryptor()
+    ok = hmac.compare_digest(encryptor.update(signer_key) + encryptor.finalize(), base64.b64decode(expected))
+    return ok, started, time.time() - started
+
+
+# ---------- 哈希格式 ----------
+
+# Firebase scrypt 哈希以 $firebase-scrypt$<rounds>$<mem_cost>$<salt>$<hash> 保存（base64），
+# 项目级的 signer key 与 salt separator 属于密钥，放在配置中
+FIREBASE_PREFIX = '$firebase-scrypt$'
+
+
+def firebase_hash(password_hash_b64: str, salt_b64: str, rounds: int, mem_cost: int) -> str:
+    return f'{FIREBASE_PREFIX}{rounds}${mem_cost}${salt_b64}${password_hash_b64}'
+
+
+def scheme_of(password_hash: str) -> str:
+    # 指标标签：bcrypt 为 cost 数字，其余为算法名
+    cost = cost_of(password_hash)
+    if cost is not None:
+        return str(cost)
+    return 'firebase-scrypt' if password_hash.startswith(FIREBASE_PREFIX) else 'unknown'
+
+
+def cost_of(password_hash: str):
+    # bcrypt 哈希自带 cost：$2b$12$...；不是 bcrypt 格式（如匿名账户的占位值）时返回 None
+    parts = password_hash.split('$')
+    if len(parts) == 4 and parts[1] in ('2a', '2b', '2y') and parts[2].isdigit():
+        return int(parts[2])
+    return None
+
+
+def calibrate(target_ms, min_cost=10, max_cost=16, probe_cost=8, rounds=3) -> int:
+    # 测量一个较低 cost 的耗时再外推（cost 每加 1 耗时翻倍），取不超过目标耗时的最大 cost；
+    # 多次测量取最小值，减少多个 worker 同时启动时的干扰
+    probe = bcrypt.gensalt(rounds=probe_cost)
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', probe)
+        best = min(best, time.perf_counter() - started)
+    cost = probe_cost + math.floor(math.log2(target_ms / 1000 / best))
+    return max(min_cost, min(max_cost, cost))
+
+
+def load_or_calibrate(path, target_ms, min_cost=10, max_cost=16) -> int:
+    # 同机进程共用一次校准结果，避免各 worker 测得的 cost 不同导致登录时反复重新哈希；目标参数变化时重新校准
+    params = {'target_ms': target_ms, 'min_cost': min_cost, 'max_cost': max_cost}
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            if {key: saved.get(key) for key in params} == params:
+                return saved['cost']
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        cost = calibrate(target_ms, min_cost, max_cost)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({**params, 'cost': cost, 'calibrated_at': time.time()}, f)
+        os.replace(f'{path}.tmp', path)
+        print(f"🔐 Calibrated bcrypt cost {cost} for a {target_ms} ms target")
+        return cost
+
+
+class _Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 2),
+        }
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, queue_size=None, timeout=30.0, cost=12, firebase_scrypt=None):
+        self.cost = cost
+        self.firebase_scrypt = firebase_scrypt  # (signer_key, salt_separator)，未配置时无法校验 Firebase 哈希
+        self.workers = workers or os.cpu_count() or 1
+        # 正在执行 + 排队中的任务总数上限
+        self.queue_size = queue_size or self.workers * 4
+        self.timeout = timeout
+
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+
+        self._pending = 0
+        self._rejected = 0
+        self._unverifiable = 0
+        self._timeouts = 0
+        self._broken = 0
+        self._queue_wait = _Timing()
+        self._hash_time = _Timing()
+        self._rehashed = 0
+
+    def _get_executor(self):
+        # 延迟创建，fork 后在子进程里重新创建（进程池不能跨 fork 复用），崩溃后由 _discard 清空再重新创建
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # 名额只在 fork 后重置；进程池崩溃时旧任务仍会各自归还名额
+                    self._executor = None
+                    self._pid = os.getpid()
+                    self._slots = threading.BoundedSemaphore(self.queue_size)
+                    self._pending = 0
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _discard(self, executor):
+        # 子进程被杀（OOM 等）后进程池永久不可用，丢弃它，下一个任务会新建进程池
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._broken += 1
+        print("⚠️ Password hashing pool broke, replacing it")
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _submit(self, fn, *args, background=False):
+        for attempt in range(2):
+            executor = self._get_executor()
+            if not self._slots.acquire(blocking=False):
+                if not background:
+                    with self._lock:
+                        self._rejected += 1
+                    metrics.REJECTIONS.inc(reason='hash_queue_full')
+                raise HashQueueFull()
+
+            submitted = time.time()
+            with self._lock:
+                self._pending += 1
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._done(None)
+                self._discard(executor)
+                if attempt:
+                    raise HashUnavailable()
+                continue
+            except Exception:
+                self._done(None)
+                raise
+            # 名额在任务真正结束时才归还，等待超时的任务仍然计入队列
+            future.add_done_callback(self._done)
+            return future, submitted
+
+    def _record(self, op, cost, submitted, started, elapsed):
+        with self._lock:
+            self._queue_wait.add(max(0.0, started - submitted))
+            self._hash_time.add(elapsed)
+        metrics.BCRYPT_QUEUE_WAIT.observe(max(0.0, started - submitted), op=op)
+        metrics.BCRYPT.observe(elapsed, op=op, cost=cost)
+
+    def _timed_out(self):
+        with self._lock:
+            self._timeouts += 1
+        metrics.REJECTIONS.inc(reason='hash_timeout')
+        return HashUnavailable()
+
+    def _run(self, op, cost, fn, *args):
+        # 任务所在的进程池崩溃时重试一次：重新提交会发现进程池已坏，由 _submit 换一个新的
+        for attempt in range(2):
+            future, submitted = self._submit(fn, *args)
+            try:
+                result, started, elapsed = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                raise self._timed_out()
+            except BrokenProcessPool:
+                if attempt:
+                    raise HashUnavailable()
+                continue
+            self._record(op, cost, submitted, started, elapsed)
+            return result
+
+    async def _run_async(self, op, cost, fn, *args):
+        # 事件循环中使用：等待进程池结果时让出循环；超时与崩溃的处理同 _run
+        for attempt in range(2):
+            future, submitted = self._submit(fn, *args)
+            try:
+                result, started, elapsed = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out()
+            except BrokenProcessPool:
+                if attempt:
+                    raise HashUnavailable()
+                continue
+            self._record(op, cost, submitted, started, elapsed)
+            return result
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', self.cost, _hashpw, password.encode(), self.cost).decode()
+
+    def _check_job(self, password: str, password_hash: str):
+        # 无法校验的哈希返回 None，调用方按密码错误处理（登录返回 401 而不是 500）
+        if password_hash.startswith(FIREBASE_PREFIX):
+            if self.firebase_scrypt is None:
+                with self._lock:
+                    self._unverifiable += 1
+                    first = self._unverifiable == 1
+                if first:
+                    print("⚠️ Firebase scrypt hash found but FIREBASE_SCRYPT_SIGNER_KEY is not configured; "
+                          "these users cannot log in")
+                return None
+            return (_check_firebase, password.encode(), password_hash, *self.firebase_scrypt)
+        return (_checkpw, password.encode(), password_hash.encode())
+
+    def check(self, password: str, password_hash: str) -> bool:
+        job = self._check_job(password, password_hash)
+        return job is not None and self._run('check', scheme_of(password_hash), *job)
+
+    async def hash_async(self, password: str) -> str:
+        return (await self._run_async('hash', self.cost, _hashpw, password.encode(), self.cost)).decode()
+
+    async def check_async(self, password: str, password_hash: str) -> bool:
+        job = self._check_job(password, password_hash)
+        return job is not None and await self._run_async('check', scheme_of(password_hash), *job)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        if password_hash.startswith(FIREBASE_PREFIX):
+            return True
+        cost = cost_of(password_hash)
+        return cost is not None and cost != self.cost
+
+    def rehash_later(self, password: str, callback) -> bool:
+        # 后台按当前 cost 重新哈希，完成后以新哈希调用 callback（在进程池的结果线程中执行，不能阻塞）；
+        # 队列已满时直接放弃，不影响登录响应，下次登录再试
+        try:
+            future, submitted = self._submit(_hashpw, password.encode(), self.cost, background=True)
+        except HashQueueFull:
+            return False
+
+        def done(future):
+            try:
+                hashed, started, elapsed = future.result()
+            except Exception as e:
+                print(f"⚠️ Background rehash failed: {e}")
+                return
+            self._record('rehash', self.cost, submitted, started, elapsed)
+            with self._lock:
+                self._rehashed += 1
+            callback(hashed.decode())
+
+        future.add_done_callback(done)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'cost': self.cost,
+                'rehashed': self._rehashed,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'pending': self._pending,
+                'rejected': self._rejected,
+                'unverifiable': self._unverifiable,
+                'timeouts': self._timeouts,
+                'pool_restarts': self._broken,
+                'queue_wait': self._queue_wait.as_dict(),
+                'hash_time': self._hash_time.as_dict(),
+            }
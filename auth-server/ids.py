@@ -0,0 +1,108 @@
+"""
+按时间排序的 ID
+新 ID 采用 UUIDv7 布局（前 48 位是毫秒时间戳），对外仍是标准的 36 位 UUID 字符串；
+库中以 BINARY(16) 存储，新行总是追加在聚簇索引末尾，二级索引中的主键副本也从 36 字节缩到 16 字节
+"""
+
+import os
+import time
+import uuid
+import threading
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+# 库中 id 列的存储格式：None 为尚未检测，False 为迁移前的 VARCHAR(36)，True 为 BINARY(16)。
+# 启动时由 server.prepare_schema 设置；启动时没能检测（如数据库短暂不可用）则在使用时检测，失败 RETRY_INTERVAL 秒后再试。
+# 尚未检测时按旧格式处理：字符串写进 BINARY(16) 会报错（调用方据此重新检测），字节写进 VARCHAR(36) 却会悄悄写坏数据。
+# 旧格式下每 RECHECK_INTERVAL 秒重新检测一次，migrate.py --finalize 原子切换两张表后各 worker 无需重载即可改用新格式
+binary = None
+RECHECK_INTERVAL = 5.0
+RETRY_INTERVAL = 1.0
+
+_detect = None
+_detect_lock = threading.Lock()
+_checked_at = None  # 最近一次检测（无论成败）的时间
+_switched_at = None  # 本进程改用 BINARY(16) 的时间
+
+
+def new_id() -> str:
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF  # 随机起点，留出一半空间递增
+        else:
+            # 同一毫秒内（或时钟回拨）递增计数器，保证进程内单调
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    tail = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = (ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | tail
+    return str(uuid.UUID(int=value))
+
+
+def configure(detect):
+    # detect() 返回 users.id 的 data_type（'binary' / 'varchar'，表不存在时为 None），由 server 注册
+    global _detect
+    _detect = detect
+
+
+def observe(id_type):
+    # 其他查询（如启动时的表结构检查）已经得知列类型
+    global binary, _checked_at, _switched_at
+    _checked_at = time.monotonic()
+    if id_type:
+        if binary is False and id_type == 'binary':
+            _switched_at = _checked_at
+        binary = id_type == 'binary'
+
+
+def stale() -> bool:
+    # to_db 是否需要先检测列类型（异步调用方据此把检测放到线程池）
+    if binary is True or _detect is None:
+        return False
+    if _checked_at is None:
+        return True
+    return time.monotonic() - _checked_at >= (RETRY_INTERVAL if binary is None else RECHECK_INTERVAL)
+
+
+def recheck(min_interval=RETRY_INTERVAL) -> bool:
+    # 重新检测列类型，返回格式是否因此改变（调用方据此重试刚才未命中或被拒绝的语句）。BINARY(16) 是终态，不再检测
+    global _checked_at
+    before = binary
+    if before is True or _detect is None:
+        return False
+    with _detect_lock:
+        if binary is before and (_checked_at is None or time.monotonic() - _checked_at >= min_interval):
+            _checked_at = time.monotonic()
+            observe(_detect())
+    return binary is not before
+
+
+def switched(within=RECHECK_INTERVAL) -> bool:
+    # 本进程是否刚从旧格式切换过来：切换前已按旧格式算好参数的请求此时才执行语句
+    return _switched_at is not None and time.monotonic() - _switched_at < within
+
+
+def ensure():
+    # 需要时检测列类型；检测失败时沿用当前（尚未检测则为旧）格式，RETRY_INTERVAL 秒后再试
+    if stale():
+        try:
+            recheck(0)
+        except Exception as e:
+            print(f"⚠️ Failed to detect the users.id column type: {e}")
+
+
+def to_db(uid: str):
+    # API / JWT 中的字符串 uid 转为库中存储的格式
+    ensure()
+    return uuid.UUID(uid).bytes if binary else uid
+
+
+def from_db(value) -> str:
+    return str(uuid.UUID(bytes=value)) if isinstance(value, bytes) else value
@@ -0,0 +1,24 @@
+"""
+下游服务使用的 DoNow token 本地验证工具
+从认证服务的 /.well-known/jwks.json 拉取公钥并缓存，验证 token 时不需要每次请求认证服务：
+
+    from jwks_verify import TokenVerifier
+    verifier = TokenVerifier('https://auth.example.com/.well-known/jwks.json')
+    claims = verifier.verify(token)   # 失败时抛出 jwt.InvalidTokenError
+"""
+
+import jwt
+
+
+class TokenVerifier:
+    def __init__(self, jwks_url, cache_seconds=300, leeway=0):
+        # PyJWKClient 缓存整个 JWKS，遇到未知 kid（密钥轮换）时会重新拉取
+        self._client = jwt.PyJWKClient(jwks_url, cache_jwk_set=True, lifespan=cache_seconds)
+        self.leeway = leeway
+
+    def verify(self, token: str) -> dict:
+        try:
+            signing_key = self._client.get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise jwt.InvalidTokenError(str(e)) from e
+        return jwt.decode(token, signing_key.key, algorithms=['EdDSA'], leeway=self.leeway)
@@ -0,0 +1,157 @@
+"""
+JWT 签名密钥环
+密钥目录中每个 <kid>.pem 是一把 Ed25519 私钥，所有密钥的公钥都发布在 JWKS 中；
+新密钥生成后要等 JWKS 缓存过期（activation_delay）才开始用于签名，旧密钥在其签发的 token 全部过期后才删除
+用法：
+    python keys.py generate                # 生成新密钥（轮换）
+    python keys.py list                    # 查看密钥与状态
+    python keys.py prune --after-hours 720 # 删除已被替换超过指定小时数的旧密钥
+"""
+
+import os
+import time
+import fcntl
+import base64
+import argparse
+import threading
+from datetime import datetime
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def generate_key(keys_dir: str) -> str:
+    os.makedirs(keys_dir, mode=0o700, exist_ok=True)
+    kid = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{_b64url(os.urandom(3))}"
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    fd = os.open(os.path.join(keys_dir, f'{kid}.pem'), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+    return kid
+
+
+class KeyRing:
+    def __init__(self, keys_dir, activation_delay=300, reload_interval=60):
+        self.keys_dir = keys_dir
+        self.activation_delay = activation_delay
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._keys = {}  # kid -> (private_key, created_at)
+        self._loaded_at = 0.0
+        self._jwks = None
+
+    def _load(self):
+        keys = {}
+        if os.path.isdir(self.keys_dir):
+            for name in os.listdir(self.keys_dir):
+                if not name.endswith('.pem'):
+                    continue
+                path = os.path.join(self.keys_dir, name)
+                with open(path, 'rb') as f:
+                    private_key = serialization.load_pem_private_key(f.read(), password=None)
+                keys[name[:-4]] = (private_key, os.stat(path).st_mtime)
+        return keys
+
+    def stale(self) -> bool:
+        # 下次使用时是否要重新读磁盘（异步调用方据此先在线程池中 refresh）
+        return not self._keys or time.monotonic() - self._loaded_at >= self.reload_interval
+
+    def refresh(self):
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if not self.stale():
+            return
+        with self._lock:
+            if not self.stale():
+                return
+            keys = self._load()
+            if not keys:
+                keys = self._bootstrap()
+            self._keys = keys
+            self._jwks = None
+            self._loaded_at = time.monotonic()
+
+    def _bootstrap(self):
+        # 首次部署没有密钥：多个 worker 同时启动时用文件锁保证只生成一把
+        os.makedirs(self.keys_dir, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.keys_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            keys = self._load()
+            if not keys:
+                print(f"🔑 No JWT signing key found, generated {generate_key(self.keys_dir)}")
+                keys = self._load()
+        return keys
+
+    def ordered(self):
+        # [(kid, (private_key, created_at))]，按生成时间从旧到新
+        self._ensure_loaded()
+        return sorted(self._keys.items(), key=lambda item: item[1][1])
+
+    def signing_key(self):
+        now = time.time()
+        ordered = self.ordered()
+        active = [item for item in ordered if now - item[1][1] >= self.activation_delay]
+        # 已过激活等待期的密钥中最新的一把；都未激活时（首次部署）使用最早的一把
+        kid, (private_key, _) = active[-1] if active else ordered[0]
+        return kid, private_key
+
+    def public_key(self, kid):
+        self._ensure_loaded()
+        entry = self._keys.get(kid)
+        if entry is None and time.monotonic() - self._loaded_at > 1:
+            # 其他 worker 或运维刚生成的新密钥，立即重新加载（最多每秒一次）
+            self._loaded_at = 0.0
+            self._ensure_loaded()
+            entry = self._keys.get(kid)
+        return entry[0].public_key() if entry else None
+
+    def jwks(self) -> dict:
+        self._ensure_loaded()
+        if self._jwks is None:
+            self._jwks = {'keys': [
+                {
+                    'kty': 'OKP', 'crv': 'Ed25519', 'use': 'sig', 'alg': 'EdDSA', 'kid': kid,
+                    'x': _b64url(private_key.public_key().public_bytes(
+                        serialization.Encoding.Raw, serialization.PublicFormat.Raw
+                    )),
+                }
+                for kid, (private_key, _) in sorted(self._keys.items())
+            ]}
+        return self._jwks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage JWT signing keys')
+    parser.add_argument('command', choices=['generate', 'list', 'prune'])
+    parser.add_argument('--dir', default=os.getenv('JWT_KEYS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys')))
+    parser.add_argument('--after-hours', type=float, default=float(os.getenv('JWT_EXPIRATION_HOURS', 24 * 7)),
+                        help='prune keys superseded longer ago than this (should cover the token lifetime)')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        print(f"✅ Generated key {generate_key(args.dir)}")
+        return
+
+    ring = KeyRing(args.dir, activation_delay=int(os.getenv('JWT_KEY_ACTIVATION_DELAY', 300)))
+    active_kid, _ = ring.signing_key()
+    ordered = ring.ordered()
+    for i, (kid, (_, created_at)) in enumerate(ordered):
+        superseded_at = ordered[i + 1][1][1] + ring.activation_delay if i + 1 < len(ordered) else None
+        if args.command == 'list':
+            state = 'active' if kid == active_kid else ('pending' if superseded_at is None else 'retiring')
+            print(f"{kid}  {state}  created {datetime.utcfromtimestamp(created_at).isoformat()}")
+        elif superseded_at and kid != active_kid and time.time() - superseded_at > args.after_hours * 3600:
+            os.remove(os.path.join(args.dir, f'{kid}.pem'))
+            print(f"🗑️ Removed key {kid}")
+
+
+if __name__ == '__main__':
+    main()
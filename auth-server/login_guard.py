@@ -0,0 +1,82 @@
+"""
+按账户的登录失败闸门
+连续失败达到阈值后按指数退避锁定账户，锁定期内的登录请求在 bcrypt 之前直接拒绝；
+计数保存在共享存储（shm:// 或 redis://）中，不额外写 MySQL；shm:// 下使用单独的计数表，
+锁定条目在过期前不会被挤掉，表满到无法写入锁定时对该账户 fail closed
+"""
+
+import time
+import hashlib
+import threading
+
+from shm_limiter import StorageFull
+
+
+class LoginGuard:
+    def __init__(self, storage, threshold=5, base_lockout=30, max_lockout=3600, window=3600, cost_estimate=None):
+        self.storage = storage
+        self.threshold = threshold        # 窗口内允许的失败次数
+        self.base_lockout = base_lockout  # 首次锁定秒数，此后每多失败一次翻倍
+        self.max_lockout = max_lockout
+        self.window = window              # 失败计数的保留秒数
+        # 返回一次密码校验的平均耗时（秒），用于估算节省的 CPU
+        self.cost_estimate = cost_estimate or (lambda: 0.0)
+
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self._lockouts = 0
+        self._overflows = 0
+        self._cpu_saved = 0.0
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return hashlib.blake2b(email.encode(), digest_size=16).hexdigest()
+
+    def retry_after(self, email: str) -> int:
+        # 账户处于锁定期时返回剩余秒数，否则返回 0
+        lock_key = f'login_lock/{self._key(email)}'
+        if self.storage.get(lock_key):
+            remaining = max(1, int(self.storage.get_expiry(lock_key) - time.time()))
+        elif getattr(self.storage, 'full', None) and self.storage.full(lock_key):
+            # 计数表已满、锁定可能没能写入：宁可暂时拒绝，也不放行到 bcrypt
+            remaining = self.base_lockout
+        else:
+            return 0
+        with self._lock:
+            self._rejected += 1
+            self._cpu_saved += self.cost_estimate()
+        return remaining
+
+    def record_failure(self, email: str):
+        key = self._key(email)
+        try:
+            failures = self.storage.incr(f'login_fail/{key}', self.window)
+            if failures < self.threshold:
+                return
+            lockout = min(self.base_lockout * 2 ** (failures - self.threshold), self.max_lockout)
+            lock_key = f'login_lock/{key}'
+            # incr 只在创建时设置过期时间，先清除才能按新的时长重新锁定
+            self.storage.clear(lock_key)
+            self.storage.incr(lock_key, lockout)
+        except StorageFull as e:
+            # retry_after 会发现写不进去并拒绝该账户的登录
+            with self._lock:
+                self._overflows += 1
+            print(f"⚠️ Login guard storage full: {e}")
+            return
+        with self._lock:
+            self._lockouts += 1
+
+    def record_success(self, email: str):
+        key = self._key(email)
+        self.storage.clear(f'login_fail/{key}')
+        self.storage.clear(f'login_lock/{key}')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rejected': self._rejected,
+                'lockouts': self._lockouts,
+                'overflows': self._overflows,
+                'cpu_saved_ms': round(self._cpu_saved * 1000, 2),
+            }
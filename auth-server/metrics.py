@@ -0,0 +1,391 @@
+"""
+Prometheus 指标
+进程内的计数器 / 直方图 / 仪表盘，每个 worker 定期把快照写到同机共享目录（默认 tmpfs），
+/metrics 合并所有 worker 的快照后输出 Prometheus 文本格式，无论抓取落在哪个 worker 上看到的都是整机数据；
+已退出 worker 的计数器与直方图并入归档文件继续累计，仪表盘只统计存活的 worker。
+另提供慢请求的 cProfile 抽样。
+"""
+
+import os
+import json
+import time
+import fcntl
+import bisect
+import random
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+import pymysql
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []  # 按定义顺序输出
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # 标签值元组 -> 值
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'type': self.type, 'help': self.documentation, 'labels': self.labels,
+                    'values': [[list(key), value] for key, value in self._values.items()]}
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        # 由组件自己累计的计数（stats()）在采集时直接写入
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), aggregate='sum'):
+        # aggregate：合并各 worker 时求和（每进程各自的量），或取最大值（各 worker 都在报告同一个整表数值）
+        super().__init__(name, documentation, labels)
+        self.aggregate = aggregate
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data['aggregate'] = self.aggregate
+        return data
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            # 各桶（不累加，最后一个为 +Inf）的计数，末尾是总和
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data['buckets'] = self.buckets
+        return data
+
+
+# ==================== 指标定义 ====================
+
+HTTP_REQUESTS = Counter('donow_http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status'])
+HTTP_LATENCY = Histogram('donow_http_request_duration_seconds', 'HTTP request latency', ['method', 'route'])
+SLOW_REQUESTS = Counter('donow_http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS', ['method', 'route'])
+DB_QUERY = Histogram('donow_db_query_duration_seconds', 'MySQL statement execution time', ['target', 'statement'])
+DB_CONNECTIONS = Gauge('donow_db_connections', 'MySQL pool connections by state', ['pool', 'state'])
+DB_CONNECTION_EVENTS = Counter('donow_db_connection_events_total', 'MySQL connections opened or recycled', ['pool', 'event'])
+BCRYPT = Histogram('donow_bcrypt_duration_seconds', 'bcrypt time in the hashing pool', ['op', 'cost'],
+                   buckets=(0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0))
+BCRYPT_QUEUE_WAIT = Histogram('donow_bcrypt_queue_wait_seconds', 'Wait before a bcrypt job started', ['op'])
+BCRYPT_PENDING = Gauge('donow_bcrypt_pending', 'bcrypt jobs running or queued')
+BCRYPT_REHASHES = Counter('donow_bcrypt_rehashes_total', 'Passwords rehashed at login', ['from_cost', 'to_cost'])
+BCRYPT_COST_USERS = Gauge('donow_bcrypt_cost_users', 'Users by stored bcrypt cost (or imported hash scheme)', ['cost'],
+                          aggregate='max')
+JWT = Histogram('donow_jwt_duration_seconds', 'Access token signing and verification', ['op'],
+                buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025))
+EMAIL = Histogram('donow_email_duration_seconds', 'Outbox enqueue and SMTP send time', ['op'])
+EMAILS = Counter('donow_emails_total', 'Outbox deliveries by result', ['result'])
+REJECTIONS = Counter('donow_rejections_total', 'Requests turned away before doing work', ['reason'])
+CACHE_LOOKUPS = Counter('donow_cache_lookups_total', 'Cache lookups by result', ['cache', 'result'])
+WRITE_BEHIND_PENDING = Gauge('donow_write_behind_pending', 'Rows waiting in the write-behind buffer')
+
+
+def _reset_after_fork():
+    # 子进程从零开始计数：父进程（例如 --preload 时的 gunicorn master）的计数不应在每个 worker 里重复出现
+    for metric in _metrics:
+        metric._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def statement_type(query) -> str:
+    verb = query.lstrip()[:6].upper() if isinstance(query, str) else ''
+    return verb if verb in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+def timed_cursor(target):
+    """返回记录每条语句耗时的 DictCursor 子类，target 区分主库与副本"""
+
+    class TimedDictCursor(pymysql.cursors.DictCursor):
+        def execute(self, query, args=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, args)
+            finally:
+                DB_QUERY.observe(time.perf_counter() - started, target=target, statement=statement_type(query))
+
+    return TimedDictCursor
+
+
+# ==================== 跨 worker 汇总 ====================
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, snapshot, include_gauges=True):
+    for name, data in snapshot.items():
+        if data['type'] == 'gauge' and not include_gauges:
+            continue
+        target = into.setdefault(name, {**data, 'values': {}})
+        for labels, value in data['values']:
+            key = tuple(labels)
+            current = target['values'].get(key)
+            if current is None:
+                target['values'][key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                target['values'][key] = [a + b for a, b in zip(current, value)]
+            elif data.get('aggregate') == 'max':
+                target['values'][key] = max(current, value)
+            else:
+                target['values'][key] = current + value
+    return into
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_le(bound) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def render(merged) -> str:
+    lines = []
+    for name, data in merged.items():
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        for key, value in sorted(data['values'].items()):
+            if data['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(data['labels'], key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(data['buckets']) + [float('inf')], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(data['labels'], key, [('le', _format_le(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(data['labels'], key)} {value[-1]}")
+            lines.append(f"{name}_count{_format_labels(data['labels'], key)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add_collector(self, fn):
+        # 采集前调用，把各组件 stats() 中的数值写入仪表盘 / 计数器
+        self._collectors.append(fn)
+
+    def start(self):
+        # 每个进程只启动一次；fork 之后在子进程中重新启动
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.json')
+
+    def snapshot(self) -> dict:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        return {metric.name: metric.snapshot() for metric in _metrics}
+
+    def flush(self):
+        path = self._path(os.getpid())
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Metrics flush failed: {e}")
+
+    def _archive_dead(self, pid):
+        # 已退出 worker 的累计值并入 archive.json，之后只读一个文件
+        with open(os.path.join(self.directory, 'archive.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            source = self._path(pid)
+            try:
+                with open(source) as f:
+                    dead = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return
+            archive = {}
+            if os.path.exists(self._path('archive')):
+                with open(self._path('archive')) as f:
+                    archive = json.load(f)
+            merged = _merge(_merge({}, archive), dead, include_gauges=False)
+            for data in merged.values():
+                data['values'] = [[list(key), value] for key, value in data['values'].items()]
+            with open(f"{self._path('archive')}.tmp", 'w') as f:
+                json.dump(merged, f)
+            os.replace(f"{self._path('archive')}.tmp", self._path('archive'))
+            os.unlink(source)
+
+    def collect(self) -> str:
+        merged = _merge({}, self.snapshot())
+        os.makedirs(self.directory, exist_ok=True)
+        for filename in os.listdir(self.directory):
+            stem, ext = os.path.splitext(filename)
+            if ext != '.json' or not stem.isdigit() or int(stem) == os.getpid():
+                continue
+            if not _pid_alive(int(stem)):
+                self._archive_dead(int(stem))
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    _merge(merged, json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue  # 正在被替换或已被归档
+        try:
+            with open(self._path('archive')) as f:
+                _merge(merged, json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+        return render(merged)
+
+
+# ==================== 慢请求抽样 ====================
+
+class RequestProfiler:
+    def __init__(self, sample_rate=0.0, slow_ms=500, directory=None, keep=50):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.keep = keep
+        # 每个进程同一时刻只剖析一个请求（Python 3.12 起 cProfile 不能在多个线程上同时启用）
+        self._active = threading.Lock()
+
+        self._sampled = 0
+        self._saved = 0
+
+    def begin(self):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._active.release()
+            return None
+        self._sampled += 1
+        return profiler
+
+    def end(self, profiler, method, route, seconds):
+        slow = seconds * 1000 >= self.slow_ms
+        if slow:
+            SLOW_REQUESTS.inc(method=method, route=route)
+        if profiler is None:
+            return
+        self.discard(profiler)
+        if slow:
+            self._save(profiler, method, route, seconds)
+
+    def discard(self, profiler):
+        if profiler is not None:
+            profiler.disable()
+            self._active.release()
+
+    def _save(self, profiler, method, route, seconds):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}.{int(time.time() * 1000) % 1000:03d}-{os.getpid()}-{method}{route.replace('/', '_')}.prof"
+        path = os.path.join(self.directory, name)
+        pstats.Stats(profiler).dump_stats(path)
+        self._saved += 1
+        print(f"🐢 Slow request {method} {route} took {seconds * 1000:.0f} ms, profile saved to {path}")
+        # 只保留最近的 keep 个文件
+        files = sorted(
+            (os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.prof')),
+            key=os.path.getmtime
+        )
+        for old in files[:-self.keep]:
+            try:
+                os.unlink(old)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {'sample_rate': self.sample_rate, 'slow_ms': self.slow_ms, 'sampled': self._sampled, 'saved': self._saved}
@@ -0,0 +1,324 @@
+"""
+数据库迁移
+先执行 schema.py 中未完成的版本化迁移（建库、建表，记入 schema_version），再执行旧库升级用的在线迁移
+用法：
+    python migrate.py             # 版本化迁移；旧库加列、分批回填、建索引，不阻塞线上读写
+    python migrate.py --finalize  # 新代码全部上线后执行：补齐回填、删除旧列并原子切换到 BINARY(16) 主键
+    python migrate.py --status    # 只查看当前版本、未执行的迁移和缺少的列
+"""
+
+import os
+import argparse
+import time
+
+# 由本脚本显式执行迁移，导入 server 时只检查版本
+os.environ['SCHEMA_MIGRATE_ON_START'] = 'false'
+
+import schema  # noqa: E402
+from server import app, db_pool, prepare_schema  # noqa: E402
+
+BATCH_SIZE = 5000
+
+
+def _columns(cursor, table):
+    cursor.execute(
+        'SELECT column_name AS name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s',
+        (app.config['MYSQL_DATABASE'], table)
+    )
+    return {row['name'] for row in cursor.fetchall()}
+
+
+def _indexes(cursor, table):
+    cursor.execute(
+        'SELECT DISTINCT index_name AS name FROM information_schema.statistics WHERE table_schema = %s AND table_name = %s',
+        (app.config['MYSQL_DATABASE'], table)
+    )
+    return {row['name'] for row in cursor.fetchall()}
+
+
+def _triggers(cursor, table):
+    cursor.execute(
+        'SELECT trigger_name AS name FROM information_schema.triggers WHERE trigger_schema = %s AND event_object_table = %s',
+        (app.config['MYSQL_DATABASE'], table)
+    )
+    return {row['name'] for row in cursor.fetchall()}
+
+
+def _in_batches(conn, table, statement, params=(), batch_size=BATCH_SIZE):
+    # 按主键分段执行 statement（{range} 处填入本段的主键范围），每段单独提交，
+    # 避免长事务、大范围行锁和重复扫描已处理的行；返回影响的总行数
+    total = 0
+    last = ''
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT 1 OFFSET %s',
+                (last, batch_size - 1)
+            )
+            row = cursor.fetchone()
+            upper = row['id'] if row else None
+            if upper is None:
+                cursor.execute(statement.format(range='id > %s'), (*params, last))
+            else:
+                cursor.execute(statement.format(range='id > %s AND id <= %s'), (*params, last, upper))
+            total += cursor.rowcount
+        conn.commit()
+        if upper is None:
+            return total
+        last = upper
+        time.sleep(0.01)
+
+
+def _backfill(conn, table, assignment, condition, batch_size=BATCH_SIZE):
+    return _in_batches(conn, table, f'UPDATE {table} SET {assignment} WHERE {{range}} AND {condition}', batch_size=batch_size)
+
+
+# ==================== refresh token 改存 SHA-256 摘要 ====================
+
+# 滚动发布期间旧代码仍只写 token 明文，由触发器补上 token_hash，新代码按摘要才能查到这些 token；--finalize 时删除
+TOKEN_HASH_TRIGGERS = {
+    'refresh_tokens_token_hash_insert': 'BEFORE INSERT',
+    'refresh_tokens_token_hash_update': 'BEFORE UPDATE',
+}
+TOKEN_HASH_TRIGGER_BODY = (
+    'FOR EACH ROW IF NEW.token IS NOT NULL AND NEW.token_hash IS NULL '
+    'THEN SET NEW.token_hash = UNHEX(SHA2(NEW.token, 256)); END IF'
+)
+
+
+def refresh_token_hash(conn, finalize=False):
+    with conn.cursor() as cursor:
+        columns = _columns(cursor, 'refresh_tokens')
+        if 'token' not in columns:
+            print("✅ refresh_tokens already stores token_hash only")
+            return
+
+        if 'token_hash' not in columns:
+            print("🔄 Adding refresh_tokens.token_hash ...")
+            # 旧列改为可空，新代码只写 token_hash
+            cursor.execute(
+                'ALTER TABLE refresh_tokens ADD COLUMN token_hash BINARY(32) NULL AFTER user_id, '
+                'MODIFY token VARCHAR(255) NULL, ALGORITHM=INPLACE, LOCK=NONE'
+            )
+        # 先建触发器再回填，回填开始后旧代码新插入的行同样带上摘要；已存在时不重建，避免删除与重建之间漏掉写入
+        existing = _triggers(cursor, 'refresh_tokens')
+        for name, timing in TOKEN_HASH_TRIGGERS.items():
+            if name not in existing:
+                print(f"🔄 Creating trigger {name} ...")
+                cursor.execute(f'CREATE TRIGGER {name} {timing} ON refresh_tokens {TOKEN_HASH_TRIGGER_BODY}')
+    conn.commit()
+
+    print("🔄 Backfilling token_hash ...")
+    count = _backfill(
+        conn, 'refresh_tokens',
+        'token_hash = UNHEX(SHA2(token, 256))',
+        'token_hash IS NULL AND token IS NOT NULL'
+    )
+    print(f"   {count} rows updated")
+
+    with conn.cursor() as cursor:
+        if 'uniq_token_hash' not in _indexes(cursor, 'refresh_tokens'):
+            print("🔄 Creating unique index on token_hash ...")
+            cursor.execute(
+                'ALTER TABLE refresh_tokens ADD UNIQUE INDEX uniq_token_hash (token_hash), ALGORITHM=INPLACE, LOCK=NONE'
+            )
+
+        if finalize:
+            print("🔄 Dropping refresh_tokens.token ...")
+            # 触发器引用 token 列，必须在删列之前删除
+            for name in TOKEN_HASH_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(
+                'ALTER TABLE refresh_tokens DROP COLUMN token, MODIFY token_hash BINARY(32) NOT NULL, '
+                'ALGORITHM=INPLACE, LOCK=NONE'
+            )
+    conn.commit()
+
+
+# ==================== 删除冗余二级索引 ====================
+
+def drop_redundant_indexes(conn):
+    # UNIQUE 约束本身就是索引，额外的同列索引只会增加写放大和 buffer pool 占用
+    with conn.cursor() as cursor:
+        if 'idx_email' in _indexes(cursor, 'users'):
+            print("🔄 Dropping users.idx_email ...")
+            cursor.execute('ALTER TABLE users DROP INDEX idx_email, ALGORITHM=INPLACE, LOCK=NONE')
+        if 'idx_token' in _indexes(cursor, 'refresh_tokens'):
+            print("🔄 Dropping refresh_tokens.idx_token ...")
+            cursor.execute('ALTER TABLE refresh_tokens DROP INDEX idx_token, ALGORITHM=INPLACE, LOCK=NONE')
+    conn.commit()
+
+
+# ==================== refresh token 过期索引 ====================
+
+def refresh_token_expiry_index(conn):
+    with conn.cursor() as cursor:
+        if 'idx_expires_at' not in _indexes(cursor, 'refresh_tokens'):
+            print("🔄 Creating refresh_tokens.idx_expires_at ...")
+            cursor.execute('ALTER TABLE refresh_tokens ADD INDEX idx_expires_at (expires_at), ALGORITHM=INPLACE, LOCK=NONE')
+    conn.commit()
+
+
+# ==================== 主键改为按时间排序的 BINARY(16) ====================
+
+# 旧版本本迁移使用的影子列触发器，升级后不再需要
+LEGACY_ID_TRIGGERS = ('users_id_bin_insert', 'refresh_tokens_id_bin_insert')
+
+USER_COLUMNS = (
+    'id', 'email', 'password_hash', 'display_name', 'email_verified', 'verification_token', 'reset_token',
+    'reset_token_expiry', 'created_at', 'updated_at', 'is_anonymous',
+)
+REFRESH_TOKEN_COLUMNS = ('id', 'user_id', 'token_hash', 'expires_at', 'created_at')
+BINARY_COLUMNS = {'id', 'user_id'}
+
+
+def _bin(column, row=''):
+    # UUID 字符串去掉连字符后 UNHEX 即为 BINARY(16)，与 ids.to_db 字节序一致
+    return f"UNHEX(REPLACE({row}{column}, '-', ''))"
+
+
+def _values(columns, row=''):
+    return ', '.join(_bin(column, row) if column in BINARY_COLUMNS else f'{row}{column}' for column in columns)
+
+
+def _sync_triggers(table, columns):
+    # 影子表 {table}_bin 的同步触发器：复制期间直到切换，线上对旧表的每次写入都同步写到影子表
+    shadow = f'{table}_bin'
+    upsert = f"REPLACE INTO {shadow} ({', '.join(columns)}) VALUES ({_values(columns, 'NEW.')})"
+    delete = f"DELETE FROM {shadow} WHERE id = {_bin('id', 'OLD.')};"
+    if table == 'users':
+        # 外键级联删除不会触发 refresh_tokens 上的触发器，由这里一并删除影子表中的 token
+        delete += f" DELETE FROM refresh_tokens_bin WHERE user_id = {_bin('id', 'OLD.')};"
+    return {
+        f'{shadow}_sync_insert': f'AFTER INSERT ON {table} FOR EACH ROW {upsert}',
+        f'{shadow}_sync_update': f'AFTER UPDATE ON {table} FOR EACH ROW {upsert}',
+        f'{shadow}_sync_delete': f'AFTER DELETE ON {table} FOR EACH ROW BEGIN {delete} END',
+    }
+
+
+SHADOW_TABLES = {
+    'users': (
+        schema.USERS_TABLE_DDL.replace('TABLE IF NOT EXISTS users', 'TABLE IF NOT EXISTS users_bin'),
+        USER_COLUMNS,
+    ),
+    # 外键在切换后再加：切换前 users.id 仍是 VARCHAR(36)
+    'refresh_tokens': (
+        schema.REFRESH_TOKENS_TABLE_DDL
+        .replace('TABLE IF NOT EXISTS refresh_tokens', 'TABLE IF NOT EXISTS refresh_tokens_bin')
+        .replace(',\n        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE', ''),
+        REFRESH_TOKEN_COLUMNS,
+    ),
+}
+
+SHADOW_COUNTS = '''
+    SELECT (SELECT COUNT(*) FROM users) AS users, (SELECT COUNT(*) FROM users_bin) AS users_bin,
+           (SELECT COUNT(*) FROM refresh_tokens) AS refresh_tokens,
+           (SELECT COUNT(*) FROM refresh_tokens_bin) AS refresh_tokens_bin
+'''
+
+
+def _column_type(cursor, table, column):
+    cursor.execute(
+        'SELECT data_type FROM information_schema.columns WHERE table_schema = %s AND table_name = %s AND column_name = %s',
+        (app.config['MYSQL_DATABASE'], table, column)
+    )
+    row = cursor.fetchone()
+    return row['data_type'] if row else None
+
+
+def binary_ids(conn, finalize=False):
+    # 影子表 + 同步触发器 + 一次原子 RENAME：users 与 refresh_tokens 同时切换，
+    # 不会出现一张表已是 BINARY(16)、另一张还是 VARCHAR(36)（按 user_id 关联查询全部落空）的中间状态。
+    # --finalize 前所有实例都必须已在运行能读写两种格式的代码（ids.py）：切换后它们几秒内自动改用新格式，
+    # 期间按旧格式写入的请求返回 503 让客户端重试
+    with conn.cursor() as cursor:
+        if _column_type(cursor, 'users', 'id') == 'binary':
+            print("✅ users.id / refresh_tokens.id are already BINARY(16)")
+            return
+        if 'token' in _columns(cursor, 'refresh_tokens'):
+            print("⏭️  Skipping BINARY(16) ids until refresh_tokens.token is dropped (migrate.py --finalize)")
+            return
+
+        for name in LEGACY_ID_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        for table, (ddl, columns) in SHADOW_TABLES.items():
+            print(f"🔄 Creating {table}_bin and its sync triggers ...")
+            cursor.execute(ddl)
+            # 重复执行时不重建已有的触发器，避免删除与重建之间漏掉写入
+            existing = _triggers(cursor, table)
+            for name, body in _sync_triggers(table, columns).items():
+                if name not in existing:
+                    cursor.execute(f'CREATE TRIGGER {name} {body}')
+    conn.commit()
+
+    # 触发器建好后再复制存量数据。FOR SHARE 让并发的更新、删除等本段提交后再执行，随后由触发器覆盖影子表，
+    # 复制不会把刚删除的行写回去；已由触发器写入的行 INSERT IGNORE 跳过
+    for table, (_, columns) in SHADOW_TABLES.items():
+        print(f"🔄 Copying {table} into {table}_bin ...")
+        count = _in_batches(
+            conn, table,
+            f"INSERT IGNORE INTO {table}_bin ({', '.join(columns)}) "
+            f"SELECT {_values(columns)} FROM {table} WHERE {{range}} ORDER BY id FOR SHARE"
+        )
+        print(f"   {count} rows copied")
+    if not finalize:
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute(SHADOW_COUNTS)
+        counts = cursor.fetchone()
+        conn.rollback()
+        if counts['users'] != counts['users_bin'] or counts['refresh_tokens'] != counts['refresh_tokens_bin']:
+            raise SystemExit(f"❌ Shadow tables are out of sync, not switching: {counts}")
+
+        print("🔄 Switching users / refresh_tokens to BINARY(16) keys ...")
+        cursor.execute(
+            'RENAME TABLE users TO users_legacy, users_bin TO users, '
+            'refresh_tokens TO refresh_tokens_legacy, refresh_tokens_bin TO refresh_tokens'
+        )
+        # 同步触发器随旧表改名，其中引用的影子表名已不存在，切换后立即删除
+        for table, (_, columns) in SHADOW_TABLES.items():
+            for name in _sync_triggers(table, columns):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+        # 数据已经一致；关闭外键检查才能以 INPLACE 方式加外键
+        cursor.execute('SET SESSION foreign_key_checks = 0')
+        cursor.execute(
+            'ALTER TABLE refresh_tokens ADD CONSTRAINT fk_refresh_tokens_user FOREIGN KEY (user_id) '
+            'REFERENCES users(id) ON DELETE CASCADE, ALGORITHM=INPLACE, LOCK=NONE'
+        )
+        cursor.execute('SET SESSION foreign_key_checks = 1')
+    conn.commit()
+    print("ℹ️  users_legacy / refresh_tokens_legacy are kept for rollback; drop them once the switch is verified")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DoNow auth database migrations')
+    parser.add_argument('--finalize', action='store_true', help='drop legacy columns after the new code is deployed')
+    parser.add_argument('--status', action='store_true', help='show the schema version and pending migrations, then exit')
+    args = parser.parse_args()
+
+    if args.status:
+        with db_pool.connection() as conn:
+            state = schema.state(conn)
+        print(f"Schema version {state['version']}, latest {schema.LATEST_VERSION}")
+        for number, description, _ in schema.pending(state['version']):
+            print(f"   pending {number}: {description}")
+        for column in state['missing']:
+            print(f"   missing {column} (online migration)")
+        return
+
+    prepare_schema(apply=True)
+    with db_pool.connection() as conn:
+        drop_redundant_indexes(conn)
+        refresh_token_hash(conn, finalize=args.finalize)
+        refresh_token_expiry_index(conn)
+        binary_ids(conn, finalize=args.finalize)
+    state = prepare_schema()
+    if not schema.ready(state):
+        raise SystemExit(f"❌ Schema still incomplete after migration: {state['missing']}")
+    print("✅ Migration finished")
+
+
+if __name__ == '__main__':
+    main()
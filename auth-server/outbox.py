@@ -0,0 +1,249 @@
+"""
+邮件发件箱
+邮件先写入 email_outbox 表（与业务数据同一事务），由固定数量的发送线程复用同一条已认证的 SMTP 连接批量发送，
+失败按指数退避重试，worker 重启也不会丢信
+"""
+
+import os
+import time
+import uuid
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import metrics
+from db_pool import is_connection_error
+
+OUTBOX_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        recipient VARCHAR(255) NOT NULL,
+        subject VARCHAR(255) NOT NULL,
+        html MEDIUMTEXT NOT NULL,
+        status ENUM('pending', 'sending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        next_attempt_at DATETIME NOT NULL,
+        locked_by VARCHAR(36),
+        locked_until DATETIME,
+        last_error VARCHAR(512),
+        created_at DATETIME NOT NULL,
+        sent_at DATETIME,
+        INDEX idx_status_next (status, next_attempt_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+
+ENQUEUE_EMAIL = '''
+    INSERT INTO email_outbox (recipient, subject, html, next_attempt_at, created_at)
+    VALUES (%s, %s, %s, %s, %s)
+'''
+
+
+def email_row(to, subject, html):
+    now = datetime.utcnow()
+    return (to, subject, html, now, now)
+
+
+def enqueue_email(cursor, to, subject, html):
+    # 使用调用方的游标，随业务事务一起提交
+    with metrics.EMAIL.time(op='enqueue'):
+        cursor.execute(ENQUEUE_EMAIL, email_row(to, subject, html))
+
+
+class SMTPConnection:
+    """长连接，空闲过久或断开后自动重建"""
+
+    def __init__(self, server, port, use_tls=False, use_ssl=False, username=None, password=None,
+                 timeout=30, idle_timeout=60):
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._host = None
+        self._last_used = 0.0
+
+    def _open(self):
+        if self.use_ssl:
+            host = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.use_tls:
+            host.starttls()
+        if self.username and self.password:
+            host.login(self.username, self.password)
+        return host
+
+    def send(self, msg):
+        if self._host is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._host is None:
+            self._host = self._open()
+        try:
+            self._host.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # 服务端已关闭长连接，重连后再试一次
+            self._host = self._open()
+            self._host.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._host is not None:
+            try:
+                self._host.quit()
+            except Exception:
+                pass
+            self._host = None
+
+
+class EmailOutbox:
+    def __init__(self, pool, smtp_config, sender, workers=1, batch_size=20, poll_interval=5.0,
+                 max_attempts=8, backoff_base=30, backoff_max=3600, lock_timeout=300):
+        self.pool = pool
+        self.smtp_config = smtp_config
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock_timeout = lock_timeout
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+
+    def start(self):
+        # 每个进程只启动一次；fork 之后在子进程中重新启动
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f'email-outbox-{i}', daemon=True).start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    # ---------- 认领 / 发送 ----------
+
+    def _claim(self, worker_id):
+        now = datetime.utcnow()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                # 认领到期的待发邮件，以及锁已过期（发送线程崩溃）的邮件
+                cursor.execute(
+                    '''UPDATE email_outbox SET status = 'sending', locked_by = %s, locked_until = %s
+                       WHERE (status = 'pending' AND next_attempt_at <= %s)
+                          OR (status = 'sending' AND locked_until < %s)
+                       ORDER BY id LIMIT %s''',
+                    (worker_id, now + timedelta(seconds=self.lock_timeout), now, now, self.batch_size)
+                )
+                claimed = cursor.rowcount
+                conn.commit()
+                if not claimed:
+                    return []
+                cursor.execute(
+                    'SELECT id, recipient, subject, html, attempts FROM email_outbox WHERE locked_by = %s AND status = %s',
+                    (worker_id, 'sending')
+                )
+                rows = cursor.fetchall()
+            conn.commit()
+        return rows
+
+    def _build(self, row):
+        msg = EmailMessage()
+        msg['Subject'] = row['subject']
+        msg['From'] = self.sender
+        msg['To'] = row['recipient']
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid()
+        msg.set_content(row['html'], subtype='html')
+        return msg
+
+    def _record(self, results):
+        now = datetime.utcnow()
+        sent, retry, failed = [], [], []
+        for row, error in results:
+            if error is None:
+                sent.append((now, row['id']))
+                continue
+            attempts = row['attempts'] + 1
+            if attempts >= self.max_attempts:
+                failed.append((attempts, error[:512], row['id']))
+            else:
+                delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                retry.append((attempts, now + timedelta(seconds=delay), error[:512], row['id']))
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                if sent:
+                    cursor.executemany(
+                        '''UPDATE email_outbox SET status = 'sent', sent_at = %s, locked_by = NULL,
+                           locked_until = NULL, html = '' WHERE id = %s''',
+                        sent
+                    )
+                if retry:
+                    cursor.executemany(
+                        '''UPDATE email_outbox SET status = 'pending', attempts = %s, next_attempt_at = %s,
+                           last_error = %s, locked_by = NULL, locked_until = NULL WHERE id = %s''',
+                        retry
+                    )
+                if failed:
+                    cursor.executemany(
+                        '''UPDATE email_outbox SET status = 'failed', attempts = %s, last_error = %s,
+                           locked_by = NULL, locked_until = NULL WHERE id = %s''',
+                        failed
+                    )
+            conn.commit()
+
+        with self._lock:
+            self._sent += len(sent)
+            self._retried += len(retry)
+            self._failed += len(failed)
+
+    def process_batch(self, worker_id, smtp) -> int:
+        rows = self._claim(worker_id)
+        if not rows:
+            return 0
+        results = []
+        for row in rows:
+            try:
+                with metrics.EMAIL.time(op='send'):
+                    smtp.send(self._build(row))
+                results.append((row, None))
+            except Exception as e:
+                print(f"❌ Email sending failed: {e}")
+                smtp.close()
+                results.append((row, str(e)))
+        self._record(results)
+        return len(rows)
+
+    def _run(self):
+        worker_id = str(uuid.uuid4())
+        smtp = SMTPConnection(**self.smtp_config)
+        while True:
+            try:
+                if self.process_batch(worker_id, smtp) >= self.batch_size:
+                    continue
+            except Exception as e:
+                if not is_connection_error(e):
+                    print(f"❌ Email outbox error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sent': self._sent, 'retried': self._retried, 'failed': self._failed}
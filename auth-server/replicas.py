@@ -0,0 +1,123 @@
+"""
+只读副本路由
+纯读查询轮询发往健康的只读副本，写入及读后写路径仍走主库；
+用户自己写入后的一小段时间内（bypass_seconds）该用户的读也回到主库，避免复制延迟造成的旧数据；
+副本连接失败时暂时摘除（retry_after 秒后再试），全部不可用时回退到主库
+"""
+
+import math
+import time
+import hashlib
+import itertools
+import threading
+
+from db_pool import PoolTimeout, is_connection_error
+
+
+class ReplicaUnavailable(Exception):
+    """没有可用的只读副本，调用方应改走主库"""
+
+
+class _Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.failures = 0
+        self.reads = 0
+
+
+class ReplicaSet:
+    def __init__(self, pools, storage, bypass_seconds=5, retry_after=30):
+        # pools: {名称: ConnectionPool}，连接应开启 autocommit，单条只读语句无需提交或回滚
+        self.replicas = [_Replica(name, pool) for name, pool in pools.items()]
+        self.storage = storage  # 与限流共用的共享存储，同机（或 Redis 下所有机器）的 worker 都能看到写入标记
+        self.bypass_seconds = math.ceil(bypass_seconds)  # 用作 incr 的过期时间，Redis 的 EXPIRE 不接受小数
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        self._bypassed = 0
+        self._fallbacks = 0
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    # ---------- 读后写 ----------
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f'replica_bypass/{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}'
+
+    def mark_written(self, *keys):
+        # 写入提交后调用；keys 可以是用户 id、邮箱等读路径用来查找的标识
+        if not self.replicas or not self.bypass_seconds:
+            return
+        for key in keys:
+            if key:
+                # incr 只在创建时设置过期时间，先清除才能从这次写入重新计时
+                self.storage.clear(self._key(key))
+                self.storage.incr(self._key(key), self.bypass_seconds)
+
+    def recently_written(self, *keys) -> bool:
+        if any(key and self.storage.get(self._key(key)) for key in keys):
+            with self._lock:
+                self._bypassed += 1
+            return True
+        return False
+
+    # ---------- 查询 ----------
+
+    def _candidates(self):
+        now = time.monotonic()
+        start = next(self._next)
+        ordered = self.replicas[start % len(self.replicas):] + self.replicas[:start % len(self.replicas)]
+        return [replica for replica in ordered if replica.down_until <= now]
+
+    def fetch_one(self, sql, params):
+        return self._fetch(sql, params, lambda cursor: cursor.fetchone())
+
+    def fetch_all(self, sql, params):
+        return self._fetch(sql, params, lambda cursor: cursor.fetchall())
+
+    def _fetch(self, sql, params, fetch):
+        for replica in self._candidates():
+            try:
+                with replica.pool.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        result = fetch(cursor)
+            except PoolTimeout:
+                continue  # 该副本连接已借满，换下一个，不摘除
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                with self._lock:
+                    replica.failures += 1
+                    replica.down_until = time.monotonic() + self.retry_after
+                print(f"⚠️ Replica {replica.name} unavailable, failing over: {e}")
+                continue
+            with self._lock:
+                replica.reads += 1
+            return result
+        with self._lock:
+            self._fallbacks += 1
+        raise ReplicaUnavailable()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'replicas': [
+                    {
+                        'name': replica.name,
+                        'healthy': replica.down_until <= now,
+                        'reads': replica.reads,
+                        'failures': replica.failures,
+                        'pool': replica.pool.stats(),
+                    }
+                    for replica in self.replicas
+                ],
+                'bypassed': self._bypassed,
+                'fallbacks': self._fallbacks,
+            }
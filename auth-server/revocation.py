@@ -0,0 +1,192 @@
+"""
+access token 吊销列表
+吊销记录写入 revoked_tokens 表（与业务数据同一事务），每个 worker 在内存中维护一个布隆过滤器并增量刷新：
+过滤器未命中即可确定 token 未被吊销，不做任何 I/O；只有命中时才查库确认（误判率由 error_rate 控制）
+"""
+
+import os
+import math
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from db_pool import is_connection_error
+
+REVOCATION_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        kind ENUM('jti', 'user') NOT NULL,
+        value VARCHAR(64) NOT NULL,
+        revoked_at DATETIME(3) NOT NULL,
+        expires_at DATETIME NOT NULL,
+        INDEX idx_value (value),
+        INDEX idx_revoked_at (revoked_at),
+        INDEX idx_expires_at (expires_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+# 增量刷新时回看的秒数：覆盖各机器时钟偏差以及晚于刷新时间点才提交的事务
+LOOKBACK_SECONDS = 60
+
+
+REVOKE = 'INSERT INTO revoked_tokens (kind, value, revoked_at, expires_at) VALUES (%s, %s, %s, %s)'
+
+
+def revoke(cursor, kind, value, expires_at):
+    # kind='jti' 吊销单个 token；kind='user' 吊销该用户此前签发的所有 token。使用调用方的游标，随业务事务一起提交
+    cursor.execute(REVOKE, (kind, value, datetime.utcnow(), expires_at))
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # 双重哈希：一次 blake2b 得到两个 64 位值，组合出 k 个位置
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        if key in self:
+            return
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self, pool, capacity=100000, error_rate=0.001, refresh_interval=5, rebuild_interval=3600):
+        self.pool = pool
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval  # 其他 worker 的吊销最多延迟这么多秒生效
+        self.rebuild_interval = rebuild_interval  # 全量重建，剔除已过期的记录
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._filter = BloomFilter(capacity, error_rate)
+        self._since = None
+        self._rebuilt_at = 0.0
+        self._rebuild_due = True
+        self._ready = False
+
+        self._filter_hits = 0
+        self._db_checks = 0
+        self._false_positives = 0
+        self._refreshes = 0
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='revocation-refresh', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                if not is_connection_error(e):
+                    print(f"❌ Revocation list refresh failed: {e}")
+            time.sleep(self.refresh_interval)
+
+    # ---------- 刷新 ----------
+
+    def refresh(self):
+        now = datetime.utcnow()
+        rebuild = self._rebuild_due or time.monotonic() - self._rebuilt_at >= self.rebuild_interval
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                if rebuild:
+                    cursor.execute(
+                        'SELECT kind, value FROM revoked_tokens WHERE expires_at > %s', (now,)
+                    )
+                else:
+                    cursor.execute(
+                        'SELECT kind, value FROM revoked_tokens WHERE revoked_at >= %s',
+                        (self._since - timedelta(seconds=LOOKBACK_SECONDS),)
+                    )
+                rows = cursor.fetchall()
+            conn.commit()
+
+        if rebuild:
+            # 记录数超过容量时按实际数量扩容，保持误判率
+            bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+            for row in rows:
+                bloom.add(f"{row['kind']}:{row['value']}")
+            with self._lock:
+                self._filter = bloom
+                self._rebuilt_at = time.monotonic()
+                self._rebuild_due = False
+        else:
+            with self._lock:
+                for row in rows:
+                    self._filter.add(f"{row['kind']}:{row['value']}")
+                if self._filter.count > self._filter.capacity:
+                    self._rebuild_due = True  # 增量加入太多，下一轮全量重建
+        with self._lock:
+            self._since = now
+            self._ready = True
+            self._refreshes += 1
+
+    def add(self, kind, value):
+        # 本 worker 的吊销立即生效，不等下一轮刷新
+        with self._lock:
+            self._filter.add(f'{kind}:{value}')
+
+    # ---------- 检查 ----------
+
+    def filter_miss(self, jti, user_id) -> bool:
+        # True 表示确定未被吊销；首次刷新完成前过滤器是空的，不能据此放行
+        if not self._ready:
+            return False
+        bloom = self._filter
+        return f'user:{user_id}' not in bloom and not (jti and f'jti:{jti}' in bloom)
+
+    def is_revoked(self, jti, user_id, issued_at) -> bool:
+        if self.filter_miss(jti, user_id):
+            return False
+
+        with self._lock:
+            self._filter_hits += self._ready
+            self._db_checks += 1
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    '''SELECT 1 FROM revoked_tokens
+                       WHERE (kind = 'jti' AND value = %s)
+                          OR (kind = 'user' AND value = %s AND revoked_at >= %s)
+                       LIMIT 1''',
+                    (jti or '', user_id, datetime.utcfromtimestamp(issued_at))
+                )
+                revoked = cursor.fetchone() is not None
+            conn.commit()
+        if not revoked and self._ready:
+            with self._lock:
+                self._false_positives += 1
+        return revoked
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': self._filter.count,
+                'bits': self._filter.size,
+                'filter_hits': self._filter_hits,
+                'db_checks': self._db_checks,
+                'false_positives': self._false_positives,
+                'refreshes': self._refreshes,
+            }
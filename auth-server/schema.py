@@ -0,0 +1,166 @@
+"""
+版本化表结构迁移
+每个迁移有递增的版本号，执行后记入 schema_version 表；已执行的版本不会重复执行。
+迁移由 `python migrate.py` 显式执行，或在 gunicorn 主进程加载应用时执行一次（SCHEMA_MIGRATE_ON_START），
+worker 只做一次检查（版本号与代码需要的列；--preload 下连这次检查也在主进程完成，fork 出的 worker 直接继承结果），
+版本落后或缺列时服务报告未就绪（/api/health 返回 503）。
+MySQL 的 DDL 会隐式提交，无法与版本记录放进同一个事务，因此每个迁移都必须可以重复执行
+"""
+
+import pymysql
+
+from outbox import OUTBOX_TABLE_DDL
+from revocation import REVOCATION_TABLE_DDL
+
+# 多个主进程 / 多台机器同时启动时只有一个执行迁移，其余等待后直接看到新版本
+MIGRATION_LOCK = 'donow_schema_migration'
+
+SCHEMA_VERSION_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+USERS_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id BINARY(16) PRIMARY KEY,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        display_name VARCHAR(255),
+        email_verified TINYINT(1) DEFAULT 0,
+        verification_token VARCHAR(255),
+        reset_token VARCHAR(255),
+        reset_token_expiry DATETIME,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        is_anonymous TINYINT(1) DEFAULT 0,
+        INDEX idx_verification_token (verification_token),
+        INDEX idx_reset_token (reset_token)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+REFRESH_TOKENS_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS refresh_tokens (
+        id BINARY(16) PRIMARY KEY,
+        user_id BINARY(16) NOT NULL,
+        token_hash BINARY(32) NOT NULL,
+        expires_at DATETIME NOT NULL,
+        created_at DATETIME NOT NULL,
+        UNIQUE INDEX uniq_token_hash (token_hash),
+        INDEX idx_user_id (user_id),
+        INDEX idx_expires_at (expires_at),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+'''
+
+# (版本号, 说明, 语句列表)；只能在末尾追加，已发布的迁移不要修改。
+# 引入版本表之前的库里这些表已经存在，CREATE TABLE IF NOT EXISTS 不会改动它们，只补记版本；
+# 旧库的列类型、索引调整仍由 migrate.py 中的在线迁移完成，其中代码依赖的列由 REQUIRED_COLUMNS 检查
+MIGRATIONS = [
+    (1, 'create users and refresh_tokens', [USERS_TABLE_DDL, REFRESH_TOKENS_TABLE_DDL]),
+    (2, 'create email_outbox', [OUTBOX_TABLE_DDL]),
+    (3, 'create revoked_tokens', [REVOCATION_TABLE_DDL]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+ID_TYPE = '''
+    SELECT data_type AS id_type FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'users' AND column_name = 'id'
+'''
+
+SCHEMA_VERSION = 'SELECT MAX(version) AS version FROM schema_version'
+
+# 代码读写的列。引入版本表之前的旧库中，其中一部分只能由 migrate.py 的在线迁移补齐（如 refresh_tokens.token_hash），
+# 版本号达到要求并不代表这些列已经存在
+REQUIRED_COLUMNS = {
+    'users': (
+        'id', 'email', 'password_hash', 'display_name', 'email_verified', 'verification_token', 'reset_token',
+        'reset_token_expiry', 'created_at', 'updated_at', 'is_anonymous',
+    ),
+    'refresh_tokens': ('id', 'user_id', 'token_hash', 'expires_at', 'created_at'),
+}
+
+COLUMNS = '''
+    SELECT table_name AS table_name, column_name AS column_name, data_type AS data_type, is_nullable AS is_nullable
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name IN ('users', 'refresh_tokens')
+'''
+
+
+class SchemaOutdated(Exception):
+    """库的表结构版本低于代码需要的版本，需要先执行 python migrate.py"""
+
+
+def state(conn) -> dict:
+    # {'version': 已执行的最高版本（没有版本表时为 0）, 'id_type': users.id 的类型（表不存在时为 None），
+    #  'missing': 代码需要但库中还没有的列（在线迁移未完成）}
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(SCHEMA_VERSION)
+            version = cursor.fetchone()['version'] or 0
+        except pymysql.err.ProgrammingError as e:
+            if e.args[0] != 1146:  # Table doesn't exist
+                raise
+            version = 0
+        cursor.execute(COLUMNS)
+        columns = {(row['table_name'], row['column_name']): row for row in cursor.fetchall()}
+
+    missing = [
+        f'{table}.{column}' for table, names in REQUIRED_COLUMNS.items() for column in names
+        if (table, column) not in columns
+    ]
+    # 新代码不再写 refresh_tokens.token，在线迁移把它改为可空之前插入会失败
+    legacy_token = columns.get(('refresh_tokens', 'token'))
+    if legacy_token and legacy_token['is_nullable'] != 'YES':
+        missing.append('refresh_tokens.token NULL')
+    users_id = columns.get(('users', 'id'))
+    return {'version': version, 'id_type': users_id['data_type'] if users_id else None, 'missing': missing}
+
+
+def ready(current) -> bool:
+    return current['version'] >= LATEST_VERSION and not current['missing']
+
+
+def pending(version):
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(conn, lock_timeout=60) -> dict:
+    # 执行所有未执行的迁移并返回迁移后的 state；已是最新版本时只有一次查询，不取锁
+    current = state(conn)
+    if current['version'] >= LATEST_VERSION:
+        return current
+
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT GET_LOCK(%s, %s) AS locked', (MIGRATION_LOCK, lock_timeout))
+        if not cursor.fetchone()['locked']:
+            raise SchemaOutdated(f'timed out waiting for migration lock {MIGRATION_LOCK}')
+    conn.rollback()  # 结束 state() 打开的一致性读快照，下面才能看到等锁期间其他实例写入的版本
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA_VERSION_TABLE_DDL)
+            # 等锁期间其他实例可能已经执行完
+            cursor.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+            version = cursor.fetchone()['version']
+            for number, description, statements in pending(version):
+                print(f"🔄 Applying schema migration {number}: {description} ...")
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    'INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, UTC_TIMESTAMP())',
+                    (number, description)
+                )
+                conn.commit()
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT RELEASE_LOCK(%s)', (MIGRATION_LOCK,))
+    return state(conn)
+
+
+def applied(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT version, description, applied_at FROM schema_version ORDER BY version')
+        return cursor.fetchall()
@@ -4,22 +4,43 @@ DoNow Authentication Server
 """
 
 import os
-import uuid
+import json
+import math
+import time
+import base64
+import atexit
+import hashlib
 import secrets
+import tempfile
 from datetime import datetime, timedelta
 from functools import wraps
-from threading import Thread
 
-import bcrypt
 import jwt
 import pymysql
-from flask import Flask, request, jsonify, g, render_template_string, redirect, url_for
+from flask import Flask, Response, request, jsonify, g, redirect, url_for
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_mail import Mail, Message
+from limits.storage import storage_from_string
 from dotenv import load_dotenv
 
+import metrics
+from db_pool import ConnectionPool, PoolTimeout, ReadinessCheck, is_connection_error
+from hashing import PasswordHasher, HashQueueFull, load_or_calibrate, scheme_of
+from write_behind import WriteBehindBuffer
+from outbox import EmailOutbox, enqueue_email
+from sweeper import TokenSweeper
+from shared_cache import SharedTTLCache, default_cache_dir
+from token_cache import VerifiedTokenCache
+import shm_limiter  # noqa: F401  注册 shm:// 限流存储
+from login_guard import LoginGuard
+from keys import KeyRing
+from revocation import RevocationList, revoke
+import ids
+import schema
+from ids import new_id, to_db, from_db
+from replicas import ReplicaSet, ReplicaUnavailable
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -28,7 +49,26 @@ CORS(app)
 # 配置
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
 app.config['JWT_EXPIRATION_HOURS'] = int(os.getenv('JWT_EXPIRATION_HOURS', 24 * 7))  # 7天
+# 非对称签名：下游服务通过 /.well-known/jwks.json 的公钥本地验证 token
+app.config['JWT_ALGORITHM'] = os.getenv('JWT_ALGORITHM', 'EdDSA')  # EdDSA 或 HS256
+app.config['JWT_KEYS_DIR'] = os.getenv('JWT_KEYS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys'))
+app.config['JWT_KEY_ACTIVATION_DELAY'] = int(os.getenv('JWT_KEY_ACTIVATION_DELAY', 300))  # 秒，新密钥发布多久后开始签名
+app.config['JWKS_MAX_AGE'] = int(os.getenv('JWKS_MAX_AGE', 300))  # 秒，应不大于 JWT_KEY_ACTIVATION_DELAY
+# 迁移期间继续接受改造前签发的 HS256 token
+app.config['JWT_ACCEPT_HS256'] = os.getenv('JWT_ACCEPT_HS256', 'true').lower() == 'true'
 app.config['FRONTEND_URL'] = os.getenv('FRONTEND_URL', 'http://localhost:5000')
+app.config['JWT_CACHE_SIZE'] = int(os.getenv('JWT_CACHE_SIZE', 10000))  # 每个 worker 缓存的已验证 token 数，0 为关闭
+# /api/auth/me 的用户资料缓存（同机 worker 共享），TTL 秒数为 0 时关闭
+app.config['PROFILE_CACHE_TTL'] = int(os.getenv('PROFILE_CACHE_TTL', 60))
+app.config['PROFILE_CACHE_SIZE'] = int(os.getenv('PROFILE_CACHE_SIZE', 100000))
+app.config['PROFILE_CACHE_PATH'] = os.getenv(
+    'PROFILE_CACHE_PATH', os.path.join(default_cache_dir(), 'donow_profiles.sqlite')
+)
+# 刷新宽限期：刚轮换掉的 refresh token 在此秒数内再次提交，返回同一对新 token（0 为关闭）
+app.config['REFRESH_GRACE_SECONDS'] = int(os.getenv('REFRESH_GRACE_SECONDS', 10))
+app.config['REFRESH_GRACE_CACHE_PATH'] = os.getenv(
+    'REFRESH_GRACE_CACHE_PATH', os.path.join(default_cache_dir(), 'donow_refresh_grace.sqlite')
+)
 
 # MySQL 配置
 app.config['MYSQL_HOST'] = os.getenv('MYSQL_HOST', 'localhost')
@@ -36,6 +76,84 @@ app.config['MYSQL_PORT'] = int(os.getenv('MYSQL_PORT', 3306))
 app.config['MYSQL_USER'] = os.getenv('MYSQL_USER', 'root')
 app.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD', '')
 app.config['MYSQL_DATABASE'] = os.getenv('MYSQL_DATABASE', 'donow_auth')
+app.config['MYSQL_POOL_SIZE'] = int(os.getenv('MYSQL_POOL_SIZE', 10))
+app.config['MYSQL_POOL_MAX_AGE'] = int(os.getenv('MYSQL_POOL_MAX_AGE', 3600))  # 秒，超过后重建连接
+app.config['MYSQL_POOL_TIMEOUT'] = float(os.getenv('MYSQL_POOL_TIMEOUT', 10))  # 秒，等待空闲连接的上限
+app.config['MYSQL_POOL_PING_AFTER'] = float(os.getenv('MYSQL_POOL_PING_AFTER', 5))  # 秒，空闲超过后借出前先 ping
+# 加载应用时是否执行未完成的表结构迁移；关闭后只检查版本，迁移由 python migrate.py 显式执行
+app.config['SCHEMA_MIGRATE_ON_START'] = os.getenv('SCHEMA_MIGRATE_ON_START', 'true').lower() == 'true'
+app.config['ASYNC_MYSQL_POOL_SIZE'] = int(os.getenv('ASYNC_MYSQL_POOL_SIZE', 50))  # ASGI 模式下每个进程的连接数
+# 只读副本：逗号分隔的 host:port，为空则所有查询都走主库；账号与库名默认与主库相同
+app.config['MYSQL_REPLICAS'] = [host.strip() for host in os.getenv('MYSQL_REPLICAS', '').split(',') if host.strip()]
+app.config['MYSQL_REPLICA_USER'] = os.getenv('MYSQL_REPLICA_USER', app.config['MYSQL_USER'])
+app.config['MYSQL_REPLICA_PASSWORD'] = os.getenv('MYSQL_REPLICA_PASSWORD', app.config['MYSQL_PASSWORD'])
+app.config['MYSQL_REPLICA_POOL_SIZE'] = int(os.getenv('MYSQL_REPLICA_POOL_SIZE', app.config['MYSQL_POOL_SIZE']))
+# 用户写入后多少秒内读主库；作为共享存储的过期时间，Redis 的 EXPIRE 只接受整数秒
+app.config['REPLICA_BYPASS_SECONDS'] = math.ceil(float(os.getenv('REPLICA_BYPASS_SECONDS', 5)))
+app.config['REPLICA_RETRY_SECONDS'] = float(os.getenv('REPLICA_RETRY_SECONDS', 30))  # 故障副本摘除多久后重试
+app.config['WRITE_BEHIND_BATCH_SIZE'] = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 500))
+app.config['WRITE_BEHIND_INTERVAL_MS'] = int(os.getenv('WRITE_BEHIND_INTERVAL_MS', 50))
+
+# access token 吊销：每个 worker 的布隆过滤器容量、误判率、增量刷新间隔（秒）
+app.config['REVOCATION_FILTER_CAPACITY'] = int(os.getenv('REVOCATION_FILTER_CAPACITY', 100000))
+app.config['REVOCATION_FILTER_ERROR_RATE'] = float(os.getenv('REVOCATION_FILTER_ERROR_RATE', 0.001))
+app.config['REVOCATION_REFRESH_INTERVAL'] = float(os.getenv('REVOCATION_REFRESH_INTERVAL', 5))
+
+# 过期 refresh token 清理
+app.config['SWEEPER_ENABLED'] = os.getenv('SWEEPER_ENABLED', 'true').lower() == 'true'
+app.config['SWEEPER_INTERVAL'] = int(os.getenv('SWEEPER_INTERVAL', 3600))  # 秒
+app.config['SWEEPER_BATCH_SIZE'] = int(os.getenv('SWEEPER_BATCH_SIZE', 1000))
+app.config['OUTBOX_RETENTION_DAYS'] = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))  # 已发送 / 失败邮件的保留天数，0 为不删除
+
+# 限流存储：默认同机 worker 共享的内存映射计数表；多机部署改为 redis://host:6379/0
+app.config['RATELIMIT_STORAGE_URI'] = os.getenv(
+    'RATELIMIT_STORAGE_URI', f"shm://{os.path.join(default_cache_dir(), 'donow_ratelimit.bin')}"
+)
+app.config['RATELIMIT_STRATEGY'] = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'  # 仅压测时关闭
+
+# 按账户的登录失败锁定：窗口内失败 LOGIN_FAIL_THRESHOLD 次后锁定，时长从 LOGIN_LOCKOUT_BASE 秒起翻倍
+app.config['LOGIN_FAIL_THRESHOLD'] = int(os.getenv('LOGIN_FAIL_THRESHOLD', 5))
+app.config['LOGIN_FAIL_WINDOW'] = int(os.getenv('LOGIN_FAIL_WINDOW', 3600))
+app.config['LOGIN_LOCKOUT_BASE'] = int(os.getenv('LOGIN_LOCKOUT_BASE', 30))
+app.config['LOGIN_LOCKOUT_MAX'] = int(os.getenv('LOGIN_LOCKOUT_MAX', 3600))
+# shm:// 下锁定使用单独的计数表：限流、副本绕行等条目再多也挤不掉锁定，锁定条目过期前不会被淘汰
+app.config['LOGIN_GUARD_STORAGE_URI'] = os.getenv(
+    'LOGIN_GUARD_STORAGE_URI',
+    f"shm://{os.path.join(default_cache_dir(), 'donow_login_guard.bin')}?slots=262144&pinned=login_lock/"
+    if app.config['RATELIMIT_STORAGE_URI'].startswith('shm://') else app.config['RATELIMIT_STORAGE_URI']
+)
+
+# 监控：/metrics 汇总同机所有 worker 写在 METRICS_DIR 中的指标快照；设置 METRICS_TOKEN 后抓取需带 Bearer token
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', os.path.join(default_cache_dir(), 'donow_metrics'))
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # 秒
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['HEALTH_CHECK_TTL'] = float(os.getenv('HEALTH_CHECK_TTL', 2))  # 秒，/api/health 复用数据库 ping 结果的时间
+# 慢请求剖析：按比例抽样启用 cProfile，耗时超过 SLOW_REQUEST_MS 的保存 .prof 文件（0 为关闭抽样）
+app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', 500))
+app.config['SLOW_PROFILE_SAMPLE_RATE'] = float(os.getenv('SLOW_PROFILE_SAMPLE_RATE', 0))
+app.config['SLOW_PROFILE_DIR'] = os.getenv('SLOW_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'donow_profiles'))
+app.config['SLOW_PROFILE_KEEP'] = int(os.getenv('SLOW_PROFILE_KEEP', 50))
+
+# 密码哈希工作池（每个 worker 独立）：默认把本机核数平分给各 web worker，避免 worker 数 × 核数个 bcrypt 进程抢 CPU。
+# WEB_CONCURRENCY 同时是 gunicorn 与 uvicorn --workers 的默认 worker 数
+app.config['WEB_CONCURRENCY'] = int(os.getenv('WEB_CONCURRENCY', 4))
+app.config['HASH_WORKERS'] = int(os.getenv('HASH_WORKERS', max(1, (os.cpu_count() or 1) // app.config['WEB_CONCURRENCY'])))
+app.config['HASH_QUEUE_SIZE'] = int(os.getenv('HASH_QUEUE_SIZE', app.config['HASH_WORKERS'] * 4))
+app.config['HASH_RETRY_AFTER'] = int(os.getenv('HASH_RETRY_AFTER', 2))  # 秒，队列满时告知客户端的重试间隔
+# bcrypt cost：BCRYPT_COST 为 0 时启动时按 BCRYPT_TARGET_MS 校准，结果限制在 [BCRYPT_MIN_COST, BCRYPT_MAX_COST]
+app.config['BCRYPT_COST'] = int(os.getenv('BCRYPT_COST', 0))
+app.config['BCRYPT_TARGET_MS'] = int(os.getenv('BCRYPT_TARGET_MS', 250))
+app.config['BCRYPT_MIN_COST'] = int(os.getenv('BCRYPT_MIN_COST', 10))
+app.config['BCRYPT_MAX_COST'] = int(os.getenv('BCRYPT_MAX_COST', 16))
+app.config['BCRYPT_CALIBRATION_PATH'] = os.getenv(
+    'BCRYPT_CALIBRATION_PATH', os.path.join(default_cache_dir(), 'donow_bcrypt_cost.json')
+)
+app.config['BCRYPT_REHASH_ON_LOGIN'] = os.getenv('BCRYPT_REHASH_ON_LOGIN', 'true').lower() == 'true'
+app.config['BCRYPT_COST_MIX_INTERVAL'] = int(os.getenv('BCRYPT_COST_MIX_INTERVAL', 600))  # 秒，统计用户表 cost 分布的间隔，0 为关闭
+# 从 Firebase 导入的 scrypt 哈希：项目的 base64 signer key 与 salt separator（Firebase 控制台“密码哈希参数”）
+app.config['FIREBASE_SCRYPT_SIGNER_KEY'] = os.getenv('FIREBASE_SCRYPT_SIGNER_KEY', '')
+app.config['FIREBASE_SCRYPT_SALT_SEPARATOR'] = os.getenv('FIREBASE_SCRYPT_SALT_SEPARATOR', 'Bw==')
 
 # 邮件配置
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'localhost')
@@ -45,37 +163,52 @@ app.config['MAIL_USE_SSL'] = os.getenv('MAIL_USE_SSL', 'false').lower() == 'true
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@donow.local')
+app.config['OUTBOX_WORKERS'] = int(os.getenv('OUTBOX_WORKERS', 1))
+app.config['OUTBOX_BATCH_SIZE'] = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+app.config['OUTBOX_POLL_INTERVAL'] = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))  # 秒
+app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
 
-mail = Mail(app)
+password_hasher = PasswordHasher(
+    workers=app.config['HASH_WORKERS'],
+    queue_size=app.config['HASH_QUEUE_SIZE'],
+    cost=app.config['BCRYPT_COST'] or load_or_calibrate(
+        app.config['BCRYPT_CALIBRATION_PATH'],
+        app.config['BCRYPT_TARGET_MS'],
+        min_cost=app.config['BCRYPT_MIN_COST'],
+        max_cost=app.config['BCRYPT_MAX_COST']
+    ),
+    firebase_scrypt=(
+        base64.b64decode(app.config['FIREBASE_SCRYPT_SIGNER_KEY']),
+        base64.b64decode(app.config['FIREBASE_SCRYPT_SALT_SEPARATOR'])
+    ) if app.config['FIREBASE_SCRYPT_SIGNER_KEY'] else None
+)
+
+# 登录失败计数与限流共用同一个共享存储
+login_guard = LoginGuard(
+    storage_from_string(app.config['LOGIN_GUARD_STORAGE_URI']),
+    threshold=app.config['LOGIN_FAIL_THRESHOLD'],
+    base_lockout=app.config['LOGIN_LOCKOUT_BASE'],
+    max_lockout=app.config['LOGIN_LOCKOUT_MAX'],
+    window=app.config['LOGIN_FAIL_WINDOW'],
+    cost_estimate=lambda: password_hasher.stats()['hash_time']['avg_ms'] / 1000
+)
 
 # 限流
+DEFAULT_LIMITS = ["200 per day", "50 per hour"]
+
+def count_rate_limit_breach(request_limit):
+    metrics.REJECTIONS.inc(reason='ratelimit')  # 返回 None，仍由 Flask-Limiter 生成 429 响应
+
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    default_limits=DEFAULT_LIMITS,
+    storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+    strategy=app.config['RATELIMIT_STRATEGY'],
+    on_breach=count_rate_limit_breach
 )
 
 
-# ==================== 邮件发送 ====================
-
-def send_async_email(app, msg):
-    with app.app_context():
-        try:
-            mail.send(msg)
-        except Exception as e:
-            print(f"❌ Email sending failed: {e}")
-
-def send_email(to, subject, template_html):
-    msg = Message(
-        subject,
-        recipients=[to],
-        html=template_html
-    )
-    # 异步发送，不阻塞 API
-    Thread(target=send_async_email, args=(app, msg)).start()
-
-
 # ==================== HTML 模板 ====================
 
 HTML_VERIFY_EMAIL = """
@@ -121,103 +254,435 @@ HTML_RESET_PASSWORD = """
 </html>
 """
 
+# 模板只编译一次
+verify_email_template = app.jinja_env.from_string(HTML_VERIFY_EMAIL)
+reset_password_template = app.jinja_env.from_string(HTML_RESET_PASSWORD)
+
 # ==================== 数据库 ====================
 
+# 每条语句的耗时按主库 / 副本记录到 donow_db_query_duration_seconds
+PrimaryCursor = metrics.timed_cursor('primary')
+ReplicaCursor = metrics.timed_cursor('replica')
+
+def _connect(database=True):
+    return pymysql.connect(
+        host=app.config['MYSQL_HOST'],
+        port=app.config['MYSQL_PORT'],
+        user=app.config['MYSQL_USER'],
+        password=app.config['MYSQL_PASSWORD'],
+        database=app.config['MYSQL_DATABASE'] if database else None,
+        charset='utf8mb4',
+        cursorclass=PrimaryCursor
+    )
+
+db_pool = ConnectionPool(
+    _connect,
+    size=app.config['MYSQL_POOL_SIZE'],
+    max_age=app.config['MYSQL_POOL_MAX_AGE'],
+    timeout=app.config['MYSQL_POOL_TIMEOUT'],
+    ping_after=app.config['MYSQL_POOL_PING_AFTER']
+)
+
+def _connect_replica(address):
+    host, _, port = address.partition(':')
+    return pymysql.connect(
+        host=host,
+        port=int(port or 3306),
+        user=app.config['MYSQL_REPLICA_USER'],
+        password=app.config['MYSQL_REPLICA_PASSWORD'],
+        database=app.config['MYSQL_DATABASE'],
+        charset='utf8mb4',
+        cursorclass=ReplicaCursor,
+        autocommit=True,    # 只执行单条只读语句，不需要事务
+        connect_timeout=2   # 副本宕机时尽快切换
+    )
+
+# 与限流共用的共享存储（shm:// 为同机所有 worker，Redis 为所有机器）：读后写标记、cost 分布统计的轮值
+shared_storage = storage_from_string(app.config['RATELIMIT_STORAGE_URI'])
+
+replicas = ReplicaSet(
+    {
+        address: ConnectionPool(
+            lambda address=address: _connect_replica(address),
+            size=app.config['MYSQL_REPLICA_POOL_SIZE'],
+            max_age=app.config['MYSQL_POOL_MAX_AGE'],
+            timeout=min(1.0, app.config['MYSQL_POOL_TIMEOUT']),  # 借满时尽快换下一个副本或主库
+            ping_after=app.config['MYSQL_POOL_PING_AFTER']
+        )
+        for address in app.config['MYSQL_REPLICAS']
+    },
+    shared_storage,
+    bypass_seconds=app.config['REPLICA_BYPASS_SECONDS'],
+    retry_after=app.config['REPLICA_RETRY_SECONDS']
+)
+
+readiness = ReadinessCheck(db_pool, ttl=app.config['HEALTH_CHECK_TTL'])
+
 def get_db():
     if 'db' not in g:
-        g.db = pymysql.connect(
-            host=app.config['MYSQL_HOST'],
-            port=app.config['MYSQL_PORT'],
-            user=app.config['MYSQL_USER'],
-            password=app.config['MYSQL_PASSWORD'],
-            database=app.config['MYSQL_DATABASE'],
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        g.db = db_pool.acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release(db, broken=exception is not None and is_connection_error(exception))
 
-def init_db():
-    conn = pymysql.connect(
-        host=app.config['MYSQL_HOST'],
-        port=app.config['MYSQL_PORT'],
-        user=app.config['MYSQL_USER'],
-        password=app.config['MYSQL_PASSWORD'],
-        charset='utf8mb4'
-    )
+def read_one(sql, params, fresh_keys=(), retry_on_miss=False):
+    # 单条只读查询：优先走只读副本；fresh_keys 中任一标识刚被写入、副本全部不可用，
+    # 或 retry_on_miss 时副本上查不到（复制延迟），改走主库
+    if replicas and not replicas.recently_written(*fresh_keys):
+        try:
+            row = replicas.fetch_one(sql, params)
+            if row is not None or not retry_on_miss:
+                return row
+        except ReplicaUnavailable:
+            pass
+    db = get_db()
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+INSERT_REFRESH_TOKEN = 'INSERT INTO refresh_tokens (id, user_id, token_hash, expires_at, created_at) VALUES (%s, %s, %s, %s, %s)'
+
+# 匿名账户的高频写入（users + refresh_tokens）与并发请求合并成多行 INSERT，等批次提交后再返回；
+# 登录后的重新哈希也走这里，只入队不等待，不占请求线程
+write_buffer = WriteBehindBuffer(
+    db_pool,
+    {
+        # VALUES 中只能有占位符，pymysql 才会把 executemany 合并成一条多行 INSERT
+        'users': '''INSERT INTO users (id, email, password_hash, is_anonymous, email_verified, created_at, updated_at)
+                     VALUES (%s, %s, %s, %s, %s, %s, %s)''',
+        'refresh_tokens': INSERT_REFRESH_TOKEN,
+        # 条件更新：重新哈希期间密码被重置则放弃
+        'password_rehash': 'UPDATE users SET password_hash = %s, updated_at = %s WHERE id = %s AND password_hash = %s',
+    },
+    batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+    interval=app.config['WRITE_BEHIND_INTERVAL_MS'] / 1000
+)
+atexit.register(write_buffer.flush)
+
+# ==================== 邮件发送 ====================
+
+email_outbox = EmailOutbox(
+    db_pool,
+    smtp_config={
+        'server': app.config['MAIL_SERVER'],
+        'port': app.config['MAIL_PORT'],
+        'use_tls': app.config['MAIL_USE_TLS'],
+        'use_ssl': app.config['MAIL_USE_SSL'],
+        'username': app.config['MAIL_USERNAME'],
+        'password': app.config['MAIL_PASSWORD'],
+    },
+    sender=app.config['MAIL_DEFAULT_SENDER'],
+    workers=app.config['OUTBOX_WORKERS'],
+    batch_size=app.config['OUTBOX_BATCH_SIZE'],
+    poll_interval=app.config['OUTBOX_POLL_INTERVAL'],
+    max_attempts=app.config['OUTBOX_MAX_ATTEMPTS']
+)
+
+token_sweeper = TokenSweeper(
+    db_pool,
+    app.config['MYSQL_DATABASE'],
+    batch_size=app.config['SWEEPER_BATCH_SIZE'],
+    interval=app.config['SWEEPER_INTERVAL'],
+    outbox_retention_days=app.config['OUTBOX_RETENTION_DAYS']
+)
+
+revocations = RevocationList(
+    db_pool,
+    capacity=app.config['REVOCATION_FILTER_CAPACITY'],
+    error_rate=app.config['REVOCATION_FILTER_ERROR_RATE'],
+    refresh_interval=app.config['REVOCATION_REFRESH_INTERVAL']
+)
+
+# 各 worker 共享的刷新结果缓存，吸收同一 refresh token 的并发刷新
+refresh_grace_cache = SharedTTLCache(app.config['REFRESH_GRACE_CACHE_PATH'])
+
+# 只保存公开字段，任何修改用户的路径都要调用 invalidate_profile
+profile_cache = SharedTTLCache(app.config['PROFILE_CACHE_PATH'], max_entries=app.config['PROFILE_CACHE_SIZE'])
+
+def invalidate_profile(user_id: str):
+    # 在写入提交之后调用，缓存出错不能让请求失败；等锁超时多为瞬时争用，再试一次，仍失败则旧资料最多保留 TTL 秒
+    if app.config['PROFILE_CACHE_TTL'] and not profile_cache.delete(user_id):
+        profile_cache.delete(user_id)
+
+# ==================== 监控 ====================
+
+metrics_exporter = metrics.MetricsExporter(app.config['METRICS_DIR'], flush_interval=app.config['METRICS_FLUSH_INTERVAL'])
+request_profiler = metrics.RequestProfiler(
+    sample_rate=app.config['SLOW_PROFILE_SAMPLE_RATE'],
+    slow_ms=app.config['SLOW_REQUEST_MS'],
+    directory=app.config['SLOW_PROFILE_DIR'],
+    keep=app.config['SLOW_PROFILE_KEEP']
+)
+
+def collect_component_metrics():
+    # 各组件自己维护的计数在写快照 / 抓取前转成指标
+    pools = {'primary': db_pool, **{replica.name: replica.pool for replica in replicas.replicas}}
+    for name, pool in pools.items():
+        stats = pool.stats()
+        for state in ('in_use', 'idle', 'waiting'):
+            metrics.DB_CONNECTIONS.set(stats[state], pool=name, state=state)
+        metrics.DB_CONNECTION_EVENTS.set(stats['created'], pool=name, event='created')
+        metrics.DB_CONNECTION_EVENTS.set(stats['recycled'], pool=name, event='recycled')
+    metrics.BCRYPT_PENDING.set(password_hasher.stats()['pending'])
+    metrics.WRITE_BEHIND_PENDING.set(write_buffer.stats()['pending'])
+    outbox = email_outbox.stats()
+    for result in ('sent', 'retried', 'failed'):
+        metrics.EMAILS.set(outbox[result], result=result)
+    for name, cache in (('jwt', verified_tokens), ('profile', profile_cache), ('refresh_grace', refresh_grace_cache)):
+        stats = cache.stats()
+        metrics.CACHE_LOOKUPS.set(stats['hits'], cache=name, result='hit')
+        metrics.CACHE_LOOKUPS.set(stats['misses'], cache=name, result='miss')
+
+COST_MIX = '''
+    SELECT IF(password_hash LIKE '$2%', SUBSTRING(password_hash, 5, 2), SUBSTRING_INDEX(password_hash, '$', 2)) AS cost,
+           COUNT(*) AS users
+    FROM users WHERE password_hash LIKE '$%' GROUP BY cost
+'''
+COST_MIX_KEY = 'cost_mix/scan'
+_cost_mix_checked = None
+
+def collect_cost_mix():
+    # 整表扫描：每 BCRYPT_COST_MIX_INTERVAL 秒只由共享存储上抢到轮值的一个 worker 执行（shm:// 为每台机器一个，
+    # Redis 为整个集群一个），配置了只读副本时在副本上执行，主库只在副本全部不可用时承担
+    global _cost_mix_checked
+    interval = app.config['BCRYPT_COST_MIX_INTERVAL']
+    if not interval or (_cost_mix_checked is not None and time.monotonic() - _cost_mix_checked < interval):
+        return
+    _cost_mix_checked = time.monotonic()
+    if shared_storage.incr(COST_MIX_KEY, interval) != 1:
+        # 本轮已由其他 worker 统计；不再报告自己上一轮的旧数，合并时只剩最新一次的结果
+        metrics.BCRYPT_COST_USERS.clear()
+        return
+
+    rows = None
+    if replicas:
+        try:
+            rows = replicas.fetch_all(COST_MIX, None)  # 不带参数：() 会让 pymysql 把 LIKE '$2%' 当作格式串
+        except ReplicaUnavailable:
+            pass
+    if rows is None:
+        with db_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(COST_MIX)
+                rows = cursor.fetchall()
+            conn.commit()
+    metrics.BCRYPT_COST_USERS.clear()
+    for row in rows:
+        # bcrypt 为 cost 数字，导入的 Firebase 哈希为 firebase-scrypt
+        cost = row['cost'].lstrip('$')
+        metrics.BCRYPT_COST_USERS.set(row['users'], cost=int(cost) if cost.isdigit() else cost)
+
+metrics_exporter.add_collector(collect_component_metrics)
+metrics_exporter.add_collector(collect_cost_mix)
+
+@app.before_request
+def start_background_workers():
+    email_outbox.start()
+    revocations.start()
+    metrics_exporter.start()
+    if app.config['SWEEPER_ENABLED']:
+        token_sweeper.start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profiler = request_profiler.begin()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'  # 按路由模板聚合，避免标签基数爆炸
+        metrics.HTTP_LATENCY.observe(elapsed, method=request.method, route=route)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        request_profiler.end(g.pop('profiler', None), request.method, route, elapsed)
+    return response
+
+@app.teardown_request
+def release_profiler(exception):
+    # 未经过 after_request（异常直接抛出）时也要停止剖析
+    request_profiler.discard(g.pop('profiler', None))
+
+@app.errorhandler(HashQueueFull)
+def handle_hash_queue_full(e):
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = str(app.config['HASH_RETRY_AFTER'])
+    return response, 503
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    metrics.REJECTIONS.inc(reason='db_pool_timeout')
+    return jsonify({'error': 'Server busy, please retry'}), 503
+
+@app.errorhandler(pymysql.err.DataError)
+def handle_data_error(e):
+    # 1406：字符串 id 写进了刚由 migrate.py --finalize 切换成 BINARY(16) 的列，重新检测格式后客户端重试即可
+    if e.args[0] == 1406 and (ids.recheck() or ids.switched()):
+        response = jsonify({'error': 'Server busy, please retry'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    app.log_exception((type(e), e, e.__traceback__))
+    return jsonify({'error': 'Internal server error'}), 500
+
+def _detect_id_type():
+    # 用单独的连接：调用方可能正占用着连接池里的连接
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(schema.ID_TYPE)
+            row = cursor.fetchone()
+        return row['id_type'] if row else None
+    finally:
+        conn.close()
+
+ids.configure(_detect_id_type)
+
+# 表结构检查结果，启动时由 prepare_schema 设置；未就绪（检查失败、版本落后或缺列）时 /api/health 返回 503
+schema_status = {'ready': False, 'version': None, 'expected': schema.LATEST_VERSION, 'missing': [], 'error': None}
+_schema_checked_at = 0.0
+
+def _create_database():
+    # 数据库尚不存在时池中的连接无法建立，只在这种情况下单独连一次
+    conn = _connect(database=False)
     try:
         with conn.cursor() as cursor:
             cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{app.config['MYSQL_DATABASE']}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            cursor.execute(f"USE `{app.config['MYSQL_DATABASE']}`")
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id VARCHAR(36) PRIMARY KEY,
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    display_name VARCHAR(255),
-                    email_verified TINYINT(1) DEFAULT 0,
-                    verification_token VARCHAR(255),
-                    reset_token VARCHAR(255),
-                    reset_token_expiry DATETIME,
-                    created_at DATETIME NOT NULL,
-                    updated_at DATETIME NOT NULL,
-                    is_anonymous TINYINT(1) DEFAULT 0,
-                    INDEX idx_email (email),
-                    INDEX idx_verification_token (verification_token),
-                    INDEX idx_reset_token (reset_token)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS refresh_tokens (
-                    id VARCHAR(36) PRIMARY KEY,
-                    user_id VARCHAR(36) NOT NULL,
-                    token VARCHAR(255) UNIQUE NOT NULL,
-                    expires_at DATETIME NOT NULL,
-                    created_at DATETIME NOT NULL,
-                    INDEX idx_token (token),
-                    INDEX idx_user_id (user_id),
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            ''')
         conn.commit()
-        print("✅ Database initialized successfully")
     finally:
         conn.close()
 
+def prepare_schema(apply=False):
+    # apply=True 时执行未完成的版本化迁移，否则只查询一次版本；顺带检测 users.id 的存储格式。
+    # 用单独的连接而不是连接池：--preload 下在 gunicorn 主进程执行，不能留下会被 worker 继承的连接
+    try:
+        conn = _connect()
+    except pymysql.err.OperationalError as e:
+        if e.args[0] != 1049 or not apply:  # Unknown database
+            raise
+        _create_database()
+        conn = _connect()
+    try:
+        state = schema.migrate(conn) if apply else schema.state(conn)
+    finally:
+        conn.close()
+
+    # 在线迁移（migrate.py --finalize）完成前 id 仍是 VARCHAR(36)
+    ids.observe(state['id_type'])
+    changed = (schema_status['version'], schema_status['missing']) != (state['version'], state['missing'])
+    schema_status.update(
+        ready=schema.ready(state), version=state['version'], missing=state['missing'], error=None
+    )
+    # 未就绪时健康检查会反复调用，只在结果变化时输出
+    if changed and state['version'] < schema.LATEST_VERSION:
+        print(f"⚠️ Database schema is at version {state['version']}, expected {schema.LATEST_VERSION}: run python migrate.py")
+    elif changed and state['missing']:
+        print(f"⚠️ Database is missing {', '.join(state['missing'])}: run python migrate.py")
+    elif changed:
+        print(f"✅ Database schema is at version {state['version']}")
+    return state
+
+def recheck_schema():
+    # 未就绪时随健康检查重新检查（只检查不迁移），最多每 HEALTH_CHECK_TTL 秒一次：
+    # 启动时数据库不可用，或之后由 migrate.py 补齐了迁移，都不需要重启即可恢复就绪
+    global _schema_checked_at
+    if time.monotonic() - _schema_checked_at < app.config['HEALTH_CHECK_TTL']:
+        return
+    _schema_checked_at = time.monotonic()
+    try:
+        prepare_schema()
+    except Exception as e:
+        schema_status.update(ready=False, error=str(e) or type(e).__name__)
+
 # ==================== 辅助函数 ====================
 
-def generate_token(user_id: str, email: str) -> dict:
+key_ring = KeyRing(app.config['JWT_KEYS_DIR'], activation_delay=app.config['JWT_KEY_ACTIVATION_DELAY'])
+
+def encode_access_token(payload: dict) -> str:
+    if app.config['JWT_ALGORITHM'] == 'EdDSA':
+        kid, private_key = key_ring.signing_key()
+        with metrics.JWT.time(op='encode'):
+            return jwt.encode(payload, private_key, algorithm='EdDSA', headers={'kid': kid})
+    with metrics.JWT.time(op='encode'):
+        return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
+
+def decode_access_token(token: str) -> dict:
+    with metrics.JWT.time(op='decode'):
+        return _decode_access_token(token)
+
+def _decode_access_token(token: str) -> dict:
+    header = jwt.get_unverified_header(token)
+    if header.get('alg') == 'EdDSA':
+        public_key = key_ring.public_key(header.get('kid'))
+        if public_key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        return jwt.decode(token, public_key, algorithms=['EdDSA'])
+    if app.config['JWT_ACCEPT_HS256'] or app.config['JWT_ALGORITHM'] == 'HS256':
+        return jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    raise jwt.InvalidTokenError('Unsupported signing algorithm')
+
+def schedule_rehash(db_id, old_hash: str, password: str):
+    # 登录成功且密码以其他 cost 保存：后台按当前 cost 重新哈希，结果经写后缓冲条件更新
+    if not app.config['BCRYPT_REHASH_ON_LOGIN'] or not password_hasher.needs_rehash(old_hash):
+        return
+
+    def store(new_hash):
+        write_buffer.add('password_rehash', (new_hash, datetime.utcnow(), db_id, old_hash))
+        metrics.BCRYPT_REHASHES.inc(from_cost=scheme_of(old_hash), to_cost=password_hasher.cost)
+
+    password_hasher.rehash_later(password, store)
+
+def hash_refresh_token(token: str) -> bytes:
+    # 数据库只保存 refresh token 的 SHA-256 摘要（定长 32 字节）
+    return hashlib.sha256(token.encode()).digest()
+
+# 匿名账户没有可用密码，存一个不可能是 bcrypt 结果的占位值
+ANONYMOUS_PASSWORD_HASH = '!'
+
+def build_tokens(user_id: str, email: str):
+    # 签发 token 对，返回 (响应中的 tokens, 待插入的 refresh_tokens 行)
     now = datetime.utcnow()
     exp = now + timedelta(hours=app.config['JWT_EXPIRATION_HOURS'])
-    payload = {'user_id': user_id, 'email': email, 'iat': now, 'exp': exp}
+    payload = {'user_id': user_id, 'email': email, 'iat': now, 'exp': exp, 'jti': secrets.token_hex(16)}
     
-    access_token = jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
+    access_token = encode_access_token(payload)
     if isinstance(access_token, bytes):
         access_token = access_token.decode('utf-8')
         
     refresh_token = secrets.token_urlsafe(64)
-    
-    db = get_db()
-    with db.cursor() as cursor:
-        cursor.execute(
-            'INSERT INTO refresh_tokens (id, user_id, token, expires_at, created_at) VALUES (%s, %s, %s, %s, %s)',
-            (str(uuid.uuid4()), user_id, refresh_token, now + timedelta(days=30), now)
-        )
-    db.commit()
-    
+    row = (to_db(new_id()), to_db(user_id), hash_refresh_token(refresh_token), now + timedelta(days=30), now)
     return {
         'access_token': access_token,
         'refresh_token': refresh_token,
         'token_type': 'Bearer',
         'expires_in': int(exp.timestamp())
-    }
+    }, row
+
+def generate_token(user_id: str, email: str, cursor=None) -> dict:
+    # cursor: 在调用方的事务中插入，由调用方提交
+    tokens, row = build_tokens(user_id, email)
+    if cursor is not None:
+        cursor.execute(INSERT_REFRESH_TOKEN, row)
+    else:
+        db = get_db()
+        with db.cursor() as cursor:
+            cursor.execute(INSERT_REFRESH_TOKEN, row)
+        db.commit()
+    return tokens
+
+verified_tokens = VerifiedTokenCache(app.config['JWT_CACHE_SIZE'])
+
+def verify_access_token(token: str) -> dict:
+    # 验签失败时抛出 jwt.InvalidTokenError（含 ExpiredSignatureError）；吊销检查由调用方完成
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = decode_access_token(token)
+        verified_tokens.put(token, payload)
+    return payload
 
 def require_auth(f):
     @wraps(f)
@@ -226,15 +691,18 @@ def require_auth(f):
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'error': 'Missing or invalid authorization header'}), 401
         
-        token = auth_header.split(' ')[1]
         try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            g.user_id = payload['user_id']
-            g.email = payload['email']
+            payload = verify_access_token(auth_header[7:])
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expired'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
+        # 改造前签发的 token 没有 jti，只能按用户整体吊销
+        if revocations.is_revoked(payload.get('jti'), payload['user_id'], payload.get('iat', 0)):
+            return jsonify({'error': 'Token revoked'}), 401
+        g.user_id = payload['user_id']
+        g.email = payload['email']
+        g.token = payload
         
         return f(*args, **kwargs)
     return decorated
@@ -247,20 +715,21 @@ def verify_page():
     if not token:
         return "Invalid token", 400
         
-    # 调用内部逻辑验证
+    # 调用内部逻辑验证（查找走只读副本，刚注册时副本可能还没同步，查不到再问主库）
+    user = read_one('SELECT id, email FROM users WHERE verification_token = %s', (token,), retry_on_miss=True)
+    if not user:
+        return "<h2>❌ Invalid or expired verification link.</h2>"
+    
     db = get_db()
     with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE verification_token = %s', (token,))
-        user = cursor.fetchone()
-        
-        if not user:
-            return "<h2>❌ Invalid or expired verification link.</h2>"
-            
         cursor.execute(
-            'UPDATE users SET email_verified = 1, verification_token = NULL, updated_at = %s WHERE id = %s',
-            (datetime.utcnow(), user['id'])
+            'UPDATE users SET email_verified = 1, verification_token = NULL, updated_at = %s WHERE id = %s AND verification_token = %s',
+            (datetime.utcnow(), user['id'], token)
         )
     db.commit()
+    user_id = from_db(user['id'])
+    replicas.mark_written(user_id, user['email'])
+    invalidate_profile(user_id)
     
     return """
     <h2>✅ Email Verified Successfully!</h2>
@@ -290,12 +759,14 @@ def reset_password_page():
             if not user or (user['reset_token_expiry'] and datetime.utcnow() > user['reset_token_expiry']):
                 return "<h2>❌ Invalid or expired reset link.</h2>"
                 
-            password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+            password_hash = password_hasher.hash(password)
             cursor.execute(
                 'UPDATE users SET password_hash = %s, reset_token = NULL, reset_token_expiry = NULL, updated_at = %s WHERE id = %s',
                 (password_hash, datetime.utcnow(), user['id'])
             )
         db.commit()
+        replicas.mark_written(user['email'], from_db(user['id']))
+        invalidate_profile(from_db(user['id']))
         return "<h2>✅ Password Reset Successfully!</h2><p>You can now login with your new password.</p>"
 
     return f"""
@@ -322,9 +793,69 @@ def reset_password_page():
 
 # ==================== API 路由 ====================
 
+def readiness_state() -> str:
+    # 就绪检查：数据库 ping 结果缓存 HEALTH_CHECK_TTL 秒，可以高频轮询
+    database = readiness.status()
+    if database['ok'] and not schema_status['ready']:
+        recheck_schema()
+    if not database['ok']:
+        return 'unavailable'
+    return 'ok' if schema_status['ready'] else 'schema_outdated'
+
+def health_status() -> dict:
+    # /api/health 不鉴权，只返回状态；副本地址、错误信息与各组件统计见 health_details
+    status = readiness_state()
+    return {'status': status, 'service': 'DoNow Auth Server', 'ready': status == 'ok'}
+
+def health_details() -> dict:
+    status = readiness_state()
+    return {
+        'status': status, 'service': 'DoNow Auth Server', 'database': readiness.status(),
+        'db_pool': db_pool.stats(), 'hashing': password_hasher.stats(),
+        'write_behind': write_buffer.stats(), 'email_outbox': email_outbox.stats(),
+        'token_sweeper': token_sweeper.stats(), 'refresh_grace': refresh_grace_cache.stats(),
+        'jwt_cache': verified_tokens.stats(), 'profile_cache': profile_cache.stats(),
+        'login_guard': login_guard.stats(), 'schema': schema_status,
+        'revocations': revocations.stats(),
+        'replicas': replicas.stats()
+    }
+
+def metrics_authorized(authorization: str, required: bool = False) -> bool:
+    # /metrics 与 /api/health/details 共用 METRICS_TOKEN。/metrics 未配置时不鉴权（兼容旧部署），
+    # 健康详情包含副本地址与原始错误，未配置时不开放
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        return not required
+    return secrets.compare_digest(authorization or '', f'Bearer {token}')
+
 @app.route('/api/health', methods=['GET'])
+@limiter.exempt
 def health_check():
-    return jsonify({'status': 'ok', 'service': 'DoNow Auth Server', 'database': 'MySQL'})
+    status = health_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/health/details', methods=['GET'])
+@limiter.exempt
+def health_check_details():
+    if not metrics_authorized(request.headers.get('Authorization'), required=True):
+        return jsonify({'error': 'Unauthorized'}), 401
+    status = health_details()
+    return jsonify(status), 200 if status['status'] == 'ok' else 503
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    if not metrics_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics_exporter.collect(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/.well-known/jwks.json', methods=['GET'])
+@limiter.exempt
+def jwks():
+    response = jsonify(key_ring.jwks())
+    response.headers['Cache-Control'] = f"public, max-age={app.config['JWKS_MAX_AGE']}"
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/api/auth/register', methods=['POST'])
 @limiter.limit("10 per hour")
@@ -347,22 +878,23 @@ def register():
         if cursor.fetchone():
             return jsonify({'error': 'Email already registered'}), 409
         
-        user_id = str(uuid.uuid4())
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        user_id = new_id()
+        password_hash = password_hasher.hash(password)
         verification_token = secrets.token_urlsafe(32)
         now = datetime.utcnow()
         
         cursor.execute(
             '''INSERT INTO users (id, email, password_hash, display_name, verification_token, created_at, updated_at)
                VALUES (%s, %s, %s, %s, %s, %s, %s)''',
-            (user_id, email, password_hash, display_name, verification_token, now, now)
+            (to_db(user_id), email, password_hash, display_name, verification_token, now, now)
         )
+        
+        # 验证邮件写入发件箱，与用户记录一起提交
+        link = f"{app.config['FRONTEND_URL']}/verify?token={verification_token}"
+        enqueue_email(cursor, email, "Verify your email for DoNow", verify_email_template.render(link=link))
     db.commit()
-    
-    # 发送验证邮件
-    link = f"{app.config['FRONTEND_URL']}/verify?token={verification_token}"
-    html = render_template_string(HTML_VERIFY_EMAIL, link=link)
-    send_email(email, "Verify your email for DoNow", html)
+    replicas.mark_written(email, user_id)
+    email_outbox.notify()
     
     tokens = generate_token(user_id, email)
     return jsonify({
@@ -383,18 +915,30 @@ def login():
     if not email or not password:
         return jsonify({'error': 'Email and password are required'}), 400
     
-    db = get_db()
-    with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-        user = cursor.fetchone()
+    # 账户锁定期内直接拒绝，不查库也不做 bcrypt
+    retry_after = login_guard.retry_after(email)
+    if retry_after:
+        metrics.REJECTIONS.inc(reason='login_lockout')
+        response = jsonify({'error': 'Too many failed login attempts, please try again later'})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+    
+    # 副本上查不到即视为不存在：刚注册或刚改过的邮箱已由 mark_written 标记，这段时间内直接走主库，
+    # 不存在的邮箱（撞库、拼错）不会每次再打到主库
+    user = read_one('SELECT * FROM users WHERE email = %s', (email,), fresh_keys=(email,))
     
-    if not user or not bcrypt.checkpw(password.encode(), user['password_hash'].encode()):
+    if not user or user['password_hash'] == ANONYMOUS_PASSWORD_HASH \
+            or not password_hasher.check(password, user['password_hash']):
+        login_guard.record_failure(email)
         return jsonify({'error': 'Invalid email or password'}), 401
+    login_guard.record_success(email)
+    schedule_rehash(user['id'], user['password_hash'], password)
     
-    tokens = generate_token(user['id'], user['email'])
+    user_id = from_db(user['id'])
+    tokens = generate_token(user_id, user['email'])
     return jsonify({
         'user': {
-            'uid': user['id'], 'email': user['email'], 'displayName': user['display_name'],
+            'uid': user_id, 'email': user['email'], 'displayName': user['display_name'],
             'emailVerified': bool(user['email_verified']), 'isAnonymous': bool(user['is_anonymous'])
         },
         'tokens': tokens
@@ -403,21 +947,17 @@ def login():
 @app.route('/api/auth/anonymous', methods=['POST'])
 @limiter.limit("20 per hour")
 def anonymous_login():
-    db = get_db()
-    user_id = str(uuid.uuid4())
-    email = f"anonymous_{user_id[:8]}@donow.local"
-    password_hash = bcrypt.hashpw(secrets.token_bytes(32), bcrypt.gensalt()).decode()
+    user_id = new_id()
+    # UUIDv7 的开头是时间戳，取末尾的随机部分避免邮箱冲突
+    email = f"anonymous_{user_id[-12:]}@donow.local"
     now = datetime.utcnow()
     
-    with db.cursor() as cursor:
-        cursor.execute(
-            '''INSERT INTO users (id, email, password_hash, is_anonymous, email_verified, created_at, updated_at)
-               VALUES (%s, %s, %s, 1, 1, %s, %s)''',
-            (user_id, email, password_hash, now, now)
-        )
-    db.commit()
-    
-    tokens = generate_token(user_id, email)
+    # 不做密码哈希，用户和 refresh token 与并发的匿名登录合并成一批提交，落库后才返回 token
+    tokens, token_row = build_tokens(user_id, email)
+    write_buffer.write([
+        ('users', (to_db(user_id), email, ANONYMOUS_PASSWORD_HASH, 1, 1, now, now)),
+        ('refresh_tokens', token_row),
+    ])
     return jsonify({
         'user': {
             'uid': user_id, 'email': email, 'displayName': None,
@@ -426,6 +966,41 @@ def anonymous_login():
         'tokens': tokens
     })
 
+def _grace_lookup(token_hash: bytes, wait: bool = False):
+    if not app.config['REFRESH_GRACE_SECONDS']:
+        return None
+    # wait: 并发的另一个请求刚删掉这一行；缓存先于提交写入，通常一次命中，提交失败撤回缓存时才会等满
+    for _ in range(5 if wait else 1):
+        cached = refresh_grace_cache.get(token_hash.hex())
+        if cached is not None:
+            return json.loads(cached)
+        if wait:
+            time.sleep(0.02)
+    return None
+
+def _grace_store(token_hash: bytes, body: dict):
+    # 缓存写入失败也要返回新 token（只是失去这次的宽限合并），否则旧 token 已作废、会话丢失
+    if app.config['REFRESH_GRACE_SECONDS']:
+        refresh_grace_cache.set(token_hash.hex(), json.dumps(body), app.config['REFRESH_GRACE_SECONDS'])
+
+def _grace_commit(db, token_hash: bytes, body: dict):
+    # 先写宽限缓存再提交轮换：其他请求一旦查不到旧 token 行，缓存中必然已有结果，无需等待；
+    # 提交前旧行仍可见，并发请求只会阻塞在 DELETE 上。提交失败则撤回缓存，旧 token 仍然有效
+    _grace_store(token_hash, body)
+    try:
+        db.commit()
+    except Exception:
+        if app.config['REFRESH_GRACE_SECONDS']:
+            refresh_grace_cache.delete(token_hash.hex())
+        raise
+
+ROTATION_LOOKUP = '''
+    SELECT rt.id AS token_id, rt.expires_at,
+           u.id, u.email, u.display_name, u.email_verified, u.is_anonymous
+    FROM refresh_tokens rt LEFT JOIN users u ON u.id = rt.user_id
+    WHERE rt.token_hash = %s
+'''
+
 @app.route('/api/auth/refresh', methods=['POST'])
 def refresh_token():
     data = request.get_json()
@@ -433,39 +1008,51 @@ def refresh_token():
     if not refresh_token:
         return jsonify({'error': 'Refresh token is required'}), 400
     
+    token_hash = hash_refresh_token(refresh_token)
     db = get_db()
     with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM refresh_tokens WHERE token = %s', (refresh_token,))
-        token_record = cursor.fetchone()
-    
-    if not token_record:
-        return jsonify({'error': 'Invalid refresh token'}), 401
-    
-    if datetime.utcnow() > token_record['expires_at']:
-        with db.cursor() as cursor:
-            cursor.execute('DELETE FROM refresh_tokens WHERE id = %s', (token_record['id'],))
-        db.commit()
-        return jsonify({'error': 'Refresh token expired'}), 401
-    
-    with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE id = %s', (token_record['user_id'],))
-        user = cursor.fetchone()
+        # token 与用户一次查出
+        cursor.execute(ROTATION_LOOKUP, (token_hash,))
+        record = cursor.fetchone()
+        if not record:
+            # 宽限期内重复提交刚轮换掉的 token，直接返回同一对新 token
+            coalesced = _grace_lookup(token_hash)
+            if coalesced:
+                return jsonify(coalesced)
         
-        # 删除旧 token
-        cursor.execute('DELETE FROM refresh_tokens WHERE id = %s', (token_record['id'],))
-    db.commit()
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+        if not record:
+            return jsonify({'error': 'Invalid refresh token'}), 401
         
-    tokens = generate_token(user['id'], user['email'])
-    return jsonify({
+        # 条件删除即是轮换的互斥点：并发刷新同一个 token 时只有一个请求能删到这一行
+        cursor.execute('DELETE FROM refresh_tokens WHERE id = %s', (record['token_id'],))
+        if cursor.rowcount == 0:
+            db.rollback()
+            coalesced = _grace_lookup(token_hash, wait=True)
+            if coalesced:
+                return jsonify(coalesced)
+            return jsonify({'error': 'Invalid refresh token'}), 401
+        
+        if datetime.utcnow() > record['expires_at']:
+            db.commit()
+            return jsonify({'error': 'Refresh token expired'}), 401
+        
+        if not record['id']:
+            db.commit()
+            return jsonify({'error': 'User not found'}), 404
+        
+        # 新 token 与删除旧 token 在同一事务中，只提交一次
+        user_id = from_db(record['id'])
+        tokens = generate_token(user_id, record['email'], cursor=cursor)
+    
+    body = {
         'user': {
-            'uid': user['id'], 'email': user['email'], 'displayName': user['display_name'],
-            'emailVerified': bool(user['email_verified']), 'isAnonymous': bool(user['is_anonymous'])
+            'uid': user_id, 'email': record['email'], 'displayName': record['display_name'],
+            'emailVerified': bool(record['email_verified']), 'isAnonymous': bool(record['is_anonymous'])
         },
         'tokens': tokens
-    })
+    }
+    _grace_commit(db, token_hash, body)
+    return jsonify(body)
 
 @app.route('/api/auth/forgot-password', methods=['POST'])
 @limiter.limit("5 per hour")
@@ -476,56 +1063,73 @@ def forgot_password():
     if not email:
         return jsonify({'error': 'Email is required'}), 400
     
-    db = get_db()
-    with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-        user = cursor.fetchone()
+    # 与 login 相同，副本未命中即视为不存在
+    user = read_one('SELECT id FROM users WHERE email = %s', (email,), fresh_keys=(email,))
     
     if user:
         reset_token = secrets.token_urlsafe(32)
         reset_expiry = datetime.utcnow() + timedelta(hours=1)
         
+        db = get_db()
         with db.cursor() as cursor:
             cursor.execute(
                 'UPDATE users SET reset_token = %s, reset_token_expiry = %s, updated_at = %s WHERE id = %s',
                 (reset_token, reset_expiry, datetime.utcnow(), user['id'])
             )
+            
+            # 重置邮件写入发件箱
+            link = f"{app.config['FRONTEND_URL']}/reset-password-page?token={reset_token}"
+            enqueue_email(cursor, email, "Reset your DoNow password", reset_password_template.render(link=link))
         db.commit()
-        
-        # 发送重置邮件
-        link = f"{app.config['FRONTEND_URL']}/reset-password-page?token={reset_token}"
-        html = render_template_string(HTML_RESET_PASSWORD, link=link)
-        send_email(email, "Reset your DoNow password", html)
+        invalidate_profile(from_db(user['id']))
+        email_outbox.notify()
     
     return jsonify({'message': 'If the email exists, a reset link will be sent'})
 
+PROFILE_LOOKUP = 'SELECT id, email, display_name, email_verified, is_anonymous, created_at FROM users WHERE id = %s'
+
 @app.route('/api/auth/me', methods=['GET'])
 @require_auth
 def get_current_user():
-    db = get_db()
-    with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE id = %s', (g.user_id,))
-        user = cursor.fetchone()
+    if app.config['PROFILE_CACHE_TTL']:
+        cached = profile_cache.get(g.user_id)
+        if cached is not None:
+            return jsonify({'user': json.loads(cached)})
+    
+    key = to_db(g.user_id)
+    user = read_one(PROFILE_LOOKUP, (key,), fresh_keys=(g.user_id,), retry_on_miss=True)
+    if not user and (ids.recheck() or to_db(g.user_id) != key):
+        # id 列刚切换为 BINARY(16)，按新格式重查
+        user = read_one(PROFILE_LOOKUP, (to_db(g.user_id),), fresh_keys=(g.user_id,), retry_on_miss=True)
     if not user:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify({
-        'user': {
-            'uid': user['id'], 'email': user['email'], 'displayName': user['display_name'],
-            'emailVerified': bool(user['email_verified']), 'isAnonymous': bool(user['is_anonymous']),
-            'createdAt': user['created_at'].isoformat() if user['created_at'] else None
-        }
-    })
+    profile = {
+        'uid': g.user_id, 'email': user['email'], 'displayName': user['display_name'],
+        'emailVerified': bool(user['email_verified']), 'isAnonymous': bool(user['is_anonymous']),
+        'createdAt': user['created_at'].isoformat() if user['created_at'] else None
+    }
+    if app.config['PROFILE_CACHE_TTL']:
+        profile_cache.set(g.user_id, json.dumps(profile), app.config['PROFILE_CACHE_TTL'])
+    return jsonify({'user': profile})
 
 @app.route('/api/auth/logout', methods=['POST'])
 @require_auth
 def logout():
     data = request.get_json() or {}
     refresh_token = data.get('refreshToken')
-    if refresh_token:
-        db = get_db()
-        with db.cursor() as cursor:
-            cursor.execute('DELETE FROM refresh_tokens WHERE token = %s AND user_id = %s', (refresh_token, g.user_id))
-        db.commit()
+    jti = g.token.get('jti')
+    db = get_db()
+    with db.cursor() as cursor:
+        if refresh_token:
+            cursor.execute(
+                'DELETE FROM refresh_tokens WHERE token_hash = %s AND user_id = %s',
+                (hash_refresh_token(refresh_token), to_db(g.user_id))
+            )
+        if jti:
+            revoke(cursor, 'jti', jti, datetime.utcfromtimestamp(g.token['exp']))
+    db.commit()
+    if jti:
+        revocations.add('jti', jti)
     return jsonify({'message': 'Logged out successfully'})
 
 @app.route('/api/auth/delete-account', methods=['DELETE'])
@@ -533,19 +1137,30 @@ def logout():
 def delete_account():
     db = get_db()
     with db.cursor() as cursor:
-        cursor.execute('DELETE FROM refresh_tokens WHERE user_id = %s', (g.user_id,))
-        cursor.execute('DELETE FROM users WHERE id = %s', (g.user_id,))
+        for _ in range(2):
+            key = to_db(g.user_id)
+            cursor.execute('DELETE FROM refresh_tokens WHERE user_id = %s', (key,))
+            cursor.execute('DELETE FROM users WHERE id = %s', (key,))
+            # 一行都没删到且 id 列刚切换为 BINARY(16) 时按新格式再删一次
+            if cursor.rowcount or not (ids.recheck() or to_db(g.user_id) != key):
+                break
+        # 该用户此前签发的所有 access token 在最长有效期内都要拒绝
+        revoke(cursor, 'user', g.user_id, datetime.utcnow() + timedelta(hours=app.config['JWT_EXPIRATION_HOURS']))
     db.commit()
+    revocations.add('user', g.user_id)
+    replicas.mark_written(g.user_id, g.email)
+    invalidate_profile(g.user_id)
     return jsonify({'message': 'Account deleted successfully'})
 
 # ... (保留前面的代码)
 
-# 初始化数据库 (确保 Gunicorn 启动时也运行)
+# 表结构检查（或迁移）：gunicorn --preload 下只在主进程执行一次，fork 出的 worker 直接继承结果
 try:
-    print("🔄 Attempting to initialize database...")
-    init_db()
+    prepare_schema(apply=app.config['SCHEMA_MIGRATE_ON_START'])
 except Exception as e:
-    print(f"⚠️ Database initialization skipped or failed: {e}")
+    # 不退出（数据库可能晚于应用启动），但在检查成功之前 /api/health 一直返回 503，负载均衡不会把流量发过来
+    schema_status['error'] = str(e) or type(e).__name__
+    print(f"⚠️ Database schema check failed, reporting not ready until it succeeds: {e}")
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
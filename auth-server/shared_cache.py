@@ -0,0 +1,112 @@
+"""
+同机多 worker 共享的 TTL 缓存
+基于放在 tmpfs（/dev/shm）上的 SQLite 文件，gunicorn 的各个 worker 进程都能读写同一份数据。
+缓存只是优化：读写出错（如等锁超时 database is locked）时 get 视为未命中、set 放弃写入，不向调用方抛出
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+
+def default_cache_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class SharedTTLCache:
+    def __init__(self, path, max_entries=10000, evict_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._errors = 0
+
+    def _conn(self):
+        # sqlite 连接不能跨线程/跨 fork 使用，每个线程各自打开
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)  # 缓存里可能有 token，只允许本用户读写
+            os.close(fd)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # 内存文件系统上的缓存，不需要落盘保证
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache (expires_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _failed(self, op, e):
+        with self._lock:
+            self._errors += 1
+        print(f"⚠️ Shared cache {op} failed ({os.path.basename(self.path)}): {e}")
+
+    def get(self, key):
+        try:
+            row = self._conn().execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self._failed('get', e)
+            row = None
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return row[0]
+
+    def set(self, key, value, ttl) -> bool:
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, time.time() + ttl)
+            )
+        except (sqlite3.Error, OSError) as e:
+            self._failed('set', e)
+            return False
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            try:
+                self.evict()
+            except (sqlite3.Error, OSError) as e:
+                self._failed('evict', e)
+        return True
+
+    def delete(self, key) -> bool:
+        try:
+            self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except (sqlite3.Error, OSError) as e:
+            self._failed('delete', e)
+            return False
+        return True
+
+    def evict(self) -> int:
+        conn = self._conn()
+        removed = conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        # 仍超出容量时淘汰最早过期的条目
+        overflow = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+        if overflow > 0:
+            removed += conn.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)', (overflow,)
+            ).rowcount
+        with self._lock:
+            self._evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions, 'errors': self._errors}
@@ -0,0 +1,230 @@
+"""
+限流共享存储
+同一台机器上所有 gunicorn worker 共用一张内存映射（mmap）的计数表，实现 limits 的 Storage 接口，
+注册为 shm:// 协议，支持 fixed-window 与 sliding-window-counter 策略：
+    shm:///dev/shm/donow_ratelimit.bin?slots=65536
+表满时挤掉最早过期的条目；pinned 指定的键前缀（如 login_lock/）在过期前永不被挤掉，
+探测范围内全是这类条目时 incr 抛出 StorageFull，由调用方按失败处理（fail closed）：
+    shm:///dev/shm/donow_login_guard.bin?slots=262144&pinned=login_lock/
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from math import floor
+from urllib.parse import urlparse, parse_qs
+
+from limits.storage.base import Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+# 每个槽位：键摘要(0 表示从未使用，最高位表示固定条目)、计数、过期时间戳
+SLOT = struct.Struct('<Qqd')
+MAX_PROBE = 16
+PINNED_BIT = 1 << 63
+
+
+class StorageFull(OSError):
+    """探测范围内全是未过期的固定条目，无法写入新键"""
+
+
+class _Guard:
+    # 线程锁 + 文件锁：flock 只在进程间互斥，同一进程内的线程还需要线程锁
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __enter__(self):
+        self.storage._lock.acquire()
+        try:
+            self.storage._open()
+            fcntl.flock(self.storage._fd, fcntl.LOCK_EX)
+        except Exception:
+            self.storage._lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.storage._fd, fcntl.LOCK_UN)
+        self.storage._lock.release()
+
+
+class SharedMemoryStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    STORAGE_SCHEME = ['shm']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        parsed = urlparse(uri)
+        self.path = parsed.path
+        query = parse_qs(parsed.query)
+        self.slots = int(query.get('slots', ['65536'])[0])
+        self.pinned = tuple(prefix for value in query.get('pinned', []) for prefix in value.split(',') if prefix)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    # ---------- 共享内存与锁 ----------
+
+    def _open(self):
+        # 每个进程单独打开文件：flock 作用于打开的文件描述，fork 继承的描述无法在父子进程间互斥
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+        size = self.slots * SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _locked(self):
+        return _Guard(self)
+
+    def _digest(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') & ~PINNED_BIT
+        if self.pinned and key.startswith(self.pinned):
+            digest |= PINNED_BIT
+        return digest or 1
+
+    def _read(self, index):
+        return SLOT.unpack_from(self._map, index * SLOT.size)
+
+    def _write(self, index, digest, count, expires_at):
+        SLOT.pack_into(self._map, index * SLOT.size, digest, count, expires_at)
+
+    def _find(self, digest, now, create):
+        # 线性探测；遇到从未使用的槽位即可停止。返回 (槽位, 是否为有效条目)
+        start = digest % self.slots
+        reusable = None
+        oldest = None
+        for step in range(MAX_PROBE):
+            index = (start + step) % self.slots
+            slot_digest, _, expires_at = self._read(index)
+            if slot_digest == digest:
+                if expires_at > now:
+                    return index, True
+                return index, False
+            if slot_digest == 0:
+                return (reusable if reusable is not None else index), False
+            if expires_at <= now:
+                if reusable is None:
+                    reusable = index
+            elif slot_digest & PINNED_BIT:
+                continue  # 未过期的固定条目不参与淘汰
+            elif oldest is None or expires_at < self._read(oldest)[2]:
+                oldest = index
+        if not create:
+            return None, False
+        # 探测范围内全是有效条目时，挤掉最早过期的非固定条目；全是固定条目时返回 None
+        return (reusable if reusable is not None else oldest), False
+
+    # ---------- Storage 接口 ----------
+
+    def incr(self, key, expiry, amount=1):
+        digest = self._digest(key)
+        now = time.time()
+        with self._locked():
+            index, live = self._find(digest, now, create=True)
+            if index is None:
+                raise StorageFull(f'no free slot for {key} in {self.path}')
+            if live:
+                _, count, expires_at = self._read(index)
+                count += amount
+            else:
+                count, expires_at = amount, now + expiry
+            self._write(index, digest, count, expires_at)
+            return count
+
+    def decr(self, key, amount=1):
+        digest = self._digest(key)
+        with self._locked():
+            index, live = self._find(digest, time.time(), create=False)
+            if not live:
+                return 0
+            _, count, expires_at = self._read(index)
+            count = max(count - amount, 0)
+            self._write(index, digest, count, expires_at)
+            return count
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._locked():
+            index, live = self._find(digest, time.time(), create=False)
+            return self._read(index)[1] if live else 0
+
+    def get_expiry(self, key):
+        digest = self._digest(key)
+        now = time.time()
+        with self._locked():
+            index, live = self._find(digest, now, create=False)
+            return self._read(index)[2] if live else now
+
+    def clear(self, key):
+        digest = self._digest(key)
+        with self._locked():
+            index, live = self._find(digest, time.time(), create=False)
+            if live:
+                # 保留摘要作为探测链的一环，只把条目置为过期
+                self._write(index, digest, 0, 0.0)
+
+    def full(self, key) -> bool:
+        # 键不存在且已无法写入：调用方据此 fail closed
+        digest = self._digest(key)
+        with self._locked():
+            index, live = self._find(digest, time.time(), create=True)
+            return index is None
+
+    def reset(self):
+        now = time.time()
+        with self._locked():
+            live = sum(1 for index in range(self.slots) if self._read(index)[2] > now)
+            self._map[:] = bytes(len(self._map))
+            return live
+
+    def check(self):
+        try:
+            with self._locked():
+                return True
+        except OSError:
+            return False
+
+    # ---------- sliding-window-counter ----------
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count, previous_ttl, current_count, _ = self._sliding_window_info(
+            previous_key, current_key, expiry, now
+        )
+        if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+            return False
+        current_count = self.incr(current_key, 2 * expiry, amount=amount)
+        if floor(previous_count * previous_ttl / expiry + current_count) > limit:
+            # 并发请求抢先占满了窗口，撤回本次计数
+            self.decr(current_key, amount)
+            return False
+        return True
+
+    def _sliding_window_info(self, previous_key, current_key, expiry, now):
+        previous_count = self.get(previous_key)
+        current_count = self.get(current_key)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._sliding_window_info(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
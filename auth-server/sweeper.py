@@ -0,0 +1,183 @@
+"""
+过期 refresh token（以及过期吊销记录、超过保留期的已发送 / 发送失败邮件）清理
+按 expires_at 索引分批删除，每批单独提交，不持有长时间的锁；表按 expires_at 分区时直接删除过期分区
+可在服务内作为后台线程运行，也可独立运行：
+    python sweeper.py           # 常驻，按间隔循环清理
+    python sweeper.py --once    # 清理一次后退出（适合 cron）
+"""
+
+import os
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+# 多个 worker / 多台机器同时运行时，用 MySQL 命名锁保证同一时刻只有一个在清理
+LOCK_NAME = 'donow_refresh_token_sweeper'
+
+
+class TokenSweeper:
+    def __init__(self, pool, database, batch_size=1000, interval=3600, pause=0.05, days_ahead=35,
+                 outbox_retention_days=7):
+        self.pool = pool
+        self.database = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.days_ahead = days_ahead  # 分区表预先建好的天数，需覆盖 refresh token 的 30 天有效期
+        self.outbox_retention_days = outbox_retention_days  # 0 为不清理发件箱
+
+        self._lock = threading.Lock()
+        self._pid = None
+
+        self._runs = 0
+        self._rows_purged = 0
+        self._partitions_dropped = 0
+        self._outbox_purged = 0
+        self._seconds = 0.0
+        self._last_run = None
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='token-sweeper', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"❌ Token sweeper failed: {e}")
+
+    # ---------- 清理 ----------
+
+    def _maintain_partitions(self, cursor, now) -> int:
+        # 按天 RANGE 分区，上界是 TO_DAYS(expires_at)；未分区的表直接跳过
+        cursor.execute(
+            '''SELECT partition_name AS name, partition_description AS bound
+               FROM information_schema.partitions
+               WHERE table_schema = %s AND table_name = 'refresh_tokens' AND partition_method = 'RANGE' ''',
+            (self.database,)
+        )
+        partitions = {row['name']: row['bound'] for row in cursor.fetchall()}
+        if not partitions:
+            return 0
+        cursor.execute('SELECT TO_DAYS(%s) AS today', (now,))
+        today = cursor.fetchone()['today']
+        bounds = [int(bound) for bound in partitions.values() if bound != 'MAXVALUE']
+
+        # 上界不晚于今天的分区里只剩过期数据，整个分区删除
+        expired = [name for name, bound in partitions.items() if bound != 'MAXVALUE' and int(bound) <= today]
+        if expired:
+            cursor.execute(f"ALTER TABLE refresh_tokens DROP PARTITION {', '.join(expired)}")
+
+        # 提前从 pmax 拆出未来的分区（pmax 为空时拆分几乎没有开销）
+        highest = max(bounds, default=today)
+        target = today + self.days_ahead
+        if 'pmax' in partitions and highest < target:
+            new = ', '.join(f'PARTITION p{day} VALUES LESS THAN ({day})' for day in range(highest + 1, target + 1))
+            cursor.execute(
+                f'ALTER TABLE refresh_tokens REORGANIZE PARTITION pmax INTO '
+                f'({new}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+            )
+        return len(expired)
+
+    def _delete_batches(self, conn, table, now, column='expires_at', condition='', params=()):
+        # condition 是附加的等值条件，与 column 组成索引前缀，每批都按索引顺序删除
+        purged = 0
+        while True:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE {condition}{column} < %s ORDER BY {column} LIMIT %s',
+                    (*params, now, self.batch_size)
+                )
+                affected = cursor.rowcount
+            conn.commit()
+            purged += affected
+            if affected < self.batch_size:
+                return purged
+            time.sleep(self.pause)
+
+    def _purge_outbox(self, conn, now) -> int:
+        # 已发送和最终失败的邮件只清空了正文，行本身按保留期删除。
+        # 每个状态单独删除，才能按 idx_status_next 的顺序扫描；next_attempt_at 是最后一次计划发送的时间
+        if not self.outbox_retention_days:
+            return 0
+        cutoff = now - timedelta(days=self.outbox_retention_days)
+        return sum(
+            self._delete_batches(conn, 'email_outbox', cutoff, 'next_attempt_at', 'status = %s AND ', (status,))
+            for status in ('sent', 'failed')
+        )
+
+    def sweep_once(self) -> int:
+        started = time.monotonic()
+        now = datetime.utcnow()
+        purged = 0
+        dropped = 0
+        outbox = 0
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT GET_LOCK(%s, 0) AS acquired', (LOCK_NAME,))
+                if not cursor.fetchone()['acquired']:
+                    return 0
+            try:
+                with conn.cursor() as cursor:
+                    dropped = self._maintain_partitions(cursor, now)
+                # 分区表里未到期分区中的零散过期行，以及未分区的表，都走分批删除
+                purged = self._delete_batches(conn, 'refresh_tokens', now)
+                # 过期的吊销记录对应的 token 本身也已过期，一并清理
+                purged += self._delete_batches(conn, 'revoked_tokens', now)
+                outbox = self._purge_outbox(conn, now)
+            finally:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT RELEASE_LOCK(%s)', (LOCK_NAME,))
+                conn.commit()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._runs += 1
+            self._rows_purged += purged
+            self._partitions_dropped += dropped
+            self._outbox_purged += outbox
+            self._seconds += elapsed
+            self._last_run = now.isoformat()
+        if purged or dropped or outbox:
+            print(f"🧹 Purged {purged} expired tokens and {outbox} old emails, dropped {dropped} partitions in {elapsed:.2f}s")
+        return purged
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'runs': self._runs,
+                'rows_purged': self._rows_purged,
+                'partitions_dropped': self._partitions_dropped,
+                'outbox_purged': self._outbox_purged,
+                'seconds': round(self._seconds, 3),
+                'last_run': self._last_run,
+            }
+
+
+def main():
+    from server import token_sweeper
+
+    parser = argparse.ArgumentParser(description='Purge expired refresh tokens')
+    parser.add_argument('--once', action='store_true', help='run a single sweep and exit')
+    args = parser.parse_args()
+
+    if args.once:
+        token_sweeper.sweep_once()
+        print(f"✅ {token_sweeper.stats()}")
+        return
+    while True:
+        token_sweeper.sweep_once()
+        time.sleep(token_sweeper.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+测试不依赖 MySQL：导入 server 时的表结构检查连不上数据库会报告未就绪，不影响这里用到的函数；
+需要数据库的地方用 FakePool / FakeConnection 代替，语句经 pymysql 真实的参数格式化（mogrify）后再交给 handler
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+import pymysql
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('MYSQL_HOST', '127.0.0.1')
+os.environ.setdefault('MYSQL_PORT', '1')  # 立即拒绝连接
+os.environ.setdefault('SCHEMA_MIGRATE_ON_START', 'false')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+
+
+class FakeCursor(pymysql.cursors.DictCursor):
+    """把格式化后的语句交给 handler(sql) -> rows；参数与占位符不匹配时和 pymysql 一样抛 TypeError"""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, query, args=None):
+        sql = self.mogrify(query, args)
+        self.connection.statements.append(sql)
+        result = self.connection.handler(sql)
+        if isinstance(result, int):
+            self._rows, self.rowcount = [], result
+        else:
+            self._rows = list(result or [])
+            self.rowcount = len(self._rows)
+        return self.rowcount
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    encoding = 'utf8'
+    charset = 'utf8mb4'
+    server_status = 0
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def literal(self, value):
+        return pymysql.converters.escape_item(value, self.charset)
+
+    def escape(self, value, mapping=None):
+        return pymysql.converters.escape_item(value, self.charset, mapping=mapping)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self, handler=lambda sql: []):
+        self.conn = FakeConnection(handler)
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def fake_pool():
+    return FakePool
@@ -0,0 +1,22 @@
+from limits.storage import storage_from_string
+
+import metrics
+import server
+from replicas import ReplicaSet
+
+
+def test_cost_mix_runs_on_replica(fake_pool, monkeypatch):
+    def handler(sql):
+        assert "LIKE '$2%'" in sql
+        return [{'cost': '12', 'users': 7}, {'cost': '$firebase-scrypt', 'users': 2}]
+
+    pool = fake_pool(handler)
+    monkeypatch.setattr(server, 'replicas', ReplicaSet({'replica': pool}, storage_from_string('memory://')))
+    monkeypatch.setattr(server, 'shared_storage', storage_from_string('memory://'))
+    monkeypatch.setattr(server, '_cost_mix_checked', None)
+    monkeypatch.setitem(server.app.config, 'BCRYPT_COST_MIX_INTERVAL', 600)
+
+    server.collect_cost_mix()
+    assert len(pool.conn.statements) == 1
+    values = {tuple(labels): value for labels, value in metrics.BCRYPT_COST_USERS.snapshot()['values']}
+    assert values == {('12',): 7, ('firebase-scrypt',): 2}
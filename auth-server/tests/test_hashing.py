@@ -0,0 +1,48 @@
+import os
+import time
+import asyncio
+
+import bcrypt
+import pytest
+
+from hashing import PasswordHasher, HashQueueFull, HashUnavailable, firebase_hash
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, queue_size=4, timeout=5.0, cost=4)
+    yield hasher
+    if hasher._executor is not None:
+        hasher._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_hash_and_check(hasher):
+    hashed = hasher.hash('secret')
+    assert bcrypt.checkpw(b'secret', hashed.encode())
+    assert hasher.check('secret', hashed)
+    assert not hasher.check('wrong', hashed)
+    assert asyncio.run(hasher.check_async('secret', hashed))
+
+
+def test_timeout_is_reported_as_unavailable(hasher):
+    hasher.timeout = 0.05
+    with pytest.raises(HashUnavailable):
+        hasher._run('hash', 4, time.sleep, 1)
+    assert isinstance(HashUnavailable(), HashQueueFull)  # 与队列已满共用 503 + Retry-After 的处理
+    assert hasher.stats()['timeouts'] == 1
+
+
+def test_broken_pool_is_replaced(hasher):
+    # 子进程退出会让整个进程池进入 broken 状态；之后的任务必须在新进程池上照常执行
+    with pytest.raises(HashUnavailable):
+        hasher._run('hash', 4, os._exit, 1)
+    assert hasher.stats()['pool_restarts'] >= 1
+    hashed = hasher.hash('secret')
+    assert hasher.check('secret', hashed)
+    assert hasher.stats()['pending'] == 0
+
+
+def test_firebase_hash_without_signer_key_fails_cleanly(hasher):
+    stored = firebase_hash('aGVsbG8=', 'c2FsdA==', 8, 14)
+    assert hasher.check('secret', stored) is False
+    assert hasher.stats()['unverifiable'] == 1
@@ -0,0 +1,22 @@
+import server
+
+
+def test_public_health_hides_internals(monkeypatch):
+    monkeypatch.setattr(server.readiness, 'status', lambda: {'ok': False, 'error': 'connect to 10.0.0.5:3306 refused'})
+    response = server.app.test_client().get('/api/health')
+    assert response.status_code == 503
+    assert response.get_json() == {'status': 'unavailable', 'service': 'DoNow Auth Server', 'ready': False}
+
+
+def test_health_details_require_metrics_token(monkeypatch):
+    monkeypatch.setattr(server.readiness, 'status', lambda: {'ok': False, 'error': 'refused'})
+    client = server.app.test_client()
+    monkeypatch.setitem(server.app.config, 'METRICS_TOKEN', '')
+    assert client.get('/api/health/details').status_code == 401
+
+    monkeypatch.setitem(server.app.config, 'METRICS_TOKEN', 'secret')
+    assert client.get('/api/health/details', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/api/health/details', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 503
+    assert response.get_json()['database']['error'] == 'refused'
+    assert 'replicas' in response.get_json()
@@ -0,0 +1,98 @@
+import re
+
+import pytest
+
+import migrate
+
+
+def fake_schema(columns=(), triggers=(), indexes=(), id_type='varchar', counts=None):
+    # 按语句内容回答 information_schema 查询，其余语句记录下来供断言
+    def handler(sql):
+        if 'information_schema.columns' in sql and 'data_type' in sql:
+            return [{'data_type': id_type}] if id_type else []
+        if 'information_schema.columns' in sql:
+            table = re.search(r"table_name = '(\w+)'", sql).group(1)
+            return [{'name': name} for name in columns.get(table, ())]
+        if 'information_schema.triggers' in sql:
+            return [{'name': name} for name in triggers]
+        if 'information_schema.statistics' in sql:
+            return [{'name': name} for name in indexes]
+        if sql.startswith('SELECT id FROM'):
+            return []
+        if 'COUNT(*)' in sql:
+            return [counts]
+        return 0
+    return handler
+
+
+def executed(pool, prefix):
+    return [sql for sql in pool.conn.statements if sql.lstrip().startswith(prefix)]
+
+
+def test_token_hash_triggers_created_before_backfill(fake_pool):
+    pool = fake_pool(fake_schema(columns={'refresh_tokens': ('id', 'user_id', 'token')}))
+    migrate.refresh_token_hash(pool.conn)
+    statements = pool.conn.statements
+    create = [i for i, sql in enumerate(statements) if sql.startswith('CREATE TRIGGER')]
+    backfill = [i for i, sql in enumerate(statements) if sql.startswith('UPDATE refresh_tokens SET token_hash')]
+    assert len(create) == 2 and backfill and max(create) < min(backfill)
+    assert any('BEFORE INSERT ON refresh_tokens' in statements[i] for i in create)
+    assert not executed(pool, 'ALTER TABLE refresh_tokens DROP COLUMN token')
+
+
+def test_existing_token_hash_triggers_are_not_recreated(fake_pool):
+    pool = fake_pool(fake_schema(
+        columns={'refresh_tokens': ('id', 'user_id', 'token', 'token_hash')},
+        triggers=tuple(migrate.TOKEN_HASH_TRIGGERS), indexes=('uniq_token_hash',)
+    ))
+    migrate.refresh_token_hash(pool.conn)
+    assert not executed(pool, 'CREATE TRIGGER')
+    assert not executed(pool, 'DROP TRIGGER')
+
+
+def test_finalize_drops_token_hash_triggers_before_column(fake_pool):
+    pool = fake_pool(fake_schema(
+        columns={'refresh_tokens': ('id', 'user_id', 'token', 'token_hash')},
+        triggers=tuple(migrate.TOKEN_HASH_TRIGGERS), indexes=('uniq_token_hash',)
+    ))
+    migrate.refresh_token_hash(pool.conn, finalize=True)
+    statements = pool.conn.statements
+    drops = [i for i, sql in enumerate(statements) if sql.startswith('DROP TRIGGER')]
+    drop_column = statements.index(executed(pool, 'ALTER TABLE refresh_tokens DROP COLUMN token')[0])
+    assert len(drops) == 2 and max(drops) < drop_column
+
+
+def test_binary_ids_waits_for_token_column_drop(fake_pool):
+    pool = fake_pool(fake_schema(columns={'refresh_tokens': ('id', 'token')}))
+    migrate.binary_ids(pool.conn, finalize=True)
+    assert not executed(pool, 'CREATE TABLE')
+    assert not executed(pool, 'RENAME TABLE')
+
+
+def test_binary_ids_finalize_switches_both_tables_at_once(fake_pool):
+    counts = {'users': 2, 'users_bin': 2, 'refresh_tokens': 3, 'refresh_tokens_bin': 3}
+    pool = fake_pool(fake_schema(columns={'refresh_tokens': ('id', 'user_id', 'token_hash')}, counts=counts))
+    migrate.binary_ids(pool.conn, finalize=True)
+    statements = pool.conn.statements
+    renames = executed(pool, 'RENAME TABLE')
+    assert renames == [
+        'RENAME TABLE users TO users_legacy, users_bin TO users, '
+        'refresh_tokens TO refresh_tokens_legacy, refresh_tokens_bin TO refresh_tokens'
+    ]
+    rename = statements.index(renames[0])
+    sync_drops = [i for i, sql in enumerate(statements) if sql.startswith('DROP TRIGGER') and '_sync_' in sql]
+    # 切换后立即删除全部 6 个同步触发器，且在加外键之前
+    after = [i for i in sync_drops if i > rename]
+    assert len(executed(pool, 'CREATE TRIGGER')) == 6
+    foreign_key = statements.index(executed(pool, 'ALTER TABLE refresh_tokens ADD CONSTRAINT')[0])
+    assert len(after) == 6 and max(after) < foreign_key
+    copies = executed(pool, 'INSERT IGNORE INTO')
+    assert copies and all(sql.rstrip().endswith('FOR SHARE') for sql in copies)
+
+
+def test_binary_ids_refuses_to_switch_out_of_sync_tables(fake_pool):
+    counts = {'users': 2, 'users_bin': 1, 'refresh_tokens': 3, 'refresh_tokens_bin': 3}
+    pool = fake_pool(fake_schema(columns={'refresh_tokens': ('id', 'user_id', 'token_hash')}, counts=counts))
+    with pytest.raises(SystemExit):
+        migrate.binary_ids(pool.conn, finalize=True)
+    assert not executed(pool, 'RENAME TABLE')
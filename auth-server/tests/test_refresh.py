@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pymysql
+import pytest
+
+import ids
+import server
+from shared_cache import SharedTTLCache
+
+
+USER_ID = ids.new_id()
+
+
+@pytest.fixture
+def rotation(fake_pool, tmp_path, monkeypatch):
+    state = {'rows': 1, 'fail_commit': False}
+
+    def handler(sql):
+        if sql.lstrip().startswith('SELECT rt.id'):
+            if not state['rows']:
+                return []
+            return [{
+                'token_id': b'\x01' * 16, 'expires_at': datetime.utcnow() + timedelta(days=1),
+                'id': ids.to_db(USER_ID), 'email': 'user@example.com', 'display_name': None,
+                'email_verified': 1, 'is_anonymous': 0,
+            }]
+        if sql.startswith('DELETE FROM refresh_tokens'):
+            deleted, state['rows'] = state['rows'], 0
+            return deleted
+        return 1
+
+    pool = fake_pool(handler)
+    conn = pool.conn
+    cache = SharedTTLCache(str(tmp_path / 'grace.sqlite'))
+
+    def commit():
+        # 提交时宽限缓存中必须已有结果
+        state['cached_at_commit'] = cache.get(server.hash_refresh_token('old-token').hex())
+        if state['fail_commit']:
+            state['rows'] = 1
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+        conn.commits += 1
+
+    conn.commit = commit
+    monkeypatch.setattr(server.db_pool, 'acquire', lambda *args, **kwargs: conn)
+    monkeypatch.setattr(server.db_pool, 'release', lambda *args, **kwargs: None)
+    monkeypatch.setattr(server, 'refresh_grace_cache', cache)
+    monkeypatch.setattr(ids, 'binary', True)
+    monkeypatch.setitem(server.app.config, 'REFRESH_GRACE_SECONDS', 30)
+    return state, conn, cache
+
+
+def refresh(client):
+    return client.post('/api/auth/refresh', json={'refreshToken': 'old-token'})
+
+
+def test_rotation_caches_result_before_commit(rotation):
+    state, conn, cache = rotation
+    client = server.app.test_client()
+    first = refresh(client)
+    assert first.status_code == 200
+    assert conn.commits == 1
+    assert state['cached_at_commit'] is not None
+
+    # 旧 token 行已删除：宽限期内重复提交得到同一对新 token，不再写库
+    statements = len(conn.statements)
+    second = refresh(client)
+    assert second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert len(conn.statements) == statements + 1
+
+
+def test_failed_commit_withdraws_grace_entry(rotation):
+    state, conn, cache = rotation
+    state['fail_commit'] = True
+    response = refresh(server.app.test_client())
+    assert response.status_code >= 500
+    assert state['cached_at_commit'] is not None
+    assert cache.get(server.hash_refresh_token('old-token').hex()) is None
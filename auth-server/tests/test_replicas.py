@@ -0,0 +1,74 @@
+import pymysql
+import pytest
+from limits.storage import storage_from_string
+
+from replicas import ReplicaSet, ReplicaUnavailable
+
+
+def replica_set(*pools, bypass_seconds=5):
+    return ReplicaSet(
+        {f'replica{i}': pool for i, pool in enumerate(pools)},
+        storage_from_string('memory://'),
+        bypass_seconds=bypass_seconds
+    )
+
+
+def test_fetch_one_reads_from_replica(fake_pool):
+    pool = fake_pool(lambda sql: [{'id': 1}])
+    replicas = replica_set(pool)
+    assert replicas.fetch_one('SELECT id FROM users WHERE email = %s', ('a@b.c',)) == {'id': 1}
+    assert pool.conn.statements == ["SELECT id FROM users WHERE email = 'a@b.c'"]
+
+
+def test_fetch_all_without_args_keeps_literal_percent(fake_pool):
+    # 不带参数时必须传 None：传 () 时 pymysql 仍会做 % 格式化，LIKE '$2%' 会抛 TypeError
+    pool = fake_pool(lambda sql: [{'cost': '12', 'users': 3}])
+    replicas = replica_set(pool)
+    assert replicas.fetch_all("SELECT 1 FROM users WHERE password_hash LIKE '$2%'", None) == [{'cost': '12', 'users': 3}]
+    with pytest.raises(TypeError):
+        replicas.fetch_all("SELECT 1 FROM users WHERE password_hash LIKE '$2%'", ())
+
+
+def test_connection_error_marks_replica_down_and_falls_back(fake_pool):
+    def down(sql):
+        raise pymysql.err.OperationalError(2003, "Can't connect")
+
+    replicas = replica_set(fake_pool(down))
+    with pytest.raises(ReplicaUnavailable):
+        replicas.fetch_one('SELECT 1', None)
+    stats = replicas.stats()
+    assert stats['replicas'][0]['healthy'] is False
+    assert stats['fallbacks'] == 1
+    # 摘除期间不再尝试
+    with pytest.raises(ReplicaUnavailable):
+        replicas.fetch_one('SELECT 1', None)
+    assert stats['replicas'][0]['failures'] == 1
+
+
+def test_mark_written_bypasses_replica(fake_pool):
+    replicas = replica_set(fake_pool())
+    assert not replicas.recently_written('user-1')
+    replicas.mark_written('user-1', 'a@b.c')
+    assert replicas.recently_written('a@b.c')
+    assert not replicas.recently_written('someone-else')
+
+
+
+def test_bypass_expiry_is_whole_seconds(fake_pool):
+    # Redis 的 EXPIRE 拒绝小数：INCRBY 已执行而过期时间没设上，标记会永久存在
+    class RecordingStorage:
+        def __init__(self):
+            self.expiries = []
+
+        def clear(self, key):
+            pass
+
+        def incr(self, key, expiry, amount=1):
+            self.expiries.append(expiry)
+            return 1
+
+    storage = RecordingStorage()
+    replicas = ReplicaSet({'replica': fake_pool()}, storage, bypass_seconds=2.5)
+    replicas.mark_written('user-1')
+    assert storage.expiries == [3]
+    assert all(isinstance(expiry, int) for expiry in storage.expiries)
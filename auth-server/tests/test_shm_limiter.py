@@ -0,0 +1,66 @@
+import os
+from unittest import mock
+
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from shm_limiter import SharedMemoryStorage, StorageFull
+
+
+@pytest.fixture
+def shm_uri(tmp_path):
+    return lambda query='slots=64': f'shm://{tmp_path / "limits.bin"}?{query}'
+
+
+def test_registered_for_shm_scheme(shm_uri):
+    assert isinstance(storage_from_string(shm_uri()), SharedMemoryStorage)
+
+
+def test_counts_expire(shm_uri):
+    storage = SharedMemoryStorage(shm_uri())
+    assert storage.incr('a', 10) == 1
+    assert storage.incr('a', 10, amount=2) == 3
+    assert storage.decr('a') == 2
+    assert storage.get('a') == 2
+
+    with mock.patch('shm_limiter.time.time', return_value=storage.get_expiry('a') + 1):
+        assert storage.get('a') == 0
+        assert storage.incr('a', 10) == 1
+
+
+def test_strategies_enforce_limit(shm_uri):
+    item = parse('3 per minute')
+    for strategy in (FixedWindowRateLimiter, SlidingWindowCounterRateLimiter):
+        limiter = strategy(SharedMemoryStorage(shm_uri()))
+        assert all(limiter.hit(item, strategy.__name__) for _ in range(3))
+        assert not limiter.hit(item, strategy.__name__)
+        assert limiter.hit(item, strategy.__name__, 'other')
+
+
+def test_forked_worker_shares_counts(shm_uri):
+    storage = SharedMemoryStorage(shm_uri())
+    storage.incr('shared', 60)
+    pid = os.fork()
+    if pid == 0:
+        # 子进程重新打开文件并加锁，计数写入同一张表
+        os._exit(0 if storage.incr('shared', 60) == 2 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert storage.get('shared') == 2
+
+
+def test_full_table_evicts_unpinned_and_rejects_pinned(shm_uri):
+    storage = SharedMemoryStorage(shm_uri('slots=4&pinned=lock/'))
+    for n in range(4):
+        storage.incr(f'hit/{n}', 60)
+    # 普通条目挤掉最早过期的一个
+    assert storage.incr('hit/new', 60) == 1
+
+    pinned = SharedMemoryStorage(shm_uri('slots=2&pinned=lock/').replace('limits.bin', 'pinned.bin'))
+    pinned.incr('lock/a', 60)
+    pinned.incr('lock/b', 60)
+    assert pinned.full('lock/c')
+    with pytest.raises(StorageFull):
+        pinned.incr('lock/c', 60)
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from sweeper import TokenSweeper
+
+
+def test_sweep_purges_old_outbox_rows(fake_pool):
+    def handler(sql):
+        if 'GET_LOCK' in sql:
+            return [{'acquired': 1}]
+        if sql.startswith("DELETE FROM email_outbox WHERE status = 'sent'"):
+            return 3
+        return []
+
+    pool = fake_pool(handler)
+    sweeper = TokenSweeper(pool, 'donow', batch_size=10, outbox_retention_days=7)
+    sweeper.sweep_once()
+
+    deletes = [sql for sql in pool.conn.statements if sql.startswith('DELETE FROM email_outbox')]
+    assert len(deletes) == 2
+    assert all('ORDER BY next_attempt_at LIMIT 10' in sql for sql in deletes)
+    cutoff = (datetime.utcnow() - timedelta(days=7)).strftime('%Y-%m-%d')
+    assert all(cutoff in sql for sql in deletes)
+    assert sweeper.stats()['outbox_purged'] == 3
+    assert sweeper.stats()['rows_purged'] == 0
+
+
+def test_outbox_retention_zero_keeps_rows(fake_pool):
+    pool = fake_pool(lambda sql: [{'acquired': 1}] if 'GET_LOCK' in sql else [])
+    TokenSweeper(pool, 'donow', outbox_retention_days=0).sweep_once()
+    assert not any('email_outbox' in sql for sql in pool.conn.statements)
@@ -0,0 +1,62 @@
+"""
+已验证 JWT 缓存
+进程内有界 LRU，以 token 摘要为键保存验签后的 claims，到 exp 时淘汰，重复请求免去 HMAC 验签和解析
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> (exp, claims)
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            exp, claims = entry
+            if exp <= time.time():
+                # 已过期，交给 jwt.decode 返回 Token expired
+                del self._entries[key]
+                self._evictions += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return claims
+
+    def put(self, token: str, claims: dict):
+        if self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims['exp'], claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
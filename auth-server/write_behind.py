@@ -0,0 +1,169 @@
+"""
+写后缓冲 (write-behind)
+高频写入先进入内存缓冲，由后台线程按批合并成多行 INSERT，一次提交。
+add() 只入队、不等待，适合没有其他请求会引用的行（如登录后的重新哈希）；
+write() 入队后等待所在批次提交（group commit）：并发请求的行仍然合并写入，但返回前已落库，
+之后任何 worker 上的请求都能查到，删除也不会被稍后的刷新写回
+"""
+
+import os
+import time
+import threading
+
+from db_pool import PoolTimeout, is_connection_error
+
+
+class _Waiter:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class WriteBehindBuffer:
+    def __init__(self, pool, statements, batch_size=500, interval=0.05, max_pending=10000):
+        # statements: {表名: INSERT 语句}，按字典顺序写入（被外键引用的表放在前面）
+        self.pool = pool
+        self.statements = statements
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._rows = {table: [] for table in statements}
+        self._pending = 0
+        self._thread = None
+        self._pid = None
+
+        self._flushed_rows = 0
+        self._batches = 0
+        self._failed_rows = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def add(self, table, row):
+        with self._lock:
+            self._ensure_thread()
+            self._rows[table].append((row, None))
+            self._pending += 1
+            pending = self._pending
+        if pending >= self.max_pending:
+            # 后台写入跟不上时由调用方同步刷新，缓冲不会无限增长
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def write(self, items, timeout=5.0):
+        # items: [(表名, 行), ...]，在同一个事务中提交；写入失败时抛出数据库异常，超时抛出 PoolTimeout
+        waiter = _Waiter()
+        with self._lock:
+            self._ensure_thread()
+            for table, row in items:
+                self._rows[table].append((row, waiter))
+            self._pending += len(items)
+        # 立即唤醒刷新线程：正在刷新时到达的请求自然攒成下一批
+        self._wakeup.set()
+        if not waiter.done.wait(timeout):
+            raise PoolTimeout(f'Write-behind batch not committed within {timeout}s')
+        if waiter.error is not None:
+            raise waiter.error
+
+    def _take(self):
+        with self._lock:
+            rows, self._rows = self._rows, {table: [] for table in self.statements}
+            count, self._pending = self._pending, 0
+        return rows, count
+
+    def _requeue(self, rows):
+        # 只放回没有请求在等待的行；等待中的请求已收到错误，客户端会重试
+        with self._lock:
+            for table, items in rows.items():
+                items = [item for item in items if item[1] is None]
+                self._rows[table][:0] = items
+                self._pending += len(items)
+
+    @staticmethod
+    def _notify(rows, error=None):
+        for items in rows.values():
+            for _, waiter in items:
+                if waiter is not None:
+                    if error is not None and waiter.error is None:
+                        waiter.error = error
+                    waiter.done.set()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            rows, count = self._take()
+            if not count:
+                return 0
+            try:
+                written = self._write(rows)
+            except Exception as e:
+                if is_connection_error(e):
+                    # 数据库暂不可用，不等待结果的行放回等待下次重试
+                    self._requeue(rows)
+                print(f"❌ Write-behind flush failed: {e}")
+                self._notify(rows, e)
+                return 0
+            self._notify(rows)
+            with self._lock:
+                self._flushed_rows += written
+                self._failed_rows += count - written
+                self._batches += 1
+            return written
+
+    def _write(self, rows) -> int:
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    for table, sql in self.statements.items():
+                        if rows[table]:
+                            cursor.executemany(sql, [row for row, _ in rows[table]])
+                conn.commit()
+                return sum(len(items) for items in rows.values())
+            except Exception as e:
+                conn.rollback()
+                if is_connection_error(e):
+                    raise
+                print(f"⚠️ Write-behind batch rejected, retrying row by row: {e}")
+
+            # 批量失败（如个别行违反约束）时逐行写入，跳过坏行，仍然只提交一次
+            written = 0
+            with conn.cursor() as cursor:
+                for table, sql in self.statements.items():
+                    for row, waiter in rows[table]:
+                        try:
+                            cursor.execute(sql, row)
+                            written += 1
+                        except Exception as e:
+                            if is_connection_error(e):
+                                raise
+                            if waiter is not None and waiter.error is None:
+                                waiter.error = e
+                            print(f"❌ Write-behind dropped {table} row: {e}")
+            conn.commit()
+            return written
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._pending:
+                self.flush()
+                if self._pending:
+                    # 刷新失败留下的数据，稍后再试
+                    time.sleep(self.interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': self._pending,
+                'flushed_rows': self._flushed_rows,
+                'failed_rows': self._failed_rows,
+                'batches': self._batches,
+            }